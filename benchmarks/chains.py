@@ -0,0 +1,70 @@
+import hashlib as hasher
+import random
+from typing import List
+
+from src.block import Block
+from src.constants import MAX_NUM_TRANSACTIONS_PER_BLOCK
+from src.transactions import compact_block_data
+from src.utils import create_genesis_block
+
+
+# Number of transactions of the synthetic blockchains used by the benchmarks.
+BLOCKCHAIN_SIZES = {
+    '1k': 1000,
+    '100k': 100000,
+    '1m': 1000000
+}
+
+NUMBER_OF_ACCOUNTS = 1000
+
+
+def make_address(number: int) -> str:
+    return hasher.sha256(f'account-{number}'.encode()).hexdigest()
+
+
+def make_blockchain(number_of_transactions: int, seed: int = 0) -> List[Block]:
+    """
+    Builds a blockchain with (about) `number_of_transactions` transactions, shaped like the ones mined by the nodes:
+    every block has MAX_NUM_TRANSACTIONS_PER_BLOCK transactions between accounts, each one with its mining fee
+    transaction. The first block gives funds to all the accounts.
+
+    Blocks aren't mined (their nonce doesn't match any difficulty level), so it can be built quickly.
+    """
+    rnd = random.Random(seed)
+    addresses = [make_address(number) for number in range(NUMBER_OF_ACCOUNTS)]
+    miner_address = make_address(NUMBER_OF_ACCOUNTS)
+
+    genesis_block = create_genesis_block()
+    timestamp = genesis_block.timestamp
+
+    blockchain = [genesis_block]
+    transactions = [
+        {'from': 'network', 'to': address, 'amount': 100000.0, 'timestamp': timestamp} for address in addresses
+    ]
+
+    number_of_transactions -= len(transactions)
+
+    while True:
+        timestamp += 1
+        blockchain.append(Block(
+            len(blockchain),
+            timestamp,
+            compact_block_data({'nonce': rnd.randrange(2 ** 32), 'difficulty_level': 0, 'transactions': transactions}),
+            blockchain[-1].get_hash()
+        ))
+
+        if number_of_transactions <= 0:
+            return blockchain
+
+        transactions = []
+        for _ in range(MAX_NUM_TRANSACTIONS_PER_BLOCK):
+            from_address, to_address = rnd.sample(addresses, 2)
+
+            transactions.append({
+                'from': from_address, 'to': miner_address, 'amount': 0.01, 'timestamp': timestamp
+            })
+            transactions.append({
+                'from': from_address, 'to': to_address, 'amount': round(rnd.uniform(0.1, 10.0), 2), 'timestamp': timestamp
+            })
+
+        number_of_transactions -= len(transactions)
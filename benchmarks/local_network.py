@@ -0,0 +1,63 @@
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+import requests
+from flask import Flask
+from requests.structures import CaseInsensitiveDict
+
+from src import utils
+from src.peers import PeerClient
+
+
+class LocalPeerClient(PeerClient):
+    """
+    Stand-in for the HTTP client that talks to other nodes: requests are handled by the Flask apps of nodes running
+    in this process (see `node_server.create_app`), so nodes can be benchmarked without starting any server.
+    """
+
+    def __init__(self, apps: Dict[str, Flask], **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.apps = apps
+
+
+    def request(self, method: str, node_url: str, path: str, **kwargs) -> requests.Response:
+        app = self.apps.get(node_url)
+
+        if app is None:
+            raise requests.exceptions.ConnectionError(f'{node_url} is not part of the local network')
+
+        # The host of the URL is sent as the `Host` header, so nodes know which node sent the request.
+        test_response = app.test_client().open(
+            '/' + path.lstrip('/'),
+            method=method,
+            base_url=node_url,
+            query_string={key: value for key, value in (kwargs.get('params') or {}).items() if value is not None},
+            data=kwargs.get('data'),
+            headers=kwargs.get('headers')
+        )
+
+        return make_response(node_url, path, test_response)
+
+
+def make_response(node_url: str, path: str, test_response) -> requests.Response:
+    response = requests.Response()
+    response.url = f'{node_url.rstrip("/")}/{path.lstrip("/")}'
+    response.status_code = test_response.status_code
+    response.headers = CaseInsensitiveDict(test_response.headers)
+    response._content = test_response.get_data()
+
+    return response
+
+
+@contextmanager
+def use_peer_client(peer_client: PeerClient) -> Iterator[PeerClient]:
+    """
+    Makes the nodes of this process talk to other nodes through `peer_client`.
+    """
+    original_peer_client = utils.peer_client
+    utils.peer_client = peer_client
+
+    try:
+        yield peer_client
+    finally:
+        utils.peer_client = original_peer_client
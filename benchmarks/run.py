@@ -0,0 +1,265 @@
+"""
+Benchmarks of the hot paths of a node, with synthetic blockchains of different sizes.
+
+    python -m benchmarks.run --sizes 1k 100k --output benchmark.json
+
+Results are written as JSON (one entry per benchmark and blockchain size), so they can be compared between commits.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from src.block import Block
+from src.codec import encode_blocks, decode_blocks, serialize_block
+from src.constants import PROOF_OF_WORK_TARGET_TIME_IN_SECONDS
+from src.ledger import Ledger
+from src.node_server import create_app
+from src.node_state import NodeState
+from src.utils import (
+    block_stores, proof_of_work, has_account_enough_funds, consensus, unserialize_blockchain,
+    save_blockchain_into_file, load_blockchain_from_file)
+
+from .chains import BLOCKCHAIN_SIZES, NUMBER_OF_ACCOUNTS, make_address, make_blockchain
+from .local_network import LocalPeerClient, use_peer_client
+
+
+RESULTS_FORMAT_VERSION = 1
+
+# Nodes that answer the `consensus` benchmark (all of them run in this process).
+NUMBER_OF_PEERS = 3
+# Blocks the node running `consensus` is missing.
+CONSENSUS_MISSING_BLOCKS = 10
+# Transactions checked by the `has_account_enough_funds` benchmark.
+FUNDS_CHECKS = 100000
+
+
+def measure(fn: Callable[[], None], repeat: int) -> List[float]:
+    times = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    return times
+
+
+def make_result(name: str, size_label: str, blockchain: List[Block], operations: int, times: List[float]) -> Dict:
+    return {
+        'name': name,
+        'blockchain_size': size_label,
+        'blocks': len(blockchain),
+        'transactions': sum(len(block.data['transactions']) for block in blockchain),
+        'operations': operations,
+        'repeat': len(times),
+        'best_seconds': min(times),
+        'mean_seconds': sum(times) / len(times),
+        'operations_per_second': operations / min(times) if min(times) else None
+    }
+
+
+def benchmark_get_hash(blockchain: List[Block], options: argparse.Namespace) -> List[tuple]:
+    def get_hashes():
+        # New blocks every time, as the hash (and the Merkle root) of a block is computed only once.
+        for block in blockchain:
+            Block(block.index, block.timestamp, block.data, block.previous_hash).get_hash()
+
+    return [('block.get_hash', len(blockchain), measure(get_hashes, options.repeat))]
+
+
+def benchmark_proof_of_work(blockchain: List[Block], options: argparse.Namespace) -> List[tuple]:
+    transactions = blockchain[-1].data['transactions']
+
+    def mine():
+        # As it took the target time last time, the difficulty level stays the same.
+        proof_of_work(
+            blockchain, transactions, options.difficulty, PROOF_OF_WORK_TARGET_TIME_IN_SECONDS, options.workers)
+
+    return [('proof_of_work', 1, measure(mine, options.repeat))]
+
+
+def benchmark_funds(blockchain: List[Block], options: argparse.Namespace) -> List[tuple]:
+    ledger = Ledger()
+
+    def sync_ledger():
+        nonlocal ledger
+        ledger = Ledger()
+        ledger.sync(blockchain)
+
+    results = [('ledger.sync', len(blockchain), measure(sync_ledger, options.repeat))]
+
+    transactions = [
+        {'from': make_address(i % NUMBER_OF_ACCOUNTS), 'to': make_address((i + 1) % NUMBER_OF_ACCOUNTS),
+         'amount': 1.0, 'transaction_fee': 0.01}
+        for i in range(FUNDS_CHECKS)
+    ]
+
+    def check_funds():
+        for transaction in transactions:
+            has_account_enough_funds(ledger, transaction)
+
+    results.append(('has_account_enough_funds', len(transactions), measure(check_funds, options.repeat)))
+
+    return results
+
+
+def benchmark_consensus(blockchain: List[Block], options: argparse.Namespace) -> List[tuple]:
+    save_blockchain_into_file(blockchain, 'peer')
+    node_state = NodeState('peer', 'http://peer-0', [])
+
+    # All the peers share the same node, so they vote for the same tip.
+    app = create_app(node_state)
+    apps = {f'http://peer-{i}': app for i in range(NUMBER_OF_PEERS)}
+    node_state.network_nodes_urls = list(apps)
+
+    local_blockchain = blockchain[:-CONSENSUS_MISSING_BLOCKS]
+
+    def reach_consensus():
+        if consensus(list(apps), local_blockchain)[-1].get_hash() != blockchain[-1].get_hash():
+            raise Exception('Consensus chose a different blockchain.')
+
+    with use_peer_client(LocalPeerClient(apps)):
+        return [('consensus', 1, measure(reach_consensus, options.repeat))]
+
+
+def benchmark_serialization(blockchain: List[Block], options: argparse.Namespace) -> List[tuple]:
+    serialized_blockchain = json.dumps([serialize_block(block) for block in blockchain])
+    encoded_blockchain = encode_blocks(blockchain)
+
+    return [
+        ('serialize_block', len(blockchain),
+         measure(lambda: json.dumps([serialize_block(block) for block in blockchain]), options.repeat)),
+        ('unserialize_blockchain', len(blockchain),
+         measure(lambda: unserialize_blockchain(json.loads(serialized_blockchain)), options.repeat)),
+        ('codec.encode_blocks', len(blockchain), measure(lambda: encode_blocks(blockchain), options.repeat)),
+        ('codec.decode_blocks', len(blockchain), measure(lambda: decode_blocks(encoded_blockchain), options.repeat)),
+    ]
+
+
+def benchmark_storage(blockchain: List[Block], options: argparse.Namespace) -> List[tuple]:
+    saved = []
+
+    def save():
+        # Every time in a new store, so all the blocks are written.
+        miner_account_address = f'storage-{len(saved)}'
+        save_blockchain_into_file(blockchain, miner_account_address)
+        saved.append(miner_account_address)
+
+    results = [('save_blockchain_into_file', len(blockchain), measure(save, options.repeat))]
+
+    def load():
+        if len(load_blockchain_from_file(saved[0])) != len(blockchain):
+            raise Exception('The blockchain wasn\'t loaded completely.')
+
+    results.append(('load_blockchain_from_file', len(blockchain), measure(load, options.repeat)))
+
+    return results
+
+
+BENCHMARKS = {
+    'get_hash': benchmark_get_hash,
+    'proof_of_work': benchmark_proof_of_work,
+    'funds': benchmark_funds,
+    'consensus': benchmark_consensus,
+    'serialization': benchmark_serialization,
+    'storage': benchmark_storage
+}
+
+
+def run_benchmarks(options: argparse.Namespace) -> Dict:
+    results = []
+
+    for size_label in options.sizes:
+        blockchain = make_blockchain(BLOCKCHAIN_SIZES[size_label])
+
+        for benchmark_name in options.benchmarks:
+            print(f'Running "{benchmark_name}" with {size_label} transactions...', file=sys.stderr)
+
+            # Nodes write their files in the current directory, so every benchmark gets its own one.
+            with tempfile.TemporaryDirectory() as directory, working_directory(directory), \
+                    contextlib.redirect_stdout(io.StringIO()):
+                try:
+                    measurements = BENCHMARKS[benchmark_name](blockchain, options)
+                finally:
+                    close_block_stores()
+
+            for name, operations, times in measurements:
+                results.append(make_result(name, size_label, blockchain, operations, times))
+
+    return {
+        'version': RESULTS_FORMAT_VERSION,
+        'commit': get_commit(),
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'options': {
+            'repeat': options.repeat,
+            'difficulty': options.difficulty,
+            'workers': options.workers
+        },
+        'results': results
+    }
+
+
+@contextlib.contextmanager
+def working_directory(directory: str):
+    previous_directory = os.getcwd()
+    os.chdir(directory)
+
+    try:
+        yield
+    finally:
+        os.chdir(previous_directory)
+
+
+def close_block_stores() -> None:
+    for block_store in block_stores.values():
+        block_store.close()
+
+    block_stores.clear()
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_options(args: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmarks of the hot paths of a node.')
+    parser.add_argument('--sizes', nargs='+', choices=list(BLOCKCHAIN_SIZES), default=list(BLOCKCHAIN_SIZES),
+                        help='sizes (in transactions) of the synthetic blockchains')
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=3, help='times every benchmark is run')
+    parser.add_argument('--difficulty', type=int, default=4, help='difficulty level of the Proof of Work')
+    parser.add_argument('--workers', type=int, default=1, help='processes used by the Proof of Work')
+    parser.add_argument('--output', default='-', help='file where the results are written (by default, stdout)')
+
+    return parser.parse_args(args)
+
+
+def main(args: List[str] = None) -> None:
+    options = parse_options(args)
+    results = json.dumps(run_benchmarks(options), indent=2)
+
+    if options.output == '-':
+        print(results)
+    else:
+        with open(options.output, 'w') as f:
+            f.write(results)
+
+
+if __name__ == '__main__':
+    main()
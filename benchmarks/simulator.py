@@ -0,0 +1,564 @@
+"""
+Simulates a network of N nodes inside a single process, to measure its throughput and how long it takes to agree
+on a blockchain, without starting any container:
+
+    python -m benchmarks.simulator --nodes 50 --duration 1800 --tps 0.5 --latency 0.1 --loss 0.01
+
+Every node is a real `NodeState` with its `node_server` app, and it mines with the real `mine()`. Instead of the
+network, nodes talk to each other through an in-memory transport that adds latency, loses requests and can split
+the nodes in partitions. Miners run on a virtual clock, so an hour of the network takes as long as the work the nodes
+actually do (mostly, the Proof of Work).
+"""
+import argparse
+import contextlib
+import hashlib as hasher
+import heapq
+import itertools
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+from flask import Flask
+
+from src import node_miner, utils
+from src.block import Block
+from src.constants import MINER_MAX_WAIT_IN_SECONDS, MINER_MAX_START_DELAY_IN_SECONDS
+from src.mining import MiningCancelled
+from src.node_server import create_app
+from src.node_state import NodeState
+from src.utils import get_transaction_id
+
+from .chains import make_address
+from .local_network import LocalPeerClient, use_peer_client
+from .run import working_directory, close_block_stores
+
+
+# Simulated seconds between checks of whether a Proof of Work was cancelled. The real one checks every few
+# milliseconds, but that would make the clock wake up the miners too often.
+VIRTUAL_CANCEL_CHECK_INTERVAL = 0.1
+
+
+class VirtualClock:
+    """
+    Time of the simulation. It only moves forward when all the threads of the simulation are sleeping (on this
+    clock), and then it jumps straight to the first one that has to wake up.
+
+    Threads must be started with `run_in_parallel`, so the clock knows when all of them are waiting. The thread
+    that creates the clock is taken as one of them.
+    """
+
+    def __init__(self) -> None:
+        self._time = 0.0
+        self._condition = threading.Condition()
+        # (wake up time, order, [woken up]) of the sleeping threads
+        self._timers = []
+        self._counter = itertools.count()
+        # Threads that aren't sleeping
+        self._active = 1
+
+
+    def time(self) -> float:
+        return self._time
+
+
+    def sleep(self, seconds: float) -> None:
+        with self._condition:
+            woken_up = [False]
+            heapq.heappush(self._timers, (self._time + max(seconds, 0.0), next(self._counter), woken_up))
+
+            self._active -= 1
+            self._advance()
+
+            self._condition.wait_for(lambda: woken_up[0])
+
+
+    def run_in_parallel(self, functions: List[Callable[[], Any]]) -> List[Tuple[Any, Optional[Exception]]]:
+        """
+        Runs every function in its own thread and waits until all of them are finished.
+
+        :return: (result, error) for every function, in the same order
+        """
+        if not functions:
+            return []
+
+        results = [(None, None)] * len(functions)
+        pending = [len(functions)]
+        finished = [False]
+
+        def run(idx: int, fn: Callable[[], Any]) -> None:
+            try:
+                results[idx] = (fn(), None)
+            except Exception as e:
+                results[idx] = (None, e)
+            finally:
+                with self._condition:
+                    pending[0] -= 1
+
+                    if pending[0]:
+                        self._active -= 1
+                        self._advance()
+                    else:
+                        # The thread that was waiting takes the place of the last one.
+                        finished[0] = True
+                        self._condition.notify_all()
+
+        with self._condition:
+            # The new threads are running, while this one waits.
+            self._active += len(functions) - 1
+
+            for idx, fn in enumerate(functions):
+                threading.Thread(target=run, args=(idx, fn), daemon=True).start()
+
+            self._condition.wait_for(lambda: finished[0])
+
+        return results
+
+
+    def _advance(self) -> None:
+        if self._active or not self._timers:
+            return
+
+        self._time = max(self._time, self._timers[0][0])
+
+        while self._timers and self._timers[0][0] <= self._time:
+            _, _, woken_up = heapq.heappop(self._timers)
+            woken_up[0] = True
+            self._active += 1
+
+        self._condition.notify_all()
+
+
+class SimulatedTransport(LocalPeerClient):
+    """
+    Delivers the requests between the nodes of the simulation, as a network would: every request takes `latency`
+    (plus up to `jitter`) seconds to get to the node and as long to come back, some of them are lost, and nodes in
+    different partitions cannot talk to each other. A lost request takes the connection timeout to fail.
+    """
+
+    def __init__(
+            self,
+            apps: Dict[str, Flask],
+            clock: VirtualClock,
+            latency: float = 0.05,
+            jitter: float = 0.0,
+            loss: float = 0.0,
+            seed: int = 0) -> None:
+        super().__init__(apps)
+        self.clock = clock
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.random = random.Random(seed)
+        # Groups of nodes that can talk to each other (None if all of them can)
+        self.partitions: Optional[List[set]] = None
+
+        self.stats = {'requests': 0, 'lost': 0, 'partitioned': 0}
+        self._stats_lock = threading.Lock()
+        # The node that sends the requests from the current thread (None for clients outside the network).
+        self._sender = threading.local()
+
+
+    def set_sender(self, node_url: Optional[str]) -> None:
+        self._sender.node_url = node_url
+
+
+    def get_sender(self) -> Optional[str]:
+        return getattr(self._sender, 'node_url', None)
+
+
+    def can_reach(self, sender: Optional[str], node_url: str) -> bool:
+        if self.partitions is None or sender is None:
+            return True
+
+        return any(sender in partition and node_url in partition for partition in self.partitions)
+
+
+    def request(self, method: str, node_url: str, path: str, **kwargs) -> requests.Response:
+        sender = self.get_sender()
+
+        if not self.can_reach(sender, node_url):
+            self.count('partitioned')
+            self.clock.sleep(self.timeout[0])
+            raise requests.exceptions.ConnectionError(f'{node_url} is in another partition')
+
+        if self.random.random() < self.loss:
+            self.count('lost')
+            self.clock.sleep(self.timeout[0])
+            raise requests.exceptions.ConnectionError(f'The request to {node_url} was lost')
+
+        self.count('requests')
+
+        self.clock.sleep(self.get_delay())
+        response = super().request(method, node_url, path, **kwargs)
+        self.clock.sleep(self.get_delay())
+
+        return response
+
+
+    def fan_out(
+            self,
+            network_nodes_urls: List[str],
+            fn: Callable[[str], Any],
+            round_timeout: Optional[float] = None) -> List[Tuple[str, Any, Optional[Exception]]]:
+        # Requests time out as lost ones, so rounds don't need their own timeout here.
+        sender = self.get_sender()
+
+        def call(node_url: str) -> Any:
+            self.set_sender(sender)
+            return fn(node_url)
+
+        results = self.clock.run_in_parallel([partial(call, node_url) for node_url in network_nodes_urls])
+
+        return [(node_url, result, error) for node_url, (result, error) in zip(network_nodes_urls, results)]
+
+
+    def get_delay(self) -> float:
+        return self.latency + self.random.uniform(0.0, self.jitter)
+
+
+    def count(self, stat: str) -> None:
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+
+@contextlib.contextmanager
+def use_virtual_proof_of_work(
+        clock: VirtualClock,
+        hash_rate: float,
+        mined_blocks: List[Block],
+        cancelled_mining_times: List[float],
+        seed: int = None):
+    """
+    Makes miners take as long (on the virtual clock) as `hash_rate` hashes per second would take to find a nonce.
+    The number of nonces they try is drawn at random (as many as it would take on average for the difficulty level),
+    and then the nonce is searched for real, by a single worker, so the blocks are valid.
+
+    If the Proof of Work is cancelled in the meantime (see `mining.find_nonce`), it stops within
+    `VIRTUAL_CANCEL_CHECK_INTERVAL` seconds (without searching the nonce), and the time it took is added to
+    `cancelled_mining_times`.
+    """
+    original_proof_of_work = utils.proof_of_work
+    random_generator = random.Random(seed)
+
+    def proof_of_work(
+            blockchain: List[Block],
+            transactions: List[Dict],
+            difficulty_level_for_last_time: int,
+            how_long_it_took_last_time: int,
+            number_of_workers: int = None,
+            cancelled: threading.Event = None) -> (Block, int, float):
+        current_difficulty_level = utils.get_difficulty_level(
+            difficulty_level_for_last_time, how_long_it_took_last_time)
+
+        # Every nonce is a solution with a probability of 16^-difficulty (the hash is in hex), so the nonces tried
+        # until the first solution follow a geometric distribution.
+        probability = 16 ** -current_difficulty_level
+        attempts = 1 + int(math.log(1.0 - random_generator.random()) / math.log(1.0 - probability))
+        mining_time = attempts / hash_rate
+
+        elapsed_time = 0.0
+        while elapsed_time < mining_time and not (cancelled and cancelled.is_set()):
+            step = min(VIRTUAL_CANCEL_CHECK_INTERVAL, mining_time - elapsed_time)
+            clock.sleep(step)
+            elapsed_time += step
+
+        if cancelled and cancelled.is_set():
+            cancelled_mining_times.append(elapsed_time)
+            raise MiningCancelled(f'The Proof of Work was cancelled after {elapsed_time:.1f} simulated seconds.')
+
+        mined_block = utils.create_mined_block(blockchain, transactions, current_difficulty_level, 1)
+        mined_blocks.append(mined_block)
+
+        return mined_block, current_difficulty_level, mining_time
+
+    utils.proof_of_work = proof_of_work
+
+    try:
+        yield
+    finally:
+        utils.proof_of_work = original_proof_of_work
+
+
+class Simulation:
+    def __init__(self, options: argparse.Namespace) -> None:
+        self.options = options
+        self.random = random.Random(options.seed)
+        self.clock = VirtualClock()
+
+        self.nodes_urls = [f'http://node-{i}' for i in range(options.nodes)]
+
+        self.nodes: Dict[str, NodeState] = {}
+        for node_url in self.nodes_urls:
+            miner_account_address = hasher.sha256(node_url.encode()).hexdigest()
+            self.nodes[node_url] = NodeState(miner_account_address, node_url, list(self.nodes_urls))
+
+        self.apps = {node_url: create_app(node_state) for node_url, node_state in self.nodes.items()}
+        self.transport = SimulatedTransport(
+            self.apps, self.clock, options.latency, options.jitter, options.loss, options.seed)
+        # Clients (e.g., wallets) aren't part of the simulated network, so their requests arrive right away.
+        self.client = LocalPeerClient(self.apps)
+
+        self.mined_blocks = []
+        # Simulated seconds spent on every Proof of Work that was cancelled (because another block arrived first).
+        self.cancelled_mining_times = []
+        # Virtual time when every transaction was submitted, and when it was confirmed (see `sample`).
+        self.submitted_at: Dict[str, float] = {}
+        self.confirmed_at: Dict[str, float] = {}
+        self.confirmed_blocks = set()
+        # Virtual time since when the nodes don't agree on the tip (None if they agree).
+        self.diverged_at: Optional[float] = None
+        self.convergence_times = []
+        self.samples = 0
+        self.samples_in_agreement = 0
+
+
+    def run(self) -> Dict:
+        tasks = [partial(self.run_miner, node_url) for node_url in self.nodes_urls]
+        tasks += [self.submit_transactions, self.monitor]
+
+        if self.options.partition:
+            tasks.append(self.split_network)
+
+        with use_peer_client(self.transport), \
+                use_virtual_proof_of_work(
+                    self.clock, self.options.hash_rate, self.mined_blocks, self.cancelled_mining_times,
+                    self.options.seed):
+            for _, error in self.clock.run_in_parallel(tasks):
+                if error:
+                    raise error
+
+        return self.get_report()
+
+
+    def run_miner(self, node_url: str) -> None:
+        self.transport.set_sender(node_url)
+
+        if self.options.miner == 'schedule':
+            self.run_scheduled_miner(node_url)
+        else:
+            self.run_event_driven_miner(node_url)
+
+
+    def run_event_driven_miner(self, node_url: str) -> None:
+        # Like `node_miner.run_miner`, but the miner checks whether it should mine every `poll_interval` simulated
+        # seconds, instead of being woken up by the node.
+        trigger = node_miner.MiningTrigger(max_wait=self.options.max_wait)
+
+        while True:
+            self.clock.sleep(self.options.poll_interval)
+
+            if self.clock.time() >= self.options.duration:
+                return
+
+            if trigger.get_reason_to_mine(self.nodes[node_url], self.clock.time()):
+                self.clock.sleep(self.random.uniform(0, MINER_MAX_START_DELAY_IN_SECONDS))
+                node_miner.mine_and_report_errors(self.nodes[node_url])
+
+
+    def run_scheduled_miner(self, node_url: str) -> None:
+        # How nodes used to mine: a round every 50-70 seconds, whether there is anything to mine or not.
+        interval = self.options.mining_interval or self.random.randint(50, 70)
+
+        while True:
+            self.clock.sleep(interval)
+
+            if self.clock.time() >= self.options.duration:
+                return
+
+            node_miner.mine_and_report_errors(self.nodes[node_url])
+
+
+    def submit_transactions(self) -> None:
+        if not self.options.tps:
+            return
+
+        while True:
+            self.clock.sleep(self.random.expovariate(self.options.tps))
+
+            if self.clock.time() >= self.options.duration:
+                return
+
+            transaction = {
+                'from': 'network',
+                'to': make_address(self.random.randrange(1000)),
+                'amount': 1.0,
+                'transaction_fee': round(self.random.uniform(0.01, 1.0), 2)
+            }
+            r = self.client.post(self.random.choice(self.nodes_urls), 'transaction', data=json.dumps(transaction))
+
+            if r.status_code == 201:
+                transaction_id = r.content.decode().split(': ')[-1]
+                self.submitted_at[transaction_id] = self.clock.time()
+
+
+    def monitor(self) -> None:
+        while self.clock.time() < self.options.duration:
+            self.clock.sleep(self.options.sample_interval)
+            self.sample()
+
+
+    def sample(self) -> None:
+        """
+        Looks at the tip of every node. The blocks of a tip that most of the nodes have are confirmed, and the
+        nodes converged when all of them have the same tip.
+        """
+        now = self.clock.time()
+        blockchains = [node_state.get_blockchain() for node_state in self.nodes.values()]
+        tips = [blockchain[-1].get_hash() for blockchain in blockchains]
+
+        votes = {}
+        for tip in tips:
+            votes[tip] = votes.get(tip, 0) + 1
+
+        tip_with_the_most_votes = max(votes, key=votes.get)
+
+        if votes[tip_with_the_most_votes] * 2 > len(tips):
+            blockchain = blockchains[tips.index(tip_with_the_most_votes)]
+
+            # We go back until the first block that was already confirmed.
+            height = len(blockchain)
+            while height > 0 and blockchain[height - 1].get_hash() not in self.confirmed_blocks:
+                height -= 1
+                block = blockchain[height]
+                self.confirmed_blocks.add(block.get_hash())
+
+                for transaction in block.data['transactions']:
+                    transaction_id = get_transaction_id(transaction)
+                    if transaction_id in self.submitted_at and transaction_id not in self.confirmed_at:
+                        self.confirmed_at[transaction_id] = now
+
+        self.samples += 1
+
+        if len(votes) == 1:
+            self.samples_in_agreement += 1
+
+            if self.diverged_at is not None:
+                self.convergence_times.append(now - self.diverged_at)
+                self.diverged_at = None
+
+        elif self.diverged_at is None:
+            self.diverged_at = now
+
+
+    def split_network(self) -> None:
+        start, end = self.options.partition
+        self.clock.sleep(start)
+
+        number_of_partitions = self.options.partition_groups
+        self.transport.partitions = [
+            set(self.nodes_urls[i::number_of_partitions]) for i in range(number_of_partitions)]
+
+        self.clock.sleep(end - start)
+        self.transport.partitions = None
+
+
+    def get_report(self) -> Dict:
+        # The mining rounds that were running when the time was up still finish (and their blocks can still get
+        # confirmed), so the network ran for longer than `options.duration`.
+        simulated_seconds = self.clock.time()
+        tips = [node_state.get_blockchain()[-1].get_hash() for node_state in self.nodes.values()]
+        confirmation_times = [self.confirmed_at[tx_id] - self.submitted_at[tx_id] for tx_id in self.confirmed_at]
+
+        blockchain = max((node_state.get_blockchain() for node_state in self.nodes.values()),
+                         key=lambda b: tips.count(b[-1].get_hash()))
+        blocks_hashes = {block.get_hash() for block in blockchain}
+
+        return {
+            'options': vars(self.options),
+            'simulated_seconds': simulated_seconds,
+            'transactions': {
+                'submitted': len(self.submitted_at),
+                'confirmed': len(self.confirmed_at),
+                'confirmed_per_second': len(self.confirmed_at) / simulated_seconds if simulated_seconds else 0,
+                'time_to_confirmation': summarize(confirmation_times)
+            },
+            'blocks': {
+                'height': len(blockchain),
+                'mined': len(self.mined_blocks),
+                'orphaned': sum(1 for block in self.mined_blocks if block.get_hash() not in blocks_hashes),
+                'cancelled': len(self.cancelled_mining_times),
+                'seconds_of_cancelled_work': sum(self.cancelled_mining_times)
+            },
+            'convergence': {
+                'converged': len(set(tips)) == 1,
+                'different_tips': len(set(tips)),
+                'time_in_agreement': self.samples_in_agreement / self.samples if self.samples else None,
+                'time_to_converge': summarize(self.convergence_times)
+            },
+            'network': dict(self.transport.stats)
+        }
+
+
+def summarize(values: List[float]) -> Optional[Dict]:
+    if not values:
+        return None
+
+    values = sorted(values)
+
+    return {
+        'median': statistics.median(values),
+        'p90': values[int(0.9 * (len(values) - 1))],
+        'max': values[-1]
+    }
+
+
+def parse_options(args: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Simulates a network of nodes in a single process.')
+    parser.add_argument('--nodes', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=600, help='simulated seconds')
+    parser.add_argument('--tps', type=float, default=0.1, help='transactions submitted per simulated second')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds a request takes to get to a node')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra latency (random, up to this number)')
+    parser.add_argument('--loss', type=float, default=0.0, help='fraction of the requests that are lost')
+    parser.add_argument('--partition', type=float, nargs=2, metavar=('START', 'END'),
+                        help='simulated seconds between which the network is split')
+    parser.add_argument('--partition-groups', type=int, default=2, help='number of partitions')
+    parser.add_argument('--hash-rate', type=float, default=3000, help='hashes per simulated second of every miner')
+    parser.add_argument('--miner', choices=['event', 'schedule'], default='event',
+                        help='mine when there is something to mine (like the nodes), or every few seconds')
+    parser.add_argument('--max-wait', type=float, default=MINER_MAX_WAIT_IN_SECONDS,
+                        help='seconds pending transactions wait at most for a round (event miner)')
+    parser.add_argument('--poll-interval', type=float, default=0.5,
+                        help='seconds between checks of whether there is something to mine (event miner)')
+    parser.add_argument('--mining-interval', type=float, default=None,
+                        help='seconds between mining rounds (schedule miner, by default 50-70)')
+    parser.add_argument('--sample-interval', type=float, default=1.0,
+                        help='seconds between checks of the tips of the nodes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help='show the logs of the nodes')
+    parser.add_argument('--output', default='-', help='file where the report is written (by default, stdout)')
+
+    return parser.parse_args(args)
+
+
+def main(args: List[str] = None) -> None:
+    options = parse_options(args)
+
+    # Nodes write their files in the current directory.
+    with tempfile.TemporaryDirectory() as directory, working_directory(directory), \
+            open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(sys.stdout if options.verbose else devnull):
+        try:
+            report = Simulation(options).run()
+        finally:
+            close_block_stores()
+
+    report = json.dumps(report, indent=2)
+
+    if options.output == '-':
+        print(report)
+    else:
+        with open(options.output, 'w') as f:
+            f.write(report)
+
+
+if __name__ == '__main__':
+    main()
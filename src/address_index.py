@@ -0,0 +1,267 @@
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from .block import Block
+from .constants import LEDGER_MAX_ROLLBACK_DEPTH, ADDRESS_INDEX_CHECKPOINT_INTERVAL_IN_BLOCKS
+from .ledger import get_fork_height
+from .utils import get_transaction_id
+
+
+class AddressIndex:
+    """
+    Where (height of the block and position inside it) every account appears in a transaction, so the transactions
+    of an account can be found without going through the whole blockchain. Transactions can also be found by ID.
+
+    Like the ledger, it is updated block by block and it remembers the accounts of the last `max_rollback_depth`
+    blocks, so it can undo them when the network switches to a different blockchain.
+
+    Rewriting the whole index whenever a block is added would take longer and longer, so every change (a block added
+    or a rollback) is also kept in a journal, numbered. The journal is taken with `take_changes` and appended to a log,
+    and loading the index means loading the last checkpoint (the whole index) and applying the changes made after it.
+    """
+
+    def __init__(
+            self,
+            height: int = 0,
+            locations: Dict[str, array] = None,
+            transaction_locations: Dict[bytes, Tuple[int, int]] = None,
+            recent_blocks: List[Dict] = None,
+            max_rollback_depth: int = LEDGER_MAX_ROLLBACK_DEPTH,
+            change_number: int = 0,
+            checkpoint_interval: int = ADDRESS_INDEX_CHECKPOINT_INTERVAL_IN_BLOCKS) -> None:
+        self.height = height
+        # Height and position of every transaction, one after the other: [height, position, height, position...]
+        self.locations = locations or {}
+        # Height and position of every transaction, by transaction ID (as bytes, which take less memory).
+        self.transaction_locations = transaction_locations or {}
+        # One entry per recent block: {'hash': <block hash>, 'addresses': <accounts of its transactions>,
+        # 'transaction_ids': <IDs of its transactions>}
+        self.recent_blocks = recent_blocks or []
+        self.max_rollback_depth = max_rollback_depth
+
+        # Number of the last change (they are numbered one after the other, so they can be applied in order).
+        self.change_number = change_number
+        self.checkpoint_interval = checkpoint_interval
+        # Whether the whole index must be saved again (e.g., because it was rebuilt from scratch, or too many changes
+        # were logged since it was saved). Changes aren't journaled meanwhile, as the checkpoint will include them.
+        self.needs_checkpoint = False
+        self._changes = []
+        self._changes_since_checkpoint = 0
+
+
+    def count_transactions(self, account_address: str) -> int:
+        return len(self.locations.get(account_address, ())) // 2
+
+
+    def get_locations(self, account_address: str, offset: int = 0, limit: int = None) -> List[Tuple[int, int]]:
+        """
+        :return: (height of the block, position in the block) of the transactions of the account, oldest first
+        """
+        locations = self.locations.get(account_address, array('Q'))
+        stop = len(locations) if limit is None else min(len(locations), 2 * (offset + limit))
+
+        return [(locations[i], locations[i + 1]) for i in range(2 * offset, stop, 2)]
+
+
+    def get_transaction_location(self, transaction_id: str) -> Optional[Tuple[int, int]]:
+        """
+        :return: (height of the block, position in the block) of the transaction, or None if it isn't in any block
+        """
+        try:
+            return self.transaction_locations.get(bytes.fromhex(transaction_id))
+        except ValueError:
+            return None
+
+
+    def add_block(self, block: Block) -> None:
+        self._add(block.get_hash(), [
+            (bytes.fromhex(get_transaction_id(tx)), tx['from'], tx['to']) for tx in block.data['transactions']
+        ])
+
+
+    def rollback_to(self, height: int) -> None:
+        if self.height - height > len(self.recent_blocks):
+            raise Exception(f'The address index cannot be rolled back more than {len(self.recent_blocks)} blocks.')
+
+        if height < self.height:
+            self._record_change({'rollback': height})
+
+        while self.height > height:
+            recent_block = self.recent_blocks.pop()
+            self.height -= 1
+
+            for account_address in recent_block['addresses']:
+                locations = self.locations[account_address]
+                del locations[-2:]
+
+                if not locations:
+                    del self.locations[account_address]
+
+            for transaction_id in recent_block['transaction_ids']:
+                del self.transaction_locations[transaction_id]
+
+
+    def sync(self, blockchain: List[Block]) -> bool:
+        """
+        Updates the index so it matches the given blockchain.
+
+        :return: whether the index changed
+        """
+        fork_height = get_fork_height(self.height, self.recent_blocks, blockchain)
+
+        if fork_height == self.height == len(blockchain):
+            return False
+
+        if fork_height is None:
+            # The fork is too old to undo it, so we start from scratch.
+            self.height, self.locations, self.transaction_locations, self.recent_blocks = 0, {}, {}, []
+            fork_height = 0
+
+        if fork_height == 0:
+            # Saving the whole index is cheaper than logging every block of the blockchain.
+            self.needs_checkpoint = True
+
+        self.rollback_to(fork_height)
+
+        for block in blockchain[fork_height:]:
+            self.add_block(block)
+
+        return True
+
+
+    def take_changes(self) -> (bool, List[Dict]):
+        """
+        Takes the changes journaled since the last call, so they can be saved.
+
+        :return: whether the whole index must be saved instead (then no changes are returned), and the changes
+        """
+        if self.needs_checkpoint:
+            self.needs_checkpoint, self._changes, self._changes_since_checkpoint = False, [], 0
+
+            return True, []
+
+        changes, self._changes = self._changes, []
+
+        return False, changes
+
+
+    def apply_changes(self, changes: List[Dict]) -> None:
+        """
+        Applies the changes taken from another index (e.g., the changes saved after the checkpoint this index was
+        loaded from). The ones this index already has are skipped, and we stop at the first one that is missing.
+        """
+        for change in changes:
+            if change['seq'] <= self.change_number:
+                continue
+
+            if change['seq'] != self.change_number + 1:
+                self.needs_checkpoint = True
+                break
+
+            if 'rollback' in change:
+                self.rollback_to(change['rollback'])
+            else:
+                self._add(change['hash'], [
+                    (bytes.fromhex(transaction_id), sender, recipient)
+                    for transaction_id, sender, recipient in change['transactions']
+                ])
+
+        # They were already saved.
+        self._changes = []
+
+
+    def copy(self) -> 'AddressIndex':
+        # The entries of the recent blocks are never modified once added, so they can be shared.
+        return AddressIndex(
+            self.height,
+            {account_address: array('Q', locations) for account_address, locations in self.locations.items()},
+            dict(self.transaction_locations),
+            list(self.recent_blocks),
+            self.max_rollback_depth,
+            self.change_number,
+            self.checkpoint_interval
+        )
+
+
+    def to_dict(self) -> Dict:
+        return {
+            'height': self.height,
+            'change_number': self.change_number,
+            'locations': {account_address: locations.tolist() for account_address, locations in self.locations.items()},
+            'transaction_locations': {
+                transaction_id.hex(): location for transaction_id, location in self.transaction_locations.items()
+            },
+            'recent_blocks': [
+                dict(recent_block, transaction_ids=[tx_id.hex() for tx_id in recent_block['transaction_ids']])
+                for recent_block in self.recent_blocks
+            ]
+        }
+
+
+    @classmethod
+    def from_dict(cls, serialized_index: Dict) -> 'AddressIndex':
+        return cls(
+            serialized_index['height'],
+            {
+                account_address: array('Q', locations)
+                for account_address, locations in serialized_index['locations'].items()
+            },
+            {
+                bytes.fromhex(transaction_id): tuple(location)
+                for transaction_id, location in serialized_index['transaction_locations'].items()
+            },
+            [
+                dict(recent_block, transaction_ids=[bytes.fromhex(tx_id) for tx_id in recent_block['transaction_ids']])
+                for recent_block in serialized_index['recent_blocks']
+            ],
+            change_number=serialized_index.get('change_number', 0)
+        )
+
+
+    def _add(self, block_hash: str, transactions: List[Tuple[bytes, str, str]]) -> None:
+        """
+        :param transactions: (ID, sender, recipient) of every transaction of the block
+        """
+        height = self.height
+        addresses = []
+        transaction_ids = []
+
+        for position, (transaction_id, sender, recipient) in enumerate(transactions):
+            # If the same transaction is in the blockchain twice, the first one is kept.
+            if transaction_id not in self.transaction_locations:
+                self.transaction_locations[transaction_id] = (height, position)
+                transaction_ids.append(transaction_id)
+
+            for account_address in {sender, recipient}:
+                if account_address not in self.locations:
+                    self.locations[account_address] = array('Q')
+
+                self.locations[account_address].extend((height, position))
+                addresses.append(account_address)
+
+        self.height += 1
+        self.recent_blocks.append({'hash': block_hash, 'addresses': addresses, 'transaction_ids': transaction_ids})
+
+        if len(self.recent_blocks) > self.max_rollback_depth:
+            self.recent_blocks.pop(0)
+
+        self._record_change({
+            'height': height,
+            'hash': block_hash,
+            'transactions': [
+                [transaction_id.hex(), sender, recipient] for transaction_id, sender, recipient in transactions
+            ]
+        })
+
+
+    def _record_change(self, change: Dict) -> None:
+        self.change_number += 1
+        self._changes_since_checkpoint += 1
+
+        if self._changes_since_checkpoint >= self.checkpoint_interval:
+            self.needs_checkpoint = True
+
+        if self.needs_checkpoint:
+            self._changes = []
+        else:
+            self._changes.append(dict(change, seq=self.change_number))
@@ -1,28 +1,91 @@
 import hashlib as hasher
-from typing import Dict
+import struct
+from typing import Dict, Optional
+
+from .merkle import get_merkle_root
+
+
+GENESIS_PREVIOUS_HASH = '0' * 64
+
+# Index, timestamp, difficulty level, previous hash and Merkle root of the transactions. The nonce goes right after them.
+HEADER_PREFIX_FORMAT = struct.Struct('>QdB32s32s')
+NONCE_FORMAT = struct.Struct('>Q')
 
 
 class Block:
-    def __init__(self, index: int, timestamp: float, data: Dict, previous_block = None) -> None:
+    # Without a `__dict__` per block, long blockchains take much less memory.
+    __slots__ = ('index', 'timestamp', 'data', 'previous_hash', '_hash', '_merkle_root')
+
+    def __init__(self, index: int, timestamp: float, data: Dict, previous_hash: str = GENESIS_PREVIOUS_HASH) -> None:
         self.index = index
         self.timestamp = timestamp
         self.data = data
-        self.previous_block = previous_block
+        # We store the parent's hash instead of a reference to the parent block, so hashing a block
+        # never needs to walk back through the rest of the chain.
+        self.previous_hash = previous_hash or GENESIS_PREVIOUS_HASH
+
+        self._hash: Optional[str] = None
+        self._merkle_root: Optional[bytes] = None
 
 
     @property
-    def previous_hash(self):
-        return self.previous_block.get_hash() if self.previous_block else '0' * 64
+    def merkle_root(self) -> bytes:
+        if self._merkle_root is None:
+            self._merkle_root = get_merkle_root(self.data['transactions'])
 
+        return self._merkle_root
 
-    def get_hash(self) -> str:
-        sha = hasher.sha256()
-        sha.update(
-            (
-                str(self.index) +
-                str(self.timestamp) +
-                str(self.data) +
-                str(self.previous_hash)
-            ).encode()
+
+    @property
+    def difficulty_level(self) -> int:
+        # The genesis block isn't mined, so it doesn't have a difficulty level.
+        return self.data.get('difficulty_level', 0)
+
+
+    @property
+    def work(self) -> int:
+        """
+        Number of hashes that, on average, are needed to mine the block.
+        """
+        return 16 ** self.difficulty_level
+
+
+    def get_header_prefix(self) -> bytes:
+        """
+        Everything in the header except the nonce. It doesn't change while mining, so it can be hashed
+        once and reused for every nonce.
+        """
+        return HEADER_PREFIX_FORMAT.pack(
+            self.index,
+            float(self.timestamp),
+            self.difficulty_level,
+            bytes.fromhex(self.previous_hash),
+            self.merkle_root
         )
-        return sha.hexdigest()
+
+
+    def get_header(self) -> bytes:
+        return self.get_header_prefix() + NONCE_FORMAT.pack(self.data['nonce'])
+
+
+    def get_hash(self) -> str:
+        # Blocks don't change once they are part of a chain, so the hash is computed only once.
+        if self._hash is None:
+            self._hash = self.calculate_hash()
+
+        return self._hash
+
+
+    def calculate_hash(self) -> str:
+        return hasher.sha256(self.get_header()).hexdigest()
+
+
+def calculate_hash_for_nonce(midstate, nonce: int) -> str:
+    """
+    :param midstate: sha256 object that has already been updated with the header prefix of a block
+    :param nonce: nonce to try
+    :return: the hash of the block for the given nonce
+    """
+    sha = midstate.copy()
+    sha.update(NONCE_FORMAT.pack(nonce))
+    return sha.hexdigest()
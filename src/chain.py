@@ -0,0 +1,159 @@
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Iterable, Iterator, List, Optional
+
+from .block import Block
+from .codec import decode_block
+from .constants import BLOCK_CACHE_SIZE
+from .storage import BlockStore
+
+
+class BlockCache:
+    """
+    Blocks parsed recently, by hash. When it's full, the least recently used blocks are discarded.
+    """
+
+    def __init__(self, max_size: int = BLOCK_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._blocks = OrderedDict()
+
+
+    def get(self, block_hash: str) -> Optional[Block]:
+        block = self._blocks.get(block_hash)
+
+        if block is not None:
+            self._blocks.move_to_end(block_hash)
+
+        return block
+
+
+    def put(self, block: Block) -> None:
+        self._blocks[block.get_hash()] = block
+        self._blocks.move_to_end(block.get_hash())
+
+        while len(self._blocks) > self.max_size:
+            self._blocks.popitem(last=False)
+
+
+class LazyBlockchain(Sequence):
+    """
+    Read-only blockchain whose blocks are read from a block store (and parsed) only when they are accessed,
+    so getting the tip of the blockchain doesn't depend on its length. It can be followed by blocks that are
+    only in memory (e.g., `blockchain + [mined_block]`).
+
+    The view is a snapshot: if the blocks it covers are removed from the store (e.g., because the node switched
+    to a fork), reading them raises an exception instead of returning blocks of a different blockchain.
+    """
+
+    def __init__(
+            self,
+            block_store: BlockStore,
+            start: int = 0,
+            stop: Optional[int] = None,
+            extra_blocks: Iterable[Block] = (),
+            cache: BlockCache = None,
+            snapshot: (int, int) = None) -> None:
+        """
+        :param block_store: where the blocks are read from
+        :param start: height of the first stored block of the view
+        :param stop: height after the last stored block of the view (by default, the height of the store)
+        :param extra_blocks: blocks that go after the stored ones
+        :param cache: parsed blocks (it can be shared by several views)
+        :param snapshot: height and generation of the store when the view was created (for views made from other
+            views)
+        """
+        self.block_store = block_store
+        self.cache = cache if cache is not None else BlockCache()
+
+        with block_store.lock:
+            if snapshot is None:
+                snapshot = (len(block_store), block_store.generation)
+
+        self._snapshot = snapshot
+        self._start = start
+        self._stop = snapshot[0] if stop is None else stop
+        self._extra_blocks = list(extra_blocks)
+
+
+    def __len__(self) -> int:
+        return self._stop - self._start + len(self._extra_blocks)
+
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self._get_slice(idx)
+
+        if idx < 0:
+            idx += len(self)
+
+        if not 0 <= idx < len(self):
+            raise IndexError('Block index out of range')
+
+        if idx >= self._stop - self._start:
+            return self._extra_blocks[idx - (self._stop - self._start)]
+
+        return self._read_block(self._start + idx)
+
+
+    def __iter__(self) -> Iterator[Block]:
+        if self._stop > self._start:
+            with self.block_store.lock:
+                self._check_snapshot()
+                records = self.block_store.read_range(self._start, self._stop)
+
+            # The blocks are read without holding the lock (so the node isn't blocked while we read them), so the
+            # store can change meanwhile. We check that every block we read was still in the store after reading it.
+            for record in records:
+                with self.block_store.lock:
+                    self._check_snapshot()
+
+                yield decode_block(record)
+
+        yield from self._extra_blocks
+
+
+    def __add__(self, blocks: List[Block]) -> 'LazyBlockchain':
+        return LazyBlockchain(
+            self.block_store, self._start, self._stop, self._extra_blocks + list(blocks), self.cache, self._snapshot)
+
+
+    def __repr__(self) -> str:
+        return f'LazyBlockchain({self.block_store.path}, {self._start}:{self._stop} + {len(self._extra_blocks)} blocks)'
+
+
+    def _get_slice(self, idx: slice):
+        start, stop, step = idx.indices(len(self))
+
+        if step != 1:
+            return [self[i] for i in range(start, stop, step)]
+
+        stop = max(start, stop)
+        stored_length = self._stop - self._start
+
+        return LazyBlockchain(
+            self.block_store,
+            self._start + min(start, stored_length),
+            self._start + min(stop, stored_length),
+            self._extra_blocks[max(start - stored_length, 0):max(stop - stored_length, 0)],
+            self.cache,
+            self._snapshot
+        )
+
+
+    def _read_block(self, height: int) -> Block:
+        with self.block_store.lock:
+            self._check_snapshot()
+
+            block_hash = self.block_store.get_hash(height)
+            block = self.cache.get(block_hash)
+
+            if block is None:
+                block = decode_block(self.block_store.read(height))
+                self.cache.put(block)
+
+        return block
+
+
+    def _check_snapshot(self) -> None:
+        if not self.block_store.has_blocks_of(*self._snapshot):
+            raise Exception('The blockchain changed while it was being read.')
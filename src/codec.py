@@ -0,0 +1,296 @@
+"""
+Compact binary encoding of blocks, used to send them to other nodes and to store them.
+
+Every encoded block starts by the version of the format, and blocks encoded as JSON (the format used before,
+and the one used for blocks that the binary format cannot represent) start by `{`, so `decode_block` accepts both.
+
+Block (version 1):
+    version (B), flags (B), index (Q), timestamp (d), nonce (Q), difficulty level (B), previous hash (32s),
+    number of addresses (H), number of transactions (I), addresses, transactions
+
+Every address used in the block is stored once: 64-character hex addresses as their raw 32 bytes, any other
+address as its UTF-8 bytes (prefixed by their length). Transactions refer to them by their position.
+
+Transaction:
+    flags (B), from (H), to (H), amount (d), timestamp (d)
+
+A list of blocks is the version (B), the number of blocks (I) and every block prefixed by its length (I).
+"""
+import json
+import re
+import struct
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from .block import Block
+from .transactions import (
+    TRANSACTION_KEYS, TransactionTable, address_table, get_transaction_flags, compact_block_data)
+
+
+CODEC_VERSION = 1
+BINARY_MIMETYPE = 'application/vnd.simplecoin.blocks'
+JSON_MIMETYPE = 'application/json'
+
+BLOCK_FORMAT = struct.Struct('>BBQdQB32sHI')
+TRANSACTION_FORMAT = struct.Struct('>BHHdd')
+LIST_FORMAT = struct.Struct('>BI')
+LENGTH_FORMAT = struct.Struct('>I')
+
+HEX_ADDRESS = 0
+TEXT_ADDRESS = 1
+# Only lowercase, so decoding the address gives back the same string.
+HEX_ADDRESS_PATTERN = re.compile('[0-9a-f]{64}')
+
+# Block flags
+HAS_DIFFICULTY_LEVEL = 1
+TIMESTAMP_IS_INT = 2
+
+BLOCK_DATA_KEYS = {'nonce', 'transactions', 'difficulty_level'}
+
+
+class UnsupportedBlock(Exception):
+    """
+    The block has something (e.g., an unknown key) that the binary format cannot represent.
+    """
+
+
+class InvalidEncoding(ValueError):
+    pass
+
+
+class UnsupportedVersion(InvalidEncoding):
+    pass
+
+
+def encode_block(block: Block) -> bytes:
+    """
+    :raises UnsupportedBlock: if the block cannot be encoded without losing anything
+    """
+    data = block.data
+    transactions = data.get('transactions')
+
+    if not data.keys() <= BLOCK_DATA_KEYS or not isinstance(transactions, (list, TransactionTable)):
+        raise UnsupportedBlock('The block has unknown fields.')
+
+    flags = 0
+    if 'difficulty_level' in data:
+        flags |= HAS_DIFFICULTY_LEVEL
+    if _is_int(block.timestamp):
+        flags |= TIMESTAMP_IS_INT
+
+    # Position of every address in the block, by address ID.
+    block_address_ids = {}
+    encoded_transactions = []
+
+    try:
+        for tx_flags, from_id, to_id, amount, timestamp in _get_rows(transactions):
+            encoded_transactions.append(TRANSACTION_FORMAT.pack(
+                tx_flags,
+                block_address_ids.setdefault(from_id, len(block_address_ids)),
+                block_address_ids.setdefault(to_id, len(block_address_ids)),
+                amount,
+                timestamp
+            ))
+
+        header = BLOCK_FORMAT.pack(
+            CODEC_VERSION,
+            flags,
+            block.index,
+            block.timestamp,
+            data['nonce'],
+            data.get('difficulty_level', 0),
+            bytes.fromhex(block.previous_hash),
+            len(block_address_ids),
+            len(transactions)
+        )
+    except (struct.error, TypeError, ValueError) as e:
+        raise UnsupportedBlock(f'The block cannot be encoded: {e}')
+
+    encoded_addresses = [_encode_address(address_table.get_address(address_id)) for address_id in block_address_ids]
+
+    return b''.join([header] + encoded_addresses + encoded_transactions)
+
+
+def encode_block_or_json(block: Block) -> bytes:
+    try:
+        return encode_block(block)
+    except UnsupportedBlock:
+        return json.dumps(serialize_block(block)).encode()
+
+
+def decode_block(encoded_block: bytes) -> Block:
+    """
+    :param encoded_block: block encoded by `encode_block`, or as JSON
+    :raises InvalidEncoding: if the block cannot be decoded
+    """
+    if encoded_block[:1] == b'{':
+        try:
+            serialized_block = json.loads(encoded_block)
+            return Block(
+                serialized_block['index'],
+                serialized_block['timestamp'],
+                compact_block_data(serialized_block['data']),
+                previous_hash=serialized_block['previous_hash']
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            raise InvalidEncoding(f'Invalid JSON block: {e}')
+
+    try:
+        (version, flags, index, timestamp, nonce, difficulty_level, previous_hash, number_of_addresses,
+         number_of_transactions) = BLOCK_FORMAT.unpack_from(encoded_block)
+
+        if version != CODEC_VERSION:
+            raise UnsupportedVersion(f'Unknown version of the block format: {version}')
+
+        offset = BLOCK_FORMAT.size
+
+        address_ids = []
+        for _ in range(number_of_addresses):
+            address, offset = _decode_address(encoded_block, offset)
+            address_ids.append(address_table.get_id(address))
+
+        transactions = TransactionTable()
+        for tx_flags, from_idx, to_idx, amount, tx_timestamp in TRANSACTION_FORMAT.iter_unpack(
+                encoded_block[offset:offset + number_of_transactions * TRANSACTION_FORMAT.size]):
+            transactions.append_row(tx_flags, address_ids[from_idx], address_ids[to_idx], amount, tx_timestamp)
+
+        if len(transactions) != number_of_transactions:
+            raise IndexError('missing transactions')
+
+        offset += number_of_transactions * TRANSACTION_FORMAT.size
+
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise InvalidEncoding(f'Invalid binary block: {e}')
+
+    if offset != len(encoded_block):
+        raise InvalidEncoding('Invalid binary block: unexpected trailing bytes')
+
+    data = {'nonce': nonce}
+    if flags & HAS_DIFFICULTY_LEVEL:
+        data['difficulty_level'] = difficulty_level
+    data['transactions'] = transactions
+
+    return Block(index, int(timestamp) if flags & TIMESTAMP_IS_INT else timestamp, data, previous_hash.hex())
+
+
+def join_encoded_blocks(encoded_blocks: Iterable[bytes]) -> bytes:
+    """
+    Builds a list of blocks out of blocks that are already encoded (e.g., as they are stored).
+    """
+    chunks = []
+
+    for encoded_block in encoded_blocks:
+        chunks.append(LENGTH_FORMAT.pack(len(encoded_block)))
+        chunks.append(encoded_block)
+
+    return LIST_FORMAT.pack(CODEC_VERSION, len(chunks) // 2) + b''.join(chunks)
+
+
+def encode_blocks(blocks: Iterable[Block]) -> bytes:
+    return join_encoded_blocks(encode_block_or_json(block) for block in blocks)
+
+
+def decode_blocks(encoded_blocks: bytes) -> List[Block]:
+    """
+    :raises InvalidEncoding: if the list of blocks (or any of them) cannot be decoded
+    """
+    try:
+        version, number_of_blocks = LIST_FORMAT.unpack_from(encoded_blocks)
+    except struct.error as e:
+        raise InvalidEncoding(f'Invalid list of blocks: {e}')
+
+    if version != CODEC_VERSION:
+        raise UnsupportedVersion(f'Unknown version of the block format: {version}')
+
+    blocks = []
+    offset = LIST_FORMAT.size
+
+    for _ in range(number_of_blocks):
+        try:
+            length, = LENGTH_FORMAT.unpack_from(encoded_blocks, offset)
+        except struct.error as e:
+            raise InvalidEncoding(f'Invalid list of blocks: {e}')
+
+        offset += LENGTH_FORMAT.size
+        if offset + length > len(encoded_blocks):
+            raise InvalidEncoding('Invalid list of blocks: a block is incomplete')
+
+        blocks.append(decode_block(encoded_blocks[offset:offset + length]))
+        offset += length
+
+    if offset != len(encoded_blocks):
+        raise InvalidEncoding('Invalid list of blocks: unexpected trailing bytes')
+
+    return blocks
+
+
+def serialize_block(block: Block) -> Dict:
+    data = block.data
+
+    if isinstance(data.get('transactions'), TransactionTable):
+        data = dict(data, transactions=list(data['transactions']))
+
+    return {
+        'index': block.index,
+        'timestamp': block.timestamp,
+        'data': data,
+        'previous_hash': block.previous_hash
+    }
+
+
+def _is_int(number) -> bool:
+    return isinstance(number, int) and not isinstance(number, bool)
+
+
+def _get_rows(transactions) -> Iterator[Tuple[int, int, int, float, float]]:
+    if isinstance(transactions, TransactionTable):
+        return transactions.rows()
+
+    return (_get_row(tx) for tx in transactions)
+
+
+def _get_row(tx: Dict) -> Tuple[int, int, int, float, float]:
+    if not isinstance(tx, dict) or not ({'from', 'to', 'amount'} <= tx.keys() <= TRANSACTION_KEYS):
+        raise UnsupportedBlock('A transaction of the block has unknown fields.')
+
+    if not isinstance(tx['from'], str) or not isinstance(tx['to'], str):
+        raise UnsupportedBlock('Addresses must be strings.')
+
+    return (
+        get_transaction_flags(tx),
+        address_table.get_id(tx['from']),
+        address_table.get_id(tx['to']),
+        tx['amount'],
+        tx.get('timestamp', 0.0)
+    )
+
+
+def _encode_address(address: str) -> bytes:
+    if HEX_ADDRESS_PATTERN.fullmatch(address):
+        return bytes([HEX_ADDRESS]) + bytes.fromhex(address)
+
+    encoded_address = address.encode()
+    if len(encoded_address) > 255:
+        raise UnsupportedBlock('An address is too long.')
+
+    return bytes([TEXT_ADDRESS, len(encoded_address)]) + encoded_address
+
+
+def _decode_address(encoded_block: bytes, offset: int) -> (str, int):
+    kind = encoded_block[offset]
+
+    if kind == HEX_ADDRESS:
+        address = encoded_block[offset + 1:offset + 33]
+        if len(address) != 32:
+            raise IndexError('address out of range')
+
+        return address.hex(), offset + 33
+
+    if kind == TEXT_ADDRESS:
+        length = encoded_block[offset + 1]
+        address = encoded_block[offset + 2:offset + 2 + length]
+        if len(address) != length:
+            raise IndexError('address out of range')
+
+        return address.decode(), offset + 2 + length
+
+    raise IndexError(f'unknown kind of address: {kind}')
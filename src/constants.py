@@ -1,3 +1,59 @@
 MAX_NUM_TRANSACTIONS_PER_BLOCK = 3
+# All the nodes start with the same genesis block (created at this time), and they reject blockchains that start by
+# a different one.
+GENESIS_BLOCK_TIMESTAMP = 1514764800.0  # 2018-01-01
 PROOF_OF_WORK_TARGET_TIME_IN_SECONDS = 20
-DEFAULT_PROOF_OF_WORK_DIFFICULTY_LEVEL = 4
\ No newline at end of file
+DEFAULT_PROOF_OF_WORK_DIFFICULTY_LEVEL = 4
+# Blocks (other than the genesis block) mined with a lower difficulty level are rejected, whatever difficulty level
+# they declare, so every block takes 16^4 hashes on average (miners never go below it either).
+MIN_PROOF_OF_WORK_DIFFICULTY_LEVEL = DEFAULT_PROOF_OF_WORK_DIFFICULTY_LEVEL
+# Blocks mined with a higher difficulty level are rejected too. The work of a block is 16^difficulty (2^96 at most), so
+# the cumulative work of a blockchain fits in the 128 bits the block store keeps for it.
+MAX_PROOF_OF_WORK_DIFFICULTY_LEVEL = 24
+# Number of nonces a Proof of Work worker tries before checking whether another worker already found a solution.
+PROOF_OF_WORK_NONCE_RANGE_SIZE = 20000
+# How often (in seconds) the Proof of Work checks whether it was cancelled (e.g., because the tip of the blockchain
+# changed). Workers stop once they finish their current range, so it stops a few milliseconds later.
+PROOF_OF_WORK_CANCEL_CHECK_INTERVAL_IN_SECONDS = 0.005
+
+# Number of blocks the balances index remembers, so it can undo them when the network switches to a different blockchain.
+LEDGER_MAX_ROLLBACK_DEPTH = 100
+# The address index is saved whole after this number of blocks are added or removed. In between, only the changes are
+# appended to a log.
+ADDRESS_INDEX_CHECKPOINT_INTERVAL_IN_BLOCKS = 1000
+# A new segment file is started when the current one reaches this size.
+BLOCK_STORE_SEGMENT_SIZE_IN_BYTES = 64 * 1024 * 1024
+# Number of appended blocks after which the block store forces them to disk.
+BLOCK_STORE_FSYNC_BATCH_SIZE = 100
+# Number of block hashes compared when looking for the last block that two blockchains have in common.
+SYNC_HEADERS_WINDOW = 16
+# Timeouts when talking to other nodes. A round (e.g., asking all the nodes for their state) never takes longer than
+# PEER_ROUND_TIMEOUT_IN_SECONDS, no matter how many nodes don't answer.
+PEER_CONNECT_TIMEOUT_IN_SECONDS = 3
+PEER_READ_TIMEOUT_IN_SECONDS = 20
+PEER_ROUND_TIMEOUT_IN_SECONDS = 30
+PEER_MAX_CONCURRENT_REQUESTS = 32
+# The state of a node is written to disk at most once every this number of seconds.
+STATE_PERSISTENCE_INTERVAL_IN_SECONDS = 1
+# The pending transactions (which can be many more) are written at most once every this number of seconds.
+MEMPOOL_PERSISTENCE_INTERVAL_IN_SECONDS = 30
+# Responses of `GET /blockchain` up to this size are kept in memory until the blockchain changes.
+BLOCKCHAIN_RESPONSE_CACHE_MAX_SIZE_IN_BYTES = 64 * 1024 * 1024
+# Number of parsed blocks kept in memory (the rest of the blockchain is read from disk when needed).
+BLOCK_CACHE_SIZE = 256
+# Transactions returned by `GET /accounts/<address>/transactions` per page (by default, and at most).
+ACCOUNT_TRANSACTIONS_PAGE_SIZE = 50
+ACCOUNT_TRANSACTIONS_MAX_PAGE_SIZE = 500
+# Headers sent with a Merkle proof: the one of the block with the transaction and the following ones (by default,
+# and at most), so the wallet can check that enough blocks were mined on top of it.
+MERKLE_PROOF_HEADERS = 6
+MERKLE_PROOF_MAX_HEADERS = 100
+# The miner starts a round as soon as there are this number of pending transactions, or they pay this amount of fees
+# in total, or a new block arrives (if there are pending transactions). Otherwise, pending transactions wait at most
+# MINER_MAX_WAIT_IN_SECONDS (it can be changed with the "MINER_SLEEP_TIME_IN_SECONDS" env var).
+MINER_MIN_PENDING_TRANSACTIONS = MAX_NUM_TRANSACTIONS_PER_BLOCK
+MINER_MIN_PENDING_FEES = 1.0
+MINER_MAX_WAIT_IN_SECONDS = 10
+# Miners wait a random time (up to this number of seconds) before starting a round, so nodes woken up by the same
+# block don't start mining at the same time.
+MINER_MAX_START_DELAY_IN_SECONDS = 1
@@ -0,0 +1,161 @@
+from typing import Dict, List, Optional
+
+from .block import Block
+from .constants import LEDGER_MAX_ROLLBACK_DEPTH
+
+
+class Ledger:
+    """
+    Balance of every account at the tip of the blockchain.
+
+    It is updated block by block, and it remembers what every one of the last `max_rollback_depth` blocks changed,
+    so when the network switches to a different blockchain it only has to undo the blocks after the fork point.
+    """
+
+    def __init__(
+            self,
+            height: int = 0,
+            balances: Dict[str, float] = None,
+            recent_blocks: List[Dict] = None,
+            max_rollback_depth: int = LEDGER_MAX_ROLLBACK_DEPTH) -> None:
+        self.height = height
+        self.balances = balances or {}
+        # One entry per recent block: {'hash': <block hash>, 'changes': {<account>: <balance change>}}
+        self.recent_blocks = recent_blocks or []
+        self.max_rollback_depth = max_rollback_depth
+
+
+    @property
+    def tip_hash(self) -> Optional[str]:
+        return self.recent_blocks[-1]['hash'] if self.recent_blocks else None
+
+
+    def get_balance(self, account_address: str) -> float:
+        return self.balances.get(account_address, 0.0)
+
+
+    def get_balance_at(self, account_address: str, height: int) -> float:
+        """
+        :return: balance the account had when only the first `height` blocks were applied
+        """
+        if self.height - height > len(self.recent_blocks):
+            raise Exception(f'The ledger cannot go back more than {len(self.recent_blocks)} blocks.')
+
+        balance = self.get_balance(account_address)
+
+        for recent_block in self.recent_blocks[len(self.recent_blocks) - (self.height - height):]:
+            balance -= recent_block['changes'].get(account_address, 0.0)
+
+        return balance
+
+
+    def apply_block(self, block: Block) -> None:
+        changes = {}
+
+        for tx in block.data['transactions']:
+            changes[tx['to']] = changes.get(tx['to'], 0.0) + tx['amount']
+
+            if tx['from'] != tx['to']:
+                changes[tx['from']] = changes.get(tx['from'], 0.0) - tx['amount']
+
+        for account_address, change in changes.items():
+            self.balances[account_address] = self.get_balance(account_address) + change
+
+        self.height += 1
+        self.recent_blocks.append({'hash': block.get_hash(), 'changes': changes})
+
+        if len(self.recent_blocks) > self.max_rollback_depth:
+            self.recent_blocks.pop(0)
+
+
+    def rollback_to(self, height: int) -> None:
+        """
+        Undoes all the blocks after `height` (so only the first `height` blocks remain applied).
+        """
+        if self.height - height > len(self.recent_blocks):
+            raise Exception(f'The ledger cannot be rolled back more than {len(self.recent_blocks)} blocks.')
+
+        while self.height > height:
+            recent_block = self.recent_blocks.pop()
+
+            for account_address, change in recent_block['changes'].items():
+                self.balances[account_address] -= change
+
+            self.height -= 1
+
+
+    def get_fork_height(self, blockchain: List[Block]) -> Optional[int]:
+        """
+        :return: number of blocks shared by the ledger and the blockchain, or None if the fork point
+        is older than the blocks the ledger can roll back.
+        """
+        return get_fork_height(self.height, self.recent_blocks, blockchain)
+
+
+    def sync(self, blockchain: List[Block]) -> bool:
+        """
+        Updates the balances so they match the tip of the given blockchain.
+
+        :return: whether the ledger changed
+        """
+        fork_height = self.get_fork_height(blockchain)
+
+        if fork_height == self.height == len(blockchain):
+            return False
+
+        if fork_height is None:
+            # The fork is too old to undo it, so we start from scratch.
+            self.height, self.balances, self.recent_blocks = 0, {}, []
+            fork_height = 0
+
+        self.rollback_to(fork_height)
+
+        for block in blockchain[fork_height:]:
+            self.apply_block(block)
+
+        return True
+
+
+    def copy(self) -> 'Ledger':
+        # The changes of every block are never modified once applied, so they can be shared.
+        return Ledger(self.height, dict(self.balances), list(self.recent_blocks), self.max_rollback_depth)
+
+
+    def to_dict(self) -> Dict:
+        return {
+            'height': self.height,
+            'balances': self.balances,
+            'recent_blocks': self.recent_blocks
+        }
+
+
+    @classmethod
+    def from_dict(cls, serialized_ledger: Dict) -> 'Ledger':
+        return cls(
+            serialized_ledger['height'],
+            serialized_ledger['balances'],
+            serialized_ledger['recent_blocks']
+        )
+
+
+def get_fork_height(height: int, recent_blocks: List[Dict], blockchain: List[Block]) -> Optional[int]:
+    """
+    :param height: number of blocks applied to an index built block by block (e.g., the ledger)
+    :param recent_blocks: one entry per recent block applied (with its hash)
+    :param blockchain: blockchain to compare with
+    :return: number of blocks shared by the index and the blockchain, or None if the fork point is older
+        than the recent blocks.
+    """
+    oldest_recent_height = height - len(recent_blocks)
+
+    height = min(height, len(blockchain))
+
+    while height > oldest_recent_height:
+        recent_block = recent_blocks[height - oldest_recent_height - 1]
+
+        if blockchain[height - 1].get_hash() == recent_block['hash']:
+            return height
+
+        height -= 1
+
+    return 0 if height == 0 else None
@@ -0,0 +1,122 @@
+import heapq
+import itertools
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .block import Block
+from .utils import get_transaction_id
+
+
+class Mempool:
+    """
+    Pending transactions, waiting to be mined.
+
+    Transactions are kept in a dict by ID (so duplicates are detected, and any transaction can be removed, in O(1)),
+    plus a heap ordered by transaction fee, so the best paid transaction can be taken in O(log n).
+    Removed transactions are left in the heap and skipped when they reach the top.
+    """
+
+    def __init__(self, transactions: Iterable[Dict] = ()) -> None:
+        self._transactions = {}
+        self._heap = []
+        self._counter = itertools.count()
+        # Sum of the transaction fees of all the pending transactions
+        self.total_fees = 0.0
+        # Changes every time a transaction is added or removed (so we know whether it needs to be saved again).
+        self.version = 0
+
+        for transaction in transactions:
+            self.add(transaction)
+
+
+    def __len__(self) -> int:
+        return len(self._transactions)
+
+
+    def __iter__(self) -> Iterator[Dict]:
+        return (transaction for _, transaction in self._transactions.values())
+
+
+    def __contains__(self, transaction_id: str) -> bool:
+        return transaction_id in self._transactions
+
+
+    def add(self, transaction: Dict) -> bool:
+        """
+        :return: False if the transaction was already in the mempool
+        """
+        transaction_id = get_transaction_id(transaction)
+
+        if transaction_id in self._transactions:
+            return False
+
+        # The counter makes transactions with the same fee come out in the same order they came in.
+        entry_number = next(self._counter)
+        self._transactions[transaction_id] = (entry_number, transaction)
+        heapq.heappush(self._heap, (-transaction['transaction_fee'], entry_number, transaction_id))
+        self.total_fees += transaction['transaction_fee']
+        self.version += 1
+
+        return True
+
+
+    def pop_best(self) -> Optional[Dict]:
+        """
+        Removes and returns the transaction with the highest fee (or None if there are no transactions).
+        """
+        while self._heap:
+            _, entry_number, transaction_id = heapq.heappop(self._heap)
+
+            entry = self._transactions.get(transaction_id)
+            if entry and entry[0] == entry_number:
+                del self._transactions[transaction_id]
+                self._subtract_fee(entry[1])
+                return entry[1]
+
+        return None
+
+
+    def remove(self, transaction_id: str) -> Optional[Dict]:
+        entry = self._transactions.pop(transaction_id, None)
+
+        if entry:
+            self._subtract_fee(entry[1])
+
+        # If most of the heap are transactions that were removed, we get rid of them.
+        if len(self._heap) > 2 * len(self._transactions) + 64:
+            self._heap = [item for item in self._heap if self._is_in_the_mempool(item)]
+            heapq.heapify(self._heap)
+
+        return entry[1] if entry else None
+
+
+    def remove_confirmed(self, blocks: Iterable[Block]) -> int:
+        """
+        Removes the transactions included in the blocks (e.g., blocks mined by other nodes).
+
+        :return: number of transactions removed
+        """
+        removed = 0
+
+        for block in blocks:
+            for transaction in block.data['transactions']:
+                if self.remove(get_transaction_id(transaction)):
+                    removed += 1
+
+        return removed
+
+
+    def to_list(self) -> List[Dict]:
+        return list(self)
+
+
+    def _subtract_fee(self, transaction: Dict) -> None:
+        # We start from zero again when it's empty, so rounding errors don't add up.
+        self.total_fees = self.total_fees - transaction['transaction_fee'] if self._transactions else 0.0
+        self.version += 1
+
+
+    def _is_in_the_mempool(self, heap_item) -> bool:
+        _, entry_number, transaction_id = heap_item
+        entry = self._transactions.get(transaction_id)
+
+        return bool(entry) and entry[0] == entry_number
@@ -0,0 +1,83 @@
+import hashlib as hasher
+import struct
+from typing import Dict, List, Tuple
+
+
+EMPTY_MERKLE_ROOT = bytes(32)
+
+
+def serialize_transaction_for_hashing(transaction: Dict) -> bytes:
+    """
+    Canonical binary representation of a transaction. Unlike `str()` or `json.dumps()`, it doesn't depend on
+    the order of the keys or on whether the amounts are ints or floats.
+    """
+    from_address = transaction['from'].encode()
+    to_address = transaction['to'].encode()
+
+    return b''.join([
+        struct.pack('>H', len(from_address)), from_address,
+        struct.pack('>H', len(to_address)), to_address,
+        struct.pack('>dd', float(transaction['amount']), float(transaction.get('timestamp', 0.0)))
+    ])
+
+
+def get_transaction_hash(transaction: Dict) -> bytes:
+    return hasher.sha256(serialize_transaction_for_hashing(transaction)).digest()
+
+
+def get_merkle_root(transactions: List[Dict]) -> bytes:
+    """
+    Computes the Merkle root of a list of transactions. If a level has an odd number of nodes, the last one
+    is paired with itself.
+
+    :param transactions: transactions included in a block
+    :return: the 32 bytes of the root (zeroes if there are no transactions)
+    """
+    level = [get_transaction_hash(transaction) for transaction in transactions]
+
+    if not level:
+        return EMPTY_MERKLE_ROOT
+
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+
+        level = [hasher.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+
+    return level[0]
+
+
+def get_merkle_branch(transactions: List[Dict], position: int) -> List[Tuple[bytes, bool]]:
+    """
+    Hashes needed to go from a transaction to the Merkle root (one per level of the tree).
+
+    :param transactions: transactions included in a block
+    :param position: position of the transaction in the block
+    :return: (hash of the sibling, whether the sibling is on the right) for every level, from the bottom
+    """
+    level = [get_transaction_hash(transaction) for transaction in transactions]
+    branch = []
+
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+
+        sibling_position = position ^ 1
+        branch.append((level[sibling_position], sibling_position > position))
+
+        level = [hasher.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+        position //= 2
+
+    return branch
+
+
+def get_merkle_root_from_branch(transaction: Dict, branch: List[Tuple[bytes, bool]]) -> bytes:
+    """
+    :return: the Merkle root of a block that includes the transaction, given its branch (see `get_merkle_branch`)
+    """
+    node = get_transaction_hash(transaction)
+
+    for sibling, is_on_the_right in branch:
+        node = hasher.sha256(node + sibling if is_on_the_right else sibling + node).digest()
+
+    return node
@@ -0,0 +1,194 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+
+# Upper bounds (in seconds) of the buckets of the latency histograms: from a fast request to a slow Proof of Work.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Metric:
+    """
+    A metric (counter, gauge or histogram), with one value per combination of labels, which can be exported in
+    the text format of Prometheus (see `Registry.render`).
+    """
+
+    type = None
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (), registry: 'Registry' = None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+        if not self.label_names:
+            # Metrics without labels are exported from the start, even if nothing was observed yet.
+            self._values[()] = self.new_value()
+
+        (registry or default_registry).register(self)
+
+
+    def new_value(self):
+        return 0.0
+
+
+    def get_label_values(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise Exception(f'{self.name} takes the labels {self.label_names}, not {tuple(labels)}.')
+
+        return tuple(str(labels[label_name]) for label_name in self.label_names)
+
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self.get_label_values(labels), 0.0)
+
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+
+        return [f'{self.name}{format_labels(self.label_names, label_values)} {format_value(value)}'
+                for label_values, value in values]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        label_values = self.get_label_values(labels)
+
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        label_values = self.get_label_values(labels)
+
+        with self._lock:
+            self._values[label_values] = float(value)
+
+
+class Histogram(Metric):
+    """
+    Counts the observed values (e.g., how long something took) per bucket, plus their number and their sum.
+    """
+
+    type = 'histogram'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            label_names: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS,
+            registry: 'Registry' = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, label_names, registry)
+
+
+    def new_value(self) -> List[float]:
+        # [count per bucket (the last one is +Inf)..., sum]
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+
+    def observe(self, value: float, **labels) -> None:
+        label_values = self.get_label_values(labels)
+
+        with self._lock:
+            if label_values not in self._values:
+                self._values[label_values] = self.new_value()
+
+            values = self._values[label_values]
+            values[bisect_left(self.buckets, value)] += 1
+            values[-1] += value
+
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """
+        Observes how long the block (or the decorated function) takes, even if it raises an exception.
+        """
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+    def get_count(self, **labels) -> int:
+        with self._lock:
+            return sum(self._values.get(self.get_label_values(labels), [0])[:-1])
+
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((label_values, list(counts)) for label_values, counts in self._values.items())
+
+        lines = []
+
+        for label_values, counts in values:
+            cumulative_count = 0
+
+            for upper_bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative_count += count
+                labels = format_labels(
+                    self.label_names + ('le',), label_values + ('+Inf' if upper_bound == float('inf') else
+                                                                format_value(upper_bound),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative_count}')
+
+            labels = format_labels(self.label_names, label_values)
+            lines.append(f'{self.name}_sum{labels} {format_value(counts[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative_count}')
+
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+
+
+    def register(self, metric: Metric) -> None:
+        if metric.name in self.metrics:
+            raise Exception(f'There is already a metric called {metric.name}.')
+
+        self.metrics[metric.name] = metric
+
+
+    def render(self) -> str:
+        lines = []
+
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.render())
+
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(label_names: Sequence[str], label_values: Sequence[str]) -> str:
+    if not label_names:
+        return ''
+
+    def escape(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in zip(label_names, label_values)) + '}'
+
+
+def format_value(value: float) -> str:
+    return repr(float(value))
+
+
+# Metrics of the whole process (a node runs its server and its miner in the same process).
+default_registry = Registry()
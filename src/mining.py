@@ -0,0 +1,170 @@
+import hashlib as hasher
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from typing import Optional
+
+from .block import Block, calculate_hash_for_nonce
+from .constants import PROOF_OF_WORK_NONCE_RANGE_SIZE, PROOF_OF_WORK_CANCEL_CHECK_INTERVAL_IN_SECONDS
+from .metrics import Counter, Gauge, Histogram
+
+
+_pool = None
+_pool_size = 0
+_solution_found = None
+
+PROOF_OF_WORK_HASHES = Counter('simplecoin_proof_of_work_hashes_total', 'Nonces tried by the Proof of Work.')
+PROOF_OF_WORK_HASH_RATE = Gauge(
+    'simplecoin_proof_of_work_hashes_per_second', 'Nonces tried per second during the last Proof of Work.')
+PROOF_OF_WORK_SECONDS = Histogram('simplecoin_proof_of_work_seconds', 'Time spent looking for a nonce.')
+PROOF_OF_WORK_CANCELLED = Counter(
+    'simplecoin_proof_of_work_cancelled_total', 'Proofs of Work abandoned because their block became stale.')
+
+
+class MiningCancelled(Exception):
+    """
+    The Proof of Work was stopped before finding a nonce (e.g., because another node mined a block first).
+    """
+
+
+def get_number_of_workers() -> int:
+    """
+    Number of processes used to mine. It can be set with the "PROOF_OF_WORK_WORKERS" env var,
+    otherwise it uses all the cores available in the machine.
+    """
+    number_of_workers = os.getenv('PROOF_OF_WORK_WORKERS')
+
+    if number_of_workers:
+        return max(1, int(number_of_workers))
+
+    return os.cpu_count() or 1
+
+
+def find_nonce(
+        block: Block,
+        difficulty_level: int,
+        number_of_workers: int = None,
+        range_size: int = PROOF_OF_WORK_NONCE_RANGE_SIZE,
+        cancelled: threading.Event = None) -> int:
+    """
+    Looks for a nonce that makes the hash of the block start by `difficulty_level` zeroes.
+
+    The nonce space (starting by the current nonce of the block) is split in ranges of `range_size` nonces,
+    and each worker takes every N-th range (e.g., with 4 workers, worker 1 takes ranges 1, 5, 9...).
+    As soon as one worker finds a solution, all the other workers stop.
+
+    :param block: block to be mined (its `data['nonce']` is used as the first nonce to try)
+    :param difficulty_level: number of zeroes the hash should start by
+    :param number_of_workers: number of processes used to mine
+    :param range_size: number of nonces a worker tries before checking if it should stop
+    :param cancelled: once it's set, the workers stop as soon as they finish their current range
+    :return: the nonce found
+    :raises MiningCancelled: if `cancelled` was set before a nonce was found
+    """
+    number_of_workers = number_of_workers or get_number_of_workers()
+    cancelled = cancelled or threading.Event()
+    first_nonce = block.data['nonce']
+    start = time.perf_counter()
+
+    if number_of_workers == 1:
+        # No need to pay for a process pool if we are only going to use one core.
+        nonce, hashes = _search_nonce_ranges(
+            block, difficulty_level, first_nonce, 1, range_size, threading.Event(), cancelled)
+
+    else:
+        pool, solution_found = _get_pool(number_of_workers)
+        solution_found.clear()
+
+        futures = [
+            pool.submit(_search_nonce_ranges_in_worker, block, difficulty_level,
+                        first_nonce + worker_idx * range_size, number_of_workers, range_size)
+            for worker_idx in range(number_of_workers)
+        ]
+
+        # Once a worker finds a solution the rest finish their current range and return, so we wait for all of
+        # them. That way, none of them is still running when the next block gets mined. Workers cannot see
+        # `cancelled` (it only exists in this process), so we stop them the same way if it gets set.
+        while wait(futures, timeout=PROOF_OF_WORK_CANCEL_CHECK_INTERVAL_IN_SECONDS).not_done:
+            if cancelled.is_set():
+                solution_found.set()
+
+        nonces = [future.result()[0] for future in futures if future.result()[0] is not None]
+        nonce = min(nonces) if nonces else None
+        hashes = sum(future.result()[1] for future in futures)
+
+    elapsed_time = time.perf_counter() - start
+
+    PROOF_OF_WORK_HASHES.inc(hashes)
+    PROOF_OF_WORK_SECONDS.observe(elapsed_time)
+    if elapsed_time:
+        PROOF_OF_WORK_HASH_RATE.set(hashes / elapsed_time)
+
+    # A nonce found after the block became stale is as useless as no nonce at all.
+    if cancelled.is_set():
+        PROOF_OF_WORK_CANCELLED.inc()
+        raise MiningCancelled(f'The Proof of Work was cancelled after {hashes} hashes ({elapsed_time:.3f} seconds).')
+
+    return nonce
+
+
+def _get_pool(number_of_workers: int) -> (ProcessPoolExecutor, multiprocessing.Event):
+    global _pool, _pool_size, _solution_found
+
+    if _pool is None or _pool_size != number_of_workers:
+        if _pool is not None:
+            _pool.shutdown()
+
+        _solution_found = multiprocessing.Event()
+        _pool = ProcessPoolExecutor(
+            max_workers=number_of_workers, initializer=_init_worker, initargs=(_solution_found,))
+        _pool_size = number_of_workers
+
+    return _pool, _solution_found
+
+
+def _init_worker(solution_found: multiprocessing.Event) -> None:
+    global _solution_found
+    _solution_found = solution_found
+
+
+def _search_nonce_ranges_in_worker(
+        block: Block,
+        difficulty_level: int,
+        first_nonce: int,
+        number_of_workers: int,
+        range_size: int) -> (Optional[int], int):
+    return _search_nonce_ranges(block, difficulty_level, first_nonce, number_of_workers, range_size, _solution_found)
+
+
+def _search_nonce_ranges(
+        block: Block,
+        difficulty_level: int,
+        first_nonce: int,
+        number_of_workers: int,
+        range_size: int,
+        solution_found,
+        cancelled=None) -> (Optional[int], int):
+    """
+    :return: the nonce found (None if another worker found one first, or if it was cancelled), and the number
+        of nonces tried
+    """
+    target = '0' * difficulty_level
+    range_start = first_nonce
+    hashes = 0
+
+    # Only the nonce changes between attempts, so we hash the rest of the header once and copy that state.
+    midstate = hasher.sha256(block.get_header_prefix())
+
+    while not solution_found.is_set() and not (cancelled and cancelled.is_set()):
+        for nonce in range(range_start, range_start + range_size):
+            if calculate_hash_for_nonce(midstate, nonce)[:difficulty_level] == target:
+                solution_found.set()
+                return nonce, hashes + nonce - range_start + 1
+
+        hashes += range_size
+        # We jump over the ranges that the other workers are taking care of.
+        range_start += number_of_workers * range_size
+
+    return None, hashes
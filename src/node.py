@@ -0,0 +1,29 @@
+import os
+import threading
+
+from .node_miner import run_miner
+from .node_server import create_app
+from .node_state import NodeState
+from .utils import set_up_env_vars
+
+
+def main() -> None:
+    """
+    Runs a whole node (HTTP server and miner) in a single process, sharing the same state.
+    """
+    miner_account_address, node_url, network_nodes_urls = set_up_env_vars()
+
+    node_state = NodeState(miner_account_address, node_url, network_nodes_urls)
+    node_state.start_persisting()
+
+    miner_thread = threading.Thread(target=run_miner, args=(node_state,), name='miner', daemon=True)
+    miner_thread.start()
+
+    app = create_app(node_state)
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', 5000)), threaded=True)
+
+
+# The Proof of Work runs in a pool of processes, which might import this module again. We make sure that only the
+# main process starts the node.
+if __name__ == '__main__':
+    main()
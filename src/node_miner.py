@@ -1,73 +1,177 @@
-import copy
 import os
 import pprint
 import sys
 import time
 import random
-
-import schedule
-
-from src.constants import MAX_NUM_TRANSACTIONS_PER_BLOCK
+import threading
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from src.constants import (
+    MAX_NUM_TRANSACTIONS_PER_BLOCK, MINER_MIN_PENDING_TRANSACTIONS, MINER_MIN_PENDING_FEES, MINER_MAX_WAIT_IN_SECONDS,
+    MINER_MAX_START_DELAY_IN_SECONDS)
+from .block import Block
+from .metrics import Counter, Histogram
+from .mining import MiningCancelled
+from .node_state import NodeState
+from .tracing import tracer
+from .validation import InvalidBlockchain
 from .utils import (
     propagate_blockchain_in_network,
-    load_state_from_file, save_state_into_file,
     is_any_other_node_currently_mining, consensus,
     has_account_enough_funds, get_states_from_all_other_nodes,
-    set_up_env_vars, mine_coin, get_latest_block_mining_info_from_states)
+    mine_coin, get_latest_block_mining_info_from_states, get_transaction_id)
 
 pp = pprint.PrettyPrinter(indent=4)
 
+MINE_STAGE_SECONDS = Histogram(
+    'simplecoin_mine_stage_seconds', 'Time spent in every stage of a mining round.', ['stage'])
+MINE_ROUNDS = Counter('simplecoin_mine_rounds_total', 'Mining rounds, by how they ended.', ['result'])
+
+
+@contextmanager
+def stage(name: str) -> Iterator[Dict]:
+    """
+    Measures a stage of a mining round. If tracing is enabled (see `tracing.py`), the stage is also recorded as a
+    span, and it can add the size of what it handled to the returned dict.
+    """
+    with MINE_STAGE_SECONDS.time(stage=name), tracer.span(name) as span:
+        yield span
+
 
-def mine():
-    miner_account_address, node_url, network_nodes_urls = set_up_env_vars()
+def mine(node_state: NodeState):
+    miner_account_address = node_state.miner_account_address
+    node_url = node_state.node_url
+    network_nodes_urls = node_state.network_nodes_urls
+    state = node_state.state
 
-    print(f'*** RUNNING MINER: {miner_account_address} *** (Running every {how_many_seconds_until_next_mining} seconds)')
+    print(f'*** RUNNING MINER: {miner_account_address} *** (Pending transactions wait at most {max_seconds_until_next_mining} seconds)')
     sys.stdout.flush()
 
-    state = load_state_from_file(miner_account_address)
+    with stage('fetch_states') as span:
+        states_from_all_other_nodes = get_states_from_all_other_nodes(node_url, network_nodes_urls)
+        span['states'] = len(states_from_all_other_nodes)
 
-    states_from_all_other_nodes = get_states_from_all_other_nodes(node_url, network_nodes_urls)
-    state['all_miners_addresses_in_the_network'] = [
-        s['miner_account_address'] for s in states_from_all_other_nodes + [state]
-    ]
-    save_state_into_file(state, miner_account_address)
+    with stage('mining_flag') as span, node_state.lock:
+        state['all_miners_addresses_in_the_network'] = [
+            s['miner_account_address'] for s in states_from_all_other_nodes + [state]
+        ]
+        node_state.mark_as_changed()
 
-    pending_transactions = state['pending_transactions']
+        span['pending_transactions'] = len(node_state.mempool)
 
-    if not pending_transactions:
-        print('No pending transactions... exiting.')
-        sys.stdout.flush()
-        return
+        if not node_state.mempool:
+            print('No pending transactions... exiting.')
+            sys.stdout.flush()
+            MINE_ROUNDS.inc(result='no_transactions')
+            return
 
-    state['currently_mining'] = True
-    save_state_into_file(state, miner_account_address)
+        state['currently_mining'] = True
 
     if is_any_other_node_currently_mining(states_from_all_other_nodes):
         print('One or more Nodes are currently mining. Please wait a few seconds until they are finished.')
         sys.stdout.flush()
 
-        state['currently_mining'] = False
-        save_state_into_file(state, miner_account_address)
+        with node_state.lock:
+            state['currently_mining'] = False
 
+        MINE_ROUNDS.inc(result='other_node_mining')
         return
 
-    # We get, by consensus (majority), the most prevalent blockchain in the network.
-    blockchain = consensus(network_nodes_urls)
+    with stage('consensus') as span:
+        # We get, by consensus (majority), the most prevalent blockchain in the network. We only download
+        # the blocks that we don't have.
+        blockchain = consensus(network_nodes_urls, node_state.get_blockchain())
+
+        try:
+            node_state.replace_blockchain(blockchain)
+        except InvalidBlockchain as e:
+            print(f'The blockchain of the network was rejected ({e}), so we keep mining on ours.')
+            sys.stdout.flush()
+
+        # The blocks are read back from the node, as the ones we got may have replaced part of the local blockchain.
+        blockchain = node_state.get_blockchain()
+        span['height'] = len(blockchain)
+
+    last_block_idx, difficulty_level_last_block, mining_time_last_block = get_latest_block_mining_info_from_states(
+        states_from_all_other_nodes + [node_state.get_mining_info()])
+
+    while True:
+        with ExitStack() as watching_tip:
+            with stage('check_funds') as span, node_state.lock:
+                # The block is built on top of the blockchain the balances belong to. We watch its tip from now on,
+                # so a block that arrives before we start mining isn't missed.
+                blockchain = node_state.blockchain
+                tip_hash = blockchain[-1].get_hash()
+                tip_changed = watching_tip.enter_context(node_state.watch_tip(tip_hash))
+
+                verified_transactions = pick_verified_transactions(node_state)
+                span['verified_transactions'] = len(verified_transactions)
+
+            if not verified_transactions:
+                MINE_ROUNDS.inc(result='no_valid_transactions')
+                break
+
+            try:
+                mined_block, current_difficulty_level, current_mining_time = mine_on_top_of(
+                    node_state, blockchain, tip_hash, tip_changed, verified_transactions, difficulty_level_last_block,
+                    mining_time_last_block)
+
+            except MiningCancelled as e:
+                # Another node mined a block first, so ours would be stale (and it would conflict with theirs).
+                print(f'The blockchain changed while mining ({e}). Mining again on top of the new blockchain.')
+                sys.stdout.flush()
 
-    # We are going to iterate over this list later, so we copy it
-    transactions_to_be_processed = copy.copy(state['pending_transactions'])
-    # We give priorities to transactions with higher transaction fee
-    transactions_to_be_processed = sorted(
-        transactions_to_be_processed, key=lambda k: k['transaction_fee'], reverse=True)
+                return_to_mempool(node_state, verified_transactions)
+                continue
 
+            except Exception:
+                # The transactions weren't mined, so they shouldn't get lost.
+                return_to_mempool(node_state, verified_transactions)
+                raise
+
+        blockchain = blockchain + [mined_block]
+
+        with node_state.lock:
+            state['idx_last_block_mined'] = last_block_idx + 1
+            state['difficulty_level_for_last_block_mined'] = current_difficulty_level
+            state['mining_time_for_last_block_mined'] = current_mining_time
+
+        with stage('propagation') as span:
+            # Our own node already has the block.
+            other_nodes_urls = [url for url in network_nodes_urls if url != node_url]
+            span['nodes'] = len(other_nodes_urls)
+            propagate_blockchain_in_network(blockchain, other_nodes_urls, miner_account_address, mined_block.index)
+
+        print(f'Block {mined_block.get_hash()} (Idx: {last_block_idx + 1}) was mined successfully (Took {current_mining_time} seconds with difficulty level of {current_difficulty_level})')
+        sys.stdout.flush()
+
+        MINE_ROUNDS.inc(result='mined')
+        break
+
+    with node_state.lock:
+        state['currently_mining'] = False
+        node_state.mark_as_changed()
+
+
+def pick_verified_transactions(node_state: NodeState) -> List[Dict]:
+    """
+    Takes the best paid transactions out of the mempool (it must be called holding the lock of the node). The ones
+    whose account doesn't have enough funds are moved to the failing transactions.
+    """
+    state = node_state.state
     verified_transactions = []
-    for transaction in transactions_to_be_processed[:MAX_NUM_TRANSACTIONS_PER_BLOCK]:
-        state['pending_transactions'].remove(transaction)
+    # What every account spends in this block, so no account spends (in total) more than it has.
+    spendings = {}
+    for _ in range(MAX_NUM_TRANSACTIONS_PER_BLOCK):
+        # We give priorities to transactions with higher transaction fee
+        transaction = node_state.mempool.pop_best()
 
-        if not has_account_enough_funds(blockchain, transaction):
-            state['failing_transactions'].append(transaction)
+        if transaction is None:
+            break
 
-            save_state_into_file(state, miner_account_address)
+        if not has_account_enough_funds(node_state.ledger, transaction, spendings):
+            state['failing_transactions'].append(transaction)
 
             print('Unfortunately the "FROM" account doesn\'t have enough funds. '
                   f'The transaction {transaction} will be ignored.')
@@ -76,35 +180,184 @@ def mine():
         else:
             state['verified_transactions'].append(transaction)
 
+            spendings[transaction['from']] = (
+                spendings.get(transaction['from'], 0.0) + transaction['amount'] + transaction['transaction_fee'])
+
             verified_transactions.append(transaction)
 
-    if verified_transactions:
-        last_block_idx, difficulty_level_last_block, mining_time_last_block = get_latest_block_mining_info_from_states(
-            states_from_all_other_nodes + [state])
+    node_state.mark_as_changed()
 
-        mined_block, current_difficulty_level, current_mining_time = mine_coin(
-            blockchain, verified_transactions, miner_account_address, difficulty_level_last_block, mining_time_last_block)
+    return verified_transactions
 
-        state['idx_last_block_mined'] = last_block_idx + 1
-        state['difficulty_level_for_last_block_mined'] = current_difficulty_level
-        state['mining_time_for_last_block_mined'] = current_mining_time
 
-        blockchain.append(mined_block)
+def mine_on_top_of(
+        node_state: NodeState,
+        blockchain: List[Block],
+        tip_hash: str,
+        tip_changed: threading.Event,
+        verified_transactions: List[Dict],
+        difficulty_level_last_block: int,
+        mining_time_last_block: int) -> (Block, int, int):
+    """
+    Mines a block with the transactions on top of `blockchain`, and adds it to the blockchain of the node.
 
-        propagate_blockchain_in_network(blockchain, network_nodes_urls, miner_account_address)
+    :param tip_changed: set when the tip of the node isn't `tip_hash` anymore (see `NodeState.watch_tip`)
+    :raises MiningCancelled: if the tip of the node changes before the block is added (e.g., another node sent us
+        a new block), as the block would be stale
+    """
+    try:
+        with stage('mine_coin') as span:
+            mined_block, current_difficulty_level, current_mining_time = mine_coin(
+                blockchain, verified_transactions, node_state.miner_account_address, difficulty_level_last_block,
+                mining_time_last_block, cancelled=tip_changed)
 
-        print(f'Block {mined_block.get_hash()} (Idx: {last_block_idx + 1}) was mined successfully (Took {current_mining_time} seconds with difficulty level of {current_difficulty_level})')
+            span['transactions'] = len(mined_block.data['transactions'])
+            span['difficulty_level'] = current_difficulty_level
+
+    except MiningCancelled:
+        raise
+
+    except Exception as e:
+        # If another blockchain replaced ours, reading the blocks we were mining on top of may fail too.
+        if tip_changed.is_set():
+            raise MiningCancelled(f'The blockchain was replaced while the block was being built: {e}') from e
+
+        raise
+
+    with node_state.lock:
+        # The tip could have changed right after the nonce was found.
+        if node_state.blockchain[-1].get_hash() != tip_hash:
+            raise MiningCancelled('The blockchain changed right after the block was mined.')
+
+        node_state.replace_blockchain(blockchain + [mined_block])
+
+    return mined_block, current_difficulty_level, current_mining_time
+
+
+def return_to_mempool(node_state: NodeState, transactions: List[Dict]) -> None:
+    """
+    Puts back the transactions of a block that won't be mined, so they are verified again (against the new balances)
+    in the next block. The ones that the new blocks of the blockchain already include are dropped.
+    """
+    with node_state.lock:
+        # They are the last transactions verified by the miner.
+        del node_state.state['verified_transactions'][-len(transactions):]
+
+        for transaction in transactions:
+            if node_state.address_index.get_transaction_location(get_transaction_id(transaction)) is None:
+                node_state.mempool.add(transaction)
+
+        node_state.mark_as_changed()
+
+
+def mine_and_report_errors(node_state: NodeState) -> None:
+    # The miner runs in a thread of the node, so an error in a round shouldn't stop the following ones.
+    try:
+        with tracer.round('mine'):
+            mine(node_state)
+
+    except Exception as e:
+        print(f'Mining failed: {e!r}')
         sys.stdout.flush()
 
-    state['currently_mining'] = False
-    save_state_into_file(state, miner_account_address)
+        MINE_ROUNDS.inc(result='failed')
+
+        with node_state.lock:
+            node_state.state['currently_mining'] = False
+            node_state.mark_as_changed()
+
+
+class MiningTrigger:
+    """
+    Decides when the miner should start a round, instead of mining every N seconds: when there are enough pending
+    transactions (or they pay enough fees), when there are pending transactions and a new block arrives, or when
+    the pending transactions have waited for `max_wait` seconds since the last round. If nothing changed since the
+    last round, no round is started (so an idle node doesn't talk to the network at all).
+    """
+
+    def __init__(
+            self,
+            min_pending_transactions: int = MINER_MIN_PENDING_TRANSACTIONS,
+            min_pending_fees: float = MINER_MIN_PENDING_FEES,
+            max_wait: float = MINER_MAX_WAIT_IN_SECONDS) -> None:
+        self.min_pending_transactions = min_pending_transactions
+        self.min_pending_fees = min_pending_fees
+        self.max_wait = max_wait
+
+        # (tip hash, pending transactions, pending fees) when the last round started
+        self.last_round_snapshot = None
+        # Since when the pending transactions are waiting (or since the last round, if it's later)
+        self.pending_since = None
+
+
+    def get_reason_to_mine(self, node_state: NodeState, now: float) -> Optional[str]:
+        """
+        :param now: current time, in seconds (only the time between calls matters)
+        :return: why a round should start now (None if it shouldn't). It's taken as started.
+        """
+        with node_state.lock:
+            snapshot = (node_state.blockchain[-1].get_hash(), len(node_state.mempool), node_state.mempool.total_fees)
+
+        tip_hash, pending_transactions, pending_fees = snapshot
+
+        if not pending_transactions:
+            self.pending_since = None
+            return None
+
+        if self.pending_since is None:
+            self.pending_since = now
+
+        reason = None
+
+        if self.last_round_snapshot is None:
+            reason = 'pending transactions'
+
+        elif snapshot != self.last_round_snapshot:
+            if tip_hash != self.last_round_snapshot[0]:
+                reason = 'new block'
+
+            elif pending_transactions >= self.min_pending_transactions or pending_fees >= self.min_pending_fees:
+                reason = 'enough pending transactions'
+
+        if reason is None and now - self.pending_since >= self.max_wait:
+            reason = 'pending transactions waited too long'
+
+        if reason:
+            self.last_round_snapshot = snapshot
+            self.pending_since = now
+
+        return reason
+
+
+    def get_seconds_until_max_wait(self, now: float) -> Optional[float]:
+        """
+        :return: None if there are no pending transactions (so there is no need to wake up until something changes)
+        """
+        if self.pending_since is None:
+            return None
+
+        return max(self.pending_since + self.max_wait - now, 0.0)
+
+
+def run_miner(node_state: NodeState) -> None:
+    trigger = MiningTrigger(max_wait=max_seconds_until_next_mining)
+
+    while True:
+        with node_state.lock:
+            reason = trigger.get_reason_to_mine(node_state, time.monotonic())
+
+            if reason is None:
+                # Any change in the node (a new transaction, a new block...) wakes us up.
+                node_state.activity.wait(trigger.get_seconds_until_max_wait(time.monotonic()))
+                continue
+
+        print(f'Starting a mining round ({reason})')
+        sys.stdout.flush()
 
+        # So two Miners don't "collide" (start mining at the same time, e.g., when they get the same block)
+        time.sleep(random.uniform(0, MINER_MAX_START_DELAY_IN_SECONDS))
 
-# So two Miners don't "collide" (start mining at the same time)
-how_many_seconds_until_next_mining = int(os.getenv('MINER_SLEEP_TIME_IN_SECONDS', random.randint(50, 70)))
-schedule.every(how_many_seconds_until_next_mining).seconds.do(mine)
+        mine_and_report_errors(node_state)
 
 
-while True:
-    schedule.run_pending()
-    time.sleep(1)
+max_seconds_until_next_mining = float(os.getenv('MINER_SLEEP_TIME_IN_SECONDS', MINER_MAX_WAIT_IN_SECONDS))
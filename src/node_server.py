@@ -1,87 +1,387 @@
-import hashlib as hasher
 import json
 import pprint
 from datetime import datetime
+from typing import Callable, Dict, Iterator, List
 
-from flask import Flask, request
+from flask import Blueprint, Flask, Response, current_app, request
 
+from .block import Block
+from .codec import BINARY_MIMETYPE, JSON_MIMETYPE, InvalidEncoding, UnsupportedVersion, decode_blocks
+from .constants import (
+    BLOCKCHAIN_RESPONSE_CACHE_MAX_SIZE_IN_BYTES, ACCOUNT_TRANSACTIONS_PAGE_SIZE, ACCOUNT_TRANSACTIONS_MAX_PAGE_SIZE,
+    MERKLE_PROOF_HEADERS, MERKLE_PROOF_MAX_HEADERS)
+from .merkle import get_merkle_branch
+from .metrics import CONTENT_TYPE, Gauge, default_registry
+from .node_state import NodeState
+from .validation import InvalidBlockchain
 from .utils import (
-    create_genesis_block,
     serialize_block, unserialize_blockchain,
-    save_blockchain_into_file, load_blockchain_from_file,
-    load_state_from_file, save_state_into_file,
-    is_posted_transaction_valid,
-    is_posted_blockchain_valid, set_up_env_vars)
+    load_tip_from_file, load_serialized_blockchain_from_file, load_encoded_blockchain_from_file,
+    load_block_hashes_from_file,
+    get_transaction_id, is_posted_transaction_valid,
+    are_posted_blocks_valid, is_posted_blockchain_valid)
 
 pp = pprint.PrettyPrinter(indent=4)
 
-app = Flask(__name__)
+api = Blueprint('api', __name__)
 
-miner_account_address, node_url, network_nodes_urls = set_up_env_vars()
+BLOCKCHAIN_HEIGHT = Gauge('simplecoin_blockchain_height', 'Number of blocks in the blockchain of the node.')
+TRANSACTIONS = Gauge('simplecoin_transactions', 'Transactions known by the node, by status.', ['status'])
+CURRENTLY_MINING = Gauge(
+    'simplecoin_currently_mining', 'Whether the miner of the node is mining a block (1) or not (0).')
+DIFFICULTY_LEVEL = Gauge(
+    'simplecoin_proof_of_work_difficulty_level', 'Difficulty level of the last block mined by the node.')
 
 
-@app.route('/transaction', methods=['POST'])
+def create_app(node_state: NodeState) -> Flask:
+    app = Flask(__name__)
+    app.config['NODE_STATE'] = node_state
+    app.register_blueprint(api)
+
+    return app
+
+
+def get_node_state() -> NodeState:
+    return current_app.config['NODE_STATE']
+
+
+def wants_binary_blocks() -> bool:
+    # If both are accepted equally (e.g., `*/*`), JSON wins, so only nodes that ask for it get the binary format.
+    return request.accept_mimetypes.best_match([JSON_MIMETYPE, BINARY_MIMETYPE]) == BINARY_MIMETYPE
+
+
+def get_posted_blocks(are_valid: Callable[[List[Dict]], bool]) -> List[Block]:
+    """
+    Reads the blocks of the request, either in the binary format (see `codec.py`) or as JSON.
+
+    :param are_valid: checks the structure of the blocks, when they are sent as JSON
+    :raises InvalidEncoding: if the blocks cannot be read
+    """
+    if request.mimetype == BINARY_MIMETYPE:
+        blocks = decode_blocks(request.data)
+
+        if not blocks:
+            raise InvalidEncoding('There are no blocks.')
+
+        return blocks
+
+    serialized_blocks = json.loads(request.data)
+
+    if not are_valid(serialized_blocks):
+        raise InvalidEncoding('Invalid structure.')
+
+    return unserialize_blockchain(serialized_blocks)
+
+
+def is_known_sender() -> bool:
+    # TODO: HTTP_HOST is not the most secure way to check the provenance.
+    headers = request.headers.environ
+
+    return 'HTTP_HOST' in headers and any(
+        headers['HTTP_HOST'] in node_url for node_url in get_node_state().network_nodes_urls)
+
+
+INVALID_TRANSACTION_MESSAGE = 'Transaction is invalid. Please make sure that all the attributes are provided and ' \
+                              'that the "transaction fee" is at least 0.01'
+INVALID_HEIGHT_MESSAGE = 'Heights cannot be negative.'
+
+
+@api.route('/transaction', methods=['POST'])
 def create_transaction():
-    state = load_state_from_file(miner_account_address)
+    node_state = get_node_state()
 
     transaction = json.loads(request.data)
 
-    if not transaction or not is_posted_transaction_valid(transaction):
-        return 'Transaction is invalid. Please make sure that all the attributes are provided and that the ' \
-               '"transaction fee" is at least 0.01', 400
+    if not is_posted_transaction_valid(transaction):
+        return INVALID_TRANSACTION_MESSAGE, 400
+
+    transaction['timestamp'] = datetime.now().timestamp()
 
     # Generate Transaction ID
-    sha = hasher.sha256()
+    transaction_id = get_transaction_id(transaction)
 
-    transaction['timestamp'] = datetime.now().timestamp()
+    with node_state.lock:
+        node_state.mempool.add(transaction)
+        node_state.mark_as_changed()
+
+    return f'Transaction ID: {transaction_id}', 201
 
-    sha.update(json.dumps({
-        'from': transaction['from'],
-        'to': transaction['to'],
-        'amount': transaction['amount'],
-        'timestamp': transaction['timestamp']
-    }).encode())
 
-    transaction_id = sha.hexdigest()
+@api.route('/transactions', methods=['POST'])
+def create_transactions():
+    """
+    Same as `POST /transaction`, but for a list of transactions. All the valid ones are added at once, and the
+    response contains the result for every transaction (in the same order). The status is 201 if at least one
+    transaction was added, and 400 otherwise.
+    """
+    node_state = get_node_state()
 
-    state['pending_transactions'].append(transaction)
-    save_state_into_file(state, miner_account_address)
+    transactions = json.loads(request.data)
 
-    return f'Transaction ID: {transaction_id}', 201
+    if not isinstance(transactions, list) or not transactions:
+        return 'Please provide a list of transactions.', 400
+
+    results = []
+    valid_transactions = []
+
+    for transaction in transactions:
+        # A malformed transaction only fails itself, not the whole batch.
+        try:
+            is_valid = is_posted_transaction_valid(transaction)
+        except (TypeError, ValueError, AttributeError):
+            is_valid = False
+
+        if not is_valid:
+            results.append({'status': 400, 'error': INVALID_TRANSACTION_MESSAGE})
+            continue
+
+        transaction['timestamp'] = datetime.now().timestamp()
+
+        results.append({'status': 201, 'transaction_id': get_transaction_id(transaction)})
+        valid_transactions.append((transaction, results[-1]))
+
+    with node_state.lock:
+        for transaction, result in valid_transactions:
+            if not node_state.mempool.add(transaction):
+                result.update({'status': 409, 'error': 'Transaction is duplicated.'})
+
+        node_state.mark_as_changed()
 
+    if not any(result['status'] == 201 for result in results):
+        return json.dumps(results), 400
 
-@app.route('/blockchain', methods=['GET'])
+    return json.dumps(results), 201
+
+
+@api.route('/blockchain', methods=['GET'])
 def get_blockchain():
-    blockchain = load_blockchain_from_file(miner_account_address)
+    node_state = get_node_state()
 
-    if not blockchain:
-        # If the Blockchain is empty, we initialize it with the genesis block.
-        blockchain.append(create_genesis_block())
-        save_blockchain_into_file(blockchain, miner_account_address)
+    with node_state.lock:
+        etag = node_state.get_blockchain_etag()
+        cache = node_state.serialized_blockchain_cache
+        blockchain = None if cache and cache[0] == etag else node_state.get_blockchain()
 
-    return json.dumps([serialize_block(block) for block in blockchain]), 200
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
 
+    elif blockchain is None:
+        response = Response(cache[1], status=200, mimetype='application/json')
 
-@app.route('/blockchain', methods=['PUT'])
-def update_blockchain():
-    # TODO: HTTP_HOST is not the most secure way to check the provenance.
-    headers = request.headers.environ
+    else:
+        response = Response(stream_blockchain(node_state, blockchain, etag), status=200, mimetype='application/json')
+
+    response.set_etag(etag)
+
+    return response
+
+
+def stream_blockchain(node_state: NodeState, blockchain: List[Block], etag: str) -> Iterator[bytes]:
+    """
+    Serializes the blockchain block by block, so the whole JSON is never built in memory at once. If it isn't
+    too big, it's kept so the next requests can be served without serializing it again.
+
+    The blocks are read while the response is sent, without holding the lock of the node. If the node switches to
+    a fork meanwhile, reading the blockchain raises, so the response is aborted (and nothing is kept) instead of
+    mixing the blocks of both forks under the same ETag.
+    """
+    chunks, size = [], 0
+
+    for idx, block in enumerate(blockchain):
+        chunk = (('[' if idx == 0 else ',') + json.dumps(serialize_block(block))).encode()
 
-    if 'HTTP_HOST' not in headers or not any(headers['HTTP_HOST'] in node_url for node_url in network_nodes_urls):
+        if chunks is not None:
+            chunks.append(chunk)
+            size += len(chunk)
+
+            if size > BLOCKCHAIN_RESPONSE_CACHE_MAX_SIZE_IN_BYTES:
+                chunks = None
+
+        yield chunk
+
+    yield b']'
+
+    if chunks is not None:
+        with node_state.lock:
+            if node_state.get_blockchain_etag() == etag:
+                node_state.serialized_blockchain_cache = (etag, b''.join(chunks) + b']')
+
+
+@api.route('/tip', methods=['GET'])
+def get_tip():
+    node_state = get_node_state()
+
+    with node_state.lock:
+        return json.dumps(load_tip_from_file(node_state.miner_account_address)), 200
+
+
+@api.route('/blocks', methods=['GET'])
+def get_blocks():
+    node_state = get_node_state()
+
+    from_height = request.args.get('from', 0, type=int)
+
+    if from_height < 0:
+        return INVALID_HEIGHT_MESSAGE, 400
+
+    with node_state.lock:
+        if wants_binary_blocks():
+            return Response(
+                load_encoded_blockchain_from_file(node_state.miner_account_address, from_height),
+                status=200, mimetype=BINARY_MIMETYPE)
+
+        return load_serialized_blockchain_from_file(node_state.miner_account_address, from_height), 200
+
+
+@api.route('/headers', methods=['GET'])
+def get_headers():
+    node_state = get_node_state()
+
+    from_height = request.args.get('from', 0, type=int)
+    to_height = request.args.get('to', None, type=int)
+
+    if from_height < 0 or (to_height is not None and to_height < 0):
+        return INVALID_HEIGHT_MESSAGE, 400
+
+    with node_state.lock:
+        return json.dumps(load_block_hashes_from_file(node_state.miner_account_address, from_height, to_height)), 200
+
+
+@api.route('/blocks', methods=['POST'])
+def add_blocks():
+    if not is_known_sender():
         return 'Unknown sender.', 401
 
-    serialized_blockchain = json.loads(request.data)
+    try:
+        blocks = get_posted_blocks(are_posted_blocks_valid)
+        appended = get_node_state().append_blocks(blocks)
+    except UnsupportedVersion as e:
+        return f'{e}', 415
+    except (InvalidEncoding, InvalidBlockchain) as e:
+        return f'Invalid blocks: {e}', 400
+
+    if not appended:
+        return 'The blocks don\'t follow the blockchain of this node, or they don\'t have more work than ours.', 409
 
-    if not is_posted_blockchain_valid(serialized_blockchain):
-        return 'Invalid blockchain.', 400
+    return json.dumps({'height': blocks[-1].index + 1}), 202
 
-    blockchain = unserialize_blockchain(serialized_blockchain)
 
-    save_blockchain_into_file(blockchain, miner_account_address)
+@api.route('/blockchain', methods=['PUT'])
+def update_blockchain():
+    if not is_known_sender():
+        return 'Unknown sender.', 401
 
-    return json.dumps(serialized_blockchain), 202
+    try:
+        blockchain = get_posted_blocks(is_posted_blockchain_valid)
+        get_node_state().replace_blockchain(blockchain)
+    except UnsupportedVersion as e:
+        return f'{e}', 415
+    except (InvalidEncoding, InvalidBlockchain) as e:
+        return f'Invalid blockchain: {e}', 400
 
+    return json.dumps({'height': len(blockchain)}), 202
 
-@app.route('/state', methods=['GET'])
+
+@api.route('/accounts/<account_address>/balance', methods=['GET'])
+def get_account_balance(account_address: str):
+    node_state = get_node_state()
+
+    with node_state.lock:
+        return json.dumps({
+            'address': account_address,
+            'balance': node_state.ledger.get_balance(account_address),
+            'height': node_state.ledger.height
+        }), 200
+
+
+@api.route('/accounts/<account_address>/transactions', methods=['GET'])
+def get_account_transactions(account_address: str):
+    """
+    Transactions of the account (oldest first), `limit` at a time from `offset`. Every transaction includes
+    the index and the hash of its block.
+    """
+    node_state = get_node_state()
+
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', ACCOUNT_TRANSACTIONS_PAGE_SIZE, type=int), 1),
+                ACCOUNT_TRANSACTIONS_MAX_PAGE_SIZE)
+
+    with node_state.lock:
+        blockchain = node_state.get_blockchain()
+        locations = node_state.address_index.get_locations(account_address, offset, limit)
+
+        transactions = [
+            dict(
+                blockchain[height].data['transactions'][position],
+                block_index=height, block_hash=blockchain[height].get_hash())
+            for height, position in locations
+        ]
+
+        return json.dumps({
+            'address': account_address,
+            'total': node_state.address_index.count_transactions(account_address),
+            'offset': offset,
+            'limit': limit,
+            'transactions': transactions
+        }), 200
+
+
+@api.route('/transactions/<transaction_id>/proof', methods=['GET'])
+def get_transaction_proof(transaction_id: str):
+    """
+    Proof that the transaction is in the blockchain, which can be checked without the rest of the blockchain:
+    the Merkle branch that links the transaction to the Merkle root of its block, and the headers of the block and
+    of the ones mined after it (`headers` of them, at most).
+    """
+    node_state = get_node_state()
+
+    number_of_headers = min(max(request.args.get('headers', MERKLE_PROOF_HEADERS, type=int), 1),
+                            MERKLE_PROOF_MAX_HEADERS)
+
+    with node_state.lock:
+        location = node_state.address_index.get_transaction_location(transaction_id)
+
+        if location is None:
+            return 'The transaction isn\'t in the blockchain (yet).', 404
+
+        height, position = location
+        blockchain = node_state.get_blockchain()
+        transactions = blockchain[height].data['transactions']
+
+        return json.dumps({
+            'transaction_id': transaction_id,
+            'transaction': transactions[position],
+            'block_index': height,
+            'position': position,
+            'merkle_branch': [
+                {'hash': sibling.hex(), 'side': 'right' if is_on_the_right else 'left'}
+                for sibling, is_on_the_right in get_merkle_branch(transactions, position)
+            ],
+            'headers': [block.get_header().hex() for block in blockchain[height:height + number_of_headers]],
+            'height': len(blockchain)
+        }), 200
+
+
+@api.route('/state', methods=['GET'])
 def get_state():
-    return json.dumps(load_state_from_file(miner_account_address)), 200
+    return json.dumps(get_node_state().get_state()), 200
+
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Metrics of the node and of its miner (which runs in the same process), in the text format of Prometheus.
+    """
+    node_state = get_node_state()
+
+    with node_state.lock:
+        state = node_state.state
+
+        BLOCKCHAIN_HEIGHT.set(len(node_state.blockchain))
+        TRANSACTIONS.set(len(node_state.mempool), status='pending')
+        TRANSACTIONS.set(len(state['failing_transactions']), status='failing')
+        TRANSACTIONS.set(len(state['verified_transactions']), status='verified')
+        CURRENTLY_MINING.set(state['currently_mining'])
+        DIFFICULTY_LEVEL.set(state['difficulty_level_for_last_block_mined'])
+
+    return Response(default_registry.render(), status=200, content_type=CONTENT_TYPE)
@@ -0,0 +1,325 @@
+import atexit
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+from .address_index import AddressIndex
+from .block import Block
+from .chain import BlockCache, LazyBlockchain
+from .constants import STATE_PERSISTENCE_INTERVAL_IN_SECONDS, MEMPOOL_PERSISTENCE_INTERVAL_IN_SECONDS
+from .mempool import Mempool
+from .utils import (
+    create_genesis_block,
+    get_block_store, save_blockchain_into_file, append_blocks_into_file,
+    load_state_from_file, save_state_into_file,
+    load_mempool_from_file, save_mempool_into_file,
+    load_ledger_from_file, save_ledger_into_file,
+    load_address_index_from_file, save_address_index_into_file, append_address_index_changes_into_file)
+from .validation import validate_blocks, validate_blockchain_update, get_balances_at_height, get_work
+
+
+class NodeState:
+    """
+    Everything a node knows (its blockchain, the balances of the accounts and the state of the miner), shared
+    in memory by the HTTP server and the miner, which run in the same process.
+
+    Any change must be done while holding `lock`. Blocks are written to the block store straight away (appending
+    them is cheap), while the state and the balances are written to disk by a background thread shortly after they
+    change (see `mark_as_changed`). The pending transactions are written by the same thread, but less often.
+    """
+
+    def __init__(self, miner_account_address: str, node_url: str, network_nodes_urls: List[str]) -> None:
+        self.miner_account_address = miner_account_address
+        self.node_url = node_url
+        self.network_nodes_urls = network_nodes_urls
+
+        self.lock = threading.RLock()
+        # Notified whenever something changes (e.g., a new transaction or a new block), so the miner can wake up.
+        self.activity = threading.Condition(self.lock)
+
+        self.state = load_state_from_file(miner_account_address)
+        # The pending transactions are kept in the mempool, which is saved in its own file (older nodes saved them
+        # in the state).
+        self.mempool = Mempool(load_mempool_from_file(
+            miner_account_address, default=self.state.pop('pending_transactions', [])))
+        self.ledger = load_ledger_from_file(miner_account_address)
+
+        self.block_store = get_block_store(miner_account_address)
+        if not len(self.block_store):
+            # If the Blockchain is empty, we initialize it with the genesis block.
+            save_blockchain_into_file([create_genesis_block()], miner_account_address)
+
+        # Blocks are only read from disk when they are needed (mostly, the last ones).
+        self.block_cache = BlockCache()
+        self.blockchain = LazyBlockchain(self.block_store, cache=self.block_cache)
+
+        self.ledger.sync(self.blockchain)
+
+        # Like the ledger, it's saved to disk, so only the blocks added after it was saved are read again.
+        serialized_address_index, address_index_changes = load_address_index_from_file(miner_account_address)
+        if serialized_address_index:
+            self.address_index = AddressIndex.from_dict(serialized_address_index)
+            self.address_index.apply_changes(address_index_changes)
+        else:
+            self.address_index = AddressIndex()
+        self.address_index.sync(self.blockchain)
+
+        # (ETag, JSON) of the last blockchain served by `GET /blockchain`. It's discarded when the blockchain changes.
+        self.serialized_blockchain_cache = None
+
+        # Events of the miners working on top of a tip (event -> hash of the tip), see `watch_tip`.
+        self._tip_watchers: Dict[threading.Event, str] = {}
+
+        self._changed = threading.Event()
+        self._persisting_thread = None
+        # The changes of the address index must be written in order, so only one thread writes the files at a time.
+        self._persist_lock = threading.Lock()
+        # Version of the mempool that was written to disk the last time (see `persist_mempool`).
+        self._persisted_mempool_version = self.mempool.version
+
+
+    def get_blockchain(self) -> LazyBlockchain:
+        """
+        :return: the current blockchain (it cannot be modified, so it doesn't change if the node switches
+            to another blockchain later on)
+        """
+        with self.lock:
+            return self.blockchain
+
+
+    def get_blockchain_etag(self) -> str:
+        """
+        Identifies the current version of the blockchain (it changes whenever a block is added or replaced).
+        """
+        with self.lock:
+            return f'{len(self.blockchain)}-{self.blockchain[-1].get_hash()}'
+
+
+    def replace_blockchain(self, blockchain: List[Block]) -> None:
+        """
+        :raises InvalidBlockchain: if any of the blocks we don't have yet isn't valid
+        """
+        with self.lock:
+            if self.blockchain and self.blockchain[-1].get_hash() == blockchain[-1].get_hash():
+                return
+
+            validate_blockchain_update(self.blockchain, self.ledger, blockchain)
+
+            try:
+                common_height = save_blockchain_into_file(blockchain, self.miner_account_address)
+            finally:
+                # If the blocks couldn't be written, ours were written back, so the old view cannot read them.
+                self.blockchain = LazyBlockchain(self.block_store, cache=self.block_cache)
+
+            self._notify_tip_watchers()
+            self.ledger.sync(self.blockchain)
+            self.address_index.sync(self.blockchain)
+
+            self.mempool.remove_confirmed(blockchain[common_height:])
+            self.serialized_blockchain_cache = None
+
+            self.mark_as_changed()
+
+
+    def append_blocks(self, blocks: List[Block]) -> bool:
+        """
+        Adds the blocks to the blockchain. If we have other blocks from the height of the first block (i.e., the
+        blocks are a fork), they are only replaced if the new blocks have more work than them.
+
+        :return: False if we don't have the parent of the first block, or the blocks are a fork without more work
+            (so the blocks aren't added)
+        :raises InvalidBlockchain: if any of the blocks isn't valid
+        """
+        with self.lock:
+            height = blocks[0].index
+
+            if height > len(self.blockchain) or (
+                    height > 0 and self.blockchain[height - 1].get_hash() != blocks[0].previous_hash):
+                return False
+
+            # We skip the blocks we already have.
+            while blocks and height < len(self.blockchain) and (
+                    self.blockchain[height].get_hash() == blocks[0].get_hash()):
+                blocks = blocks[1:]
+                height += 1
+
+            if not blocks:
+                return True
+
+            if get_work(blocks) <= get_work(self.blockchain[height:]):
+                return False
+
+            validate_blocks(
+                blocks,
+                self.blockchain[height - 1] if height else None,
+                get_balances_at_height(self.blockchain, self.ledger, height)
+            )
+
+            try:
+                appended = append_blocks_into_file(blocks, self.miner_account_address)
+            finally:
+                # If the blocks couldn't be written, ours were written back, so the old view cannot read them.
+                self.blockchain = LazyBlockchain(self.block_store, cache=self.block_cache)
+
+            if not appended:
+                return False
+
+            self._notify_tip_watchers()
+            self.ledger.sync(self.blockchain)
+            self.address_index.sync(self.blockchain)
+
+            self.mempool.remove_confirmed(blocks)
+            self.serialized_blockchain_cache = None
+
+            self.mark_as_changed()
+
+        return True
+
+
+    @contextmanager
+    def watch_tip(self, tip_hash: str) -> Iterator[threading.Event]:
+        """
+        :return: an event that is set as soon as the tip of the blockchain isn't `tip_hash` anymore (e.g., because
+            another node sent us its blocks), so the miner can stop mining on top of it
+        """
+        tip_changed = threading.Event()
+
+        with self.lock:
+            self._tip_watchers[tip_changed] = tip_hash
+            # It may have changed already.
+            self._notify_tip_watchers()
+
+        try:
+            yield tip_changed
+        finally:
+            with self.lock:
+                del self._tip_watchers[tip_changed]
+
+
+    def get_state(self) -> Dict:
+        """
+        :return: a copy of the state. The pending transactions aren't included (there can be many of them), only
+            how many there are.
+        """
+        with self.lock:
+            return dict(self._copy_state(), pending_transactions_count=len(self.mempool))
+
+
+    def get_mining_info(self) -> Dict:
+        """
+        :return: what the miners need to know about the last block this node mined
+        """
+        with self.lock:
+            return {
+                key: self.state[key] for key in (
+                    'idx_last_block_mined', 'difficulty_level_for_last_block_mined', 'mining_time_for_last_block_mined')
+            }
+
+
+    def mark_as_changed(self) -> None:
+        """
+        Lets the background thread know that the state or the balances need to be written to disk, and wakes up
+        the miner (see `node_miner.run_miner`).
+        """
+        self._changed.set()
+
+        with self.lock:
+            self.activity.notify_all()
+
+
+    def _notify_tip_watchers(self) -> None:
+        tip_hash = self.blockchain[-1].get_hash()
+
+        for tip_changed, watched_tip_hash in self._tip_watchers.items():
+            if watched_tip_hash != tip_hash:
+                tip_changed.set()
+
+
+    def _copy_state(self) -> Dict:
+        # The lists keep changing, so they are copied too (their transactions never change).
+        return {key: list(value) if isinstance(value, list) else value for key, value in self.state.items()}
+
+
+    def persist(self) -> None:
+        with self._persist_lock:
+            with self.lock:
+                self._changed.clear()
+
+                # We take a copy, so the files can be written without blocking the server and the miner.
+                state = self._copy_state()
+                ledger = self.ledger.copy()
+
+                # The address index is only copied (and saved whole) from time to time. Otherwise, we only append
+                # the changes of the blocks added since the last time.
+                checkpoint_needed, address_index_changes = self.address_index.take_changes()
+                address_index = self.address_index.copy() if checkpoint_needed else None
+
+            try:
+                save_state_into_file(state, self.miner_account_address)
+                save_ledger_into_file(ledger, self.miner_account_address)
+
+                if address_index is not None:
+                    save_address_index_into_file(address_index.to_dict(), self.miner_account_address)
+                elif address_index_changes:
+                    append_address_index_changes_into_file(address_index_changes, self.miner_account_address)
+            except BaseException:
+                # The changes we took are lost, so the next time the whole index is saved.
+                with self.lock:
+                    self.address_index.needs_checkpoint = True
+                raise
+
+
+    def persist_mempool(self) -> None:
+        """
+        Writes the pending transactions to disk, if they changed since the last time.
+        """
+        with self.lock:
+            version = self.mempool.version
+
+            if version == self._persisted_mempool_version:
+                return
+
+            # Only the list is built while holding the lock. The transactions are serialized after releasing it.
+            transactions = self.mempool.to_list()
+
+        save_mempool_into_file(transactions, self.miner_account_address)
+        self._persisted_mempool_version = version
+
+
+    def persist_everything(self) -> None:
+        self.persist()
+        self.persist_mempool()
+
+
+    def start_persisting(
+            self,
+            interval_in_seconds: float = STATE_PERSISTENCE_INTERVAL_IN_SECONDS,
+            mempool_interval_in_seconds: float = MEMPOOL_PERSISTENCE_INTERVAL_IN_SECONDS) -> None:
+        def persist_changes():
+            mempool_persisted_at = time.monotonic()
+
+            while True:
+                # We wake up from time to time even if nothing else changed, so the mempool gets saved.
+                changed = self._changed.wait(mempool_interval_in_seconds)
+
+                try:
+                    if changed:
+                        self.persist()
+
+                    if time.monotonic() - mempool_persisted_at >= mempool_interval_in_seconds:
+                        self.persist_mempool()
+                        mempool_persisted_at = time.monotonic()
+
+                except OSError as e:
+                    print(f'The state couldn\'t be saved: {e}')
+                    sys.stdout.flush()
+
+                # Changes made in the meantime are saved together in the next iteration.
+                time.sleep(interval_in_seconds)
+
+        self._persisting_thread = threading.Thread(target=persist_changes, name='persistence', daemon=True)
+        self._persisting_thread.start()
+
+        atexit.register(self.persist_everything)
@@ -0,0 +1,120 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, List, Optional, Tuple
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .constants import (
+    PEER_CONNECT_TIMEOUT_IN_SECONDS, PEER_READ_TIMEOUT_IN_SECONDS,
+    PEER_ROUND_TIMEOUT_IN_SECONDS, PEER_MAX_CONCURRENT_REQUESTS)
+from .metrics import Counter, Histogram
+from .tracing import tracer
+
+
+PEER_REQUEST_SECONDS = Histogram(
+    'simplecoin_peer_request_seconds', 'Time spent in requests to other nodes.', ['peer', 'path'])
+PEER_REQUEST_ERRORS = Counter(
+    'simplecoin_peer_request_errors_total', 'Requests to other nodes that failed.', ['peer', 'error'])
+
+
+class PeerClient:
+    """
+    Talks to the other nodes of the network.
+
+    All the requests go through the same `requests.Session`, so the connections to every node are kept alive and
+    reused between rounds, and all of them have a timeout, so a node that doesn't answer cannot block the miner.
+    `fan_out` sends the same request to all the nodes at the same time.
+    """
+
+    def __init__(
+            self,
+            connect_timeout: float = PEER_CONNECT_TIMEOUT_IN_SECONDS,
+            read_timeout: float = PEER_READ_TIMEOUT_IN_SECONDS,
+            round_timeout: float = PEER_ROUND_TIMEOUT_IN_SECONDS,
+            max_concurrent_requests: int = PEER_MAX_CONCURRENT_REQUESTS) -> None:
+        self.timeout = (connect_timeout, read_timeout)
+        self.round_timeout = round_timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_concurrent_requests, pool_maxsize=max_concurrent_requests)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent_requests, thread_name_prefix='peer')
+
+
+    def request(self, method: str, node_url: str, path: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+
+        with PEER_REQUEST_SECONDS.time(peer=node_url, path=path):
+            try:
+                r = self.session.request(method, urljoin(node_url, path), **kwargs)
+            except requests.exceptions.RequestException as e:
+                PEER_REQUEST_ERRORS.inc(peer=node_url, error=type(e).__name__)
+                raise
+
+        if r.status_code >= 500:
+            PEER_REQUEST_ERRORS.inc(peer=node_url, error=f'HTTP {r.status_code}')
+
+        tracer.count_bytes(len(kwargs.get('data') or b''), len(r.content))
+
+        return r
+
+
+    def get(self, node_url: str, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', node_url, path, **kwargs)
+
+
+    def post(self, node_url: str, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', node_url, path, **kwargs)
+
+
+    def put(self, node_url: str, path: str, **kwargs) -> requests.Response:
+        return self.request('PUT', node_url, path, **kwargs)
+
+
+    def fan_out(
+            self,
+            network_nodes_urls: List[str],
+            fn: Callable[[str], Any],
+            round_timeout: Optional[float] = None) -> List[Tuple[str, Any, Optional[Exception]]]:
+        """
+        Calls `fn(node_url)` for all the nodes at the same time.
+
+        :param network_nodes_urls: nodes to contact
+        :param fn: function that talks to one node and returns whatever we need from it
+        :param round_timeout: seconds to wait for all the nodes (the ones that don't answer in time are skipped)
+        :return: (node_url, result, error) for every node, in the same order as `network_nodes_urls`.
+            `error` is the exception raised by `fn` (if any).
+        """
+        futures = [self.executor.submit(fn, node_url) for node_url in network_nodes_urls]
+
+        wait(futures, timeout=round_timeout or self.round_timeout)
+
+        results = []
+        for node_url, future in zip(network_nodes_urls, futures):
+            if not future.done():
+                future.cancel()
+                results.append((node_url, None, requests.exceptions.Timeout(f'{node_url} took too long to answer')))
+
+            elif future.exception():
+                results.append((node_url, None, future.exception()))
+
+            else:
+                results.append((node_url, future.result(), None))
+
+        return results
+
+
+def report_peer_error(node_url: str, error: Exception) -> None:
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        print(f'{node_url} not available at this moment')
+    else:
+        print(f'{node_url} is faulty. Please investigate. ({error!r})')
+
+    sys.stdout.flush()
+
+
+peer_client = PeerClient()
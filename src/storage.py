@@ -0,0 +1,329 @@
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from .constants import BLOCK_STORE_SEGMENT_SIZE_IN_BYTES, BLOCK_STORE_FSYNC_BATCH_SIZE
+
+
+# Segment number, offset inside the segment, length of the record, hash of the block and cumulative work of the
+# blockchain up to the block (as a 128 bits integer).
+INDEX_RECORD_FORMAT = struct.Struct('>IQI32s16s')
+MAX_CUMULATIVE_WORK = 2 ** 128 - 1
+
+
+class BlockStore:
+    """
+    Append-only storage for the blocks of a blockchain.
+
+    Blocks are appended to segment files (a new one is started when the current one reaches `segment_size` bytes),
+    and `index.dat` keeps one fixed-size record per height pointing to the position of the block inside its segment.
+    This way appending a block doesn't rewrite anything, and any block can be read without parsing the others.
+
+    The store doesn't care about the format of the blocks: it stores and returns the bytes it is given.
+    """
+
+    def __init__(
+            self,
+            path: Path,
+            segment_size: int = BLOCK_STORE_SEGMENT_SIZE_IN_BYTES,
+            fsync_batch_size: int = BLOCK_STORE_FSYNC_BATCH_SIZE) -> None:
+        self.path = Path(path)
+        self.segment_size = segment_size
+        self.fsync_batch_size = fsync_batch_size
+
+        self.lock = threading.RLock()
+
+        if not self.path.exists():
+            self.path.mkdir(parents=True)
+
+        self._index_file = open(self.path / 'index.dat', 'ab+')
+        self._segment_file = None
+        self._segment_number = 0
+        self._unsynced_appends = 0
+        # Height of every truncation, so readers can tell if the blocks they are reading were removed.
+        self._truncations = []
+
+        self._recover()
+
+
+    def __len__(self) -> int:
+        return self._height
+
+
+    @property
+    def generation(self) -> int:
+        """
+        Number of times blocks have been removed from the store (it never decreases).
+        """
+        return len(self._truncations)
+
+
+    def has_blocks_of(self, height: int, generation: int) -> bool:
+        """
+        :return: True if the first `height` blocks are still the ones the store had when its generation was
+            `generation` (i.e., none of them has been removed since then, even if it was written back later)
+        """
+        with self.lock:
+            return height <= self._height and all(
+                truncation_height >= height for truncation_height in self._truncations[generation:])
+
+
+    def append(self, block_hash: str, record: bytes, work: int = 0) -> None:
+        """
+        :param block_hash: hash of the block
+        :param record: the block, already serialized
+        :param work: amount of work needed to mine the block (it is added to the cumulative work of the blockchain)
+        :raises ValueError: if the cumulative work doesn't fit in the index (nothing is written then)
+        """
+        with self.lock:
+            cumulative_work = self.get_cumulative_work(self._height - 1) + work if self._height else work
+
+            if not 0 <= cumulative_work <= MAX_CUMULATIVE_WORK:
+                raise ValueError(f'The cumulative work of block {self._height} doesn\'t fit in the index.')
+
+            segment_number, end_of_last_record = self._end
+
+            if end_of_last_record and end_of_last_record + len(record) > self.segment_size:
+                segment_number, end_of_last_record = segment_number + 1, 0
+
+            segment_file = self._get_segment_file(segment_number)
+            segment_file.write(record)
+
+            self._index_file.write(INDEX_RECORD_FORMAT.pack(
+                segment_number, end_of_last_record, len(record), bytes.fromhex(block_hash),
+                cumulative_work.to_bytes(16, 'big')))
+
+            self._height += 1
+            self._end = (segment_number, end_of_last_record + len(record))
+            self._unsynced_appends += 1
+
+            if self._unsynced_appends >= self.fsync_batch_size:
+                self.flush()
+
+
+    def read(self, height: int) -> bytes:
+        with self.lock:
+            if not 0 <= height < self._height:
+                raise IndexError(f'There is no block at height {height}')
+
+            segment_number, offset, length, _, _ = self._read_index_record(height)
+            self._flush_buffers()
+
+        with open(self._get_segment_path(segment_number), 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+
+    def read_range(self, start: int = 0, stop: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Reads the blocks from `start` to `stop` (excluded) sequentially, opening every segment only once.
+        """
+        with self.lock:
+            stop = self._height if stop is None else min(stop, self._height)
+            records = [self._read_index_record(height) for height in range(start, stop)]
+            self._flush_buffers()
+
+        segment_file, segment_number_opened = None, None
+
+        try:
+            for segment_number, offset, length, _, _ in records:
+                if segment_number != segment_number_opened:
+                    if segment_file:
+                        segment_file.close()
+
+                    segment_file = open(self._get_segment_path(segment_number), 'rb')
+                    segment_number_opened = segment_number
+
+                segment_file.seek(offset)
+                yield segment_file.read(length)
+        finally:
+            if segment_file:
+                segment_file.close()
+
+
+    def get_hash(self, height: int) -> str:
+        with self.lock:
+            if not 0 <= height < self._height:
+                raise IndexError(f'There is no block at height {height}')
+
+            return self._read_index_record(height)[3].hex()
+
+
+    def get_cumulative_work(self, height: int) -> int:
+        """
+        :return: the work needed to mine all the blocks up to (and including) `height`
+        """
+        with self.lock:
+            if not 0 <= height < self._height:
+                raise IndexError(f'There is no block at height {height}')
+
+            return int.from_bytes(self._read_index_record(height)[4], 'big')
+
+
+    def truncate(self, height: int) -> None:
+        """
+        Removes all the blocks after `height` (so only the first `height` blocks remain), e.g., to replace
+        them with the blocks of a fork.
+        """
+        with self.lock:
+            if height >= self._height:
+                return
+
+            if height > 0:
+                segment_number, offset, length, _, _ = self._read_index_record(height - 1)
+                self._truncate_segments(segment_number, offset + length)
+            else:
+                self._truncate_segments(0, 0)
+
+            self._flush_buffers()
+            self._index_file.truncate(height * INDEX_RECORD_FORMAT.size)
+            self._height = height
+            self._truncations.append(height)
+
+            self.flush()
+
+
+    def replace(self, height: int, blocks: List[Tuple[str, bytes, int]]) -> None:
+        """
+        Replaces the blocks after `height` with `blocks`, as `truncate` and `append` would. If writing any of them
+        fails, the blocks that were there are written back, so the store is left as it was.
+
+        :param blocks: (hash, record, work) of every new block, already serialized
+        :raises ValueError: if the cumulative work of the new blocks doesn't fit in the index (nothing is changed then)
+        """
+        with self.lock:
+            cumulative_work_at_height = self.get_cumulative_work(height - 1) if height else 0
+
+            cumulative_work = cumulative_work_at_height
+            for _, _, work in blocks:
+                cumulative_work += work
+
+                if not 0 <= cumulative_work <= MAX_CUMULATIVE_WORK:
+                    raise ValueError('The cumulative work of the blocks doesn\'t fit in the index.')
+
+            # We keep the blocks that are going to be removed, in case we need to put them back.
+            replaced_blocks = []
+            cumulative_work = cumulative_work_at_height
+            for replaced_height, record in enumerate(self.read_range(height), start=height):
+                work = self.get_cumulative_work(replaced_height) - cumulative_work
+                replaced_blocks.append((self.get_hash(replaced_height), record, work))
+                cumulative_work += work
+
+            self.truncate(height)
+
+            try:
+                for block_hash, record, work in blocks:
+                    self.append(block_hash, record, work)
+
+                self.flush()
+
+            except BaseException:
+                self.truncate(height)
+
+                for block_hash, record, work in replaced_blocks:
+                    self.append(block_hash, record, work)
+
+                self.flush()
+                raise
+
+
+    def flush(self) -> None:
+        """
+        Makes sure that everything appended so far is written to disk.
+        """
+        with self.lock:
+            self._flush_buffers()
+
+            for f in (self._segment_file, self._index_file):
+                if f:
+                    os.fsync(f.fileno())
+
+            self._unsynced_appends = 0
+
+
+    def close(self) -> None:
+        with self.lock:
+            self.flush()
+
+            if self._segment_file:
+                self._segment_file.close()
+                self._segment_file = None
+
+            self._index_file.close()
+
+
+    def _flush_buffers(self) -> None:
+        for f in (self._segment_file, self._index_file):
+            if f:
+                f.flush()
+
+
+    def _read_index_record(self, height: int) -> (int, int, int, bytes):
+        self._index_file.flush()
+        self._index_file.seek(height * INDEX_RECORD_FORMAT.size)
+
+        return INDEX_RECORD_FORMAT.unpack(self._index_file.read(INDEX_RECORD_FORMAT.size))
+
+
+    def _get_segment_path(self, segment_number: int) -> Path:
+        return self.path / f'segment-{segment_number:06d}.dat'
+
+
+    def _get_segment_file(self, segment_number: int):
+        if self._segment_file is None or self._segment_number != segment_number:
+            if self._segment_file:
+                self._segment_file.flush()
+                os.fsync(self._segment_file.fileno())
+                self._segment_file.close()
+
+            self._segment_file = open(self._get_segment_path(segment_number), 'ab')
+            self._segment_number = segment_number
+
+        return self._segment_file
+
+
+    def _truncate_segments(self, segment_number: int, size: int) -> None:
+        """
+        Cuts the segment `segment_number` at `size` bytes and removes all the segments after it.
+        """
+        if self._segment_file:
+            self._segment_file.close()
+            self._segment_file = None
+
+        self._end = (segment_number, size)
+        segment_path = self._get_segment_path(segment_number)
+
+        if segment_path.exists():
+            os.truncate(segment_path, size)
+
+        next_segment_number = segment_number + 1
+        while self._get_segment_path(next_segment_number).exists():
+            self._get_segment_path(next_segment_number).unlink()
+            next_segment_number += 1
+
+
+    def _recover(self) -> None:
+        """
+        Discards whatever a crash could have left half-written: incomplete index records, index records pointing
+        to data that never reached the segment, and data in the segments that isn't in the index.
+        Only the last records are checked, so opening a store doesn't depend on the length of the blockchain.
+        """
+        index_size = os.path.getsize(self.path / 'index.dat')
+        self._height = index_size // INDEX_RECORD_FORMAT.size
+
+        while self._height > 0:
+            segment_number, offset, length, _, _ = self._read_index_record(self._height - 1)
+            segment_path = self._get_segment_path(segment_number)
+
+            if segment_path.exists() and os.path.getsize(segment_path) >= offset + length:
+                self._truncate_segments(segment_number, offset + length)
+                break
+
+            self._height -= 1
+        else:
+            self._truncate_segments(0, 0)
+
+        if index_size != self._height * INDEX_RECORD_FORMAT.size:
+            self._index_file.truncate(self._height * INDEX_RECORD_FORMAT.size)
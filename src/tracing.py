@@ -0,0 +1,150 @@
+import cProfile
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+
+class Tracer:
+    """
+    Records every stage (span) of the mining rounds: its wall time, the CPU time of the miner thread (the Proof of Work
+    workers run in other processes, so their CPU time isn't included), the bytes exchanged with other nodes and
+    whatever the stage adds (e.g., number of transactions). Every round is written as a Chrome trace, which can be
+    opened in chrome://tracing or https://ui.perfetto.dev.
+
+    A fraction of the rounds (`profile_sample_rate`) can also be profiled with cProfile, next to their traces.
+    Tracing is disabled if there is no `output_dir`.
+    """
+
+    def __init__(self, output_dir: Optional[str] = None, profile_sample_rate: float = 0.0) -> None:
+        self.output_dir = Path(output_dir) if output_dir else None
+        self.profile_sample_rate = profile_sample_rate
+
+        self._rounds = itertools.count()
+        # Spans of the round that the current thread is running (None if there isn't one).
+        self._local = threading.local()
+
+        # Bytes sent to (and received from) other nodes, by any thread, since the node started.
+        self._bytes_lock = threading.Lock()
+        self._bytes_sent = 0
+        self._bytes_received = 0
+
+
+    @property
+    def enabled(self) -> bool:
+        return self.output_dir is not None
+
+
+    def count_bytes(self, sent: int, received: int) -> None:
+        if not self.enabled:
+            return
+
+        with self._bytes_lock:
+            self._bytes_sent += sent
+            self._bytes_received += received
+
+
+    @contextmanager
+    def round(self, name: str) -> Iterator[Dict]:
+        """
+        Traces everything the current thread does until the end of the block, as a span called `name` (with the
+        spans of its stages inside), and writes it to a file.
+        """
+        if not self.enabled:
+            yield {}
+            return
+
+        round_number = next(self._rounds)
+        events = []
+        self._local.events = events
+
+        profile = cProfile.Profile() if random.random() < self.profile_sample_rate else None
+
+        try:
+            with self.span(name) as args:
+                if profile:
+                    profile.enable()
+
+                try:
+                    yield args
+                finally:
+                    if profile:
+                        profile.disable()
+        finally:
+            self._local.events = None
+            self.write(f'{name}-{os.getpid()}-{round_number:06d}', events, profile)
+
+
+    @contextmanager
+    def span(self, name: str, **args) -> Iterator[Dict]:
+        """
+        :return: the arguments of the span, so the stage can add its own (e.g., the size of what it handled)
+        """
+        events = getattr(self._local, 'events', None)
+
+        if events is None:
+            yield args
+            return
+
+        timestamp = time.time()
+        start, cpu_start = time.perf_counter(), time.thread_time()
+        bytes_sent, bytes_received = self.get_bytes()
+
+        try:
+            yield args
+        except Exception as e:
+            args['error'] = repr(e)
+            raise
+        finally:
+            wall_time, cpu_time = time.perf_counter() - start, time.thread_time() - cpu_start
+            total_bytes_sent, total_bytes_received = self.get_bytes()
+
+            events.append({
+                'name': name,
+                'cat': 'mine',
+                'ph': 'X',
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                # Microseconds
+                'ts': timestamp * 1e6,
+                'dur': wall_time * 1e6,
+                'tts': cpu_start * 1e6,
+                'tdur': cpu_time * 1e6,
+                'args': dict(
+                    args,
+                    wall_time_in_ms=wall_time * 1e3,
+                    cpu_time_in_ms=cpu_time * 1e3,
+                    bytes_sent=total_bytes_sent - bytes_sent,
+                    bytes_received=total_bytes_received - bytes_received)
+            })
+
+
+    def get_bytes(self) -> (int, int):
+        with self._bytes_lock:
+            return self._bytes_sent, self._bytes_received
+
+
+    def write(self, filename: str, events: List[Dict], profile: Optional[cProfile.Profile]) -> None:
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+
+            with open(self.output_dir / f'{filename}.json', 'w') as f:
+                f.write(json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'}))
+
+            if profile:
+                profile.dump_stats(str(self.output_dir / f'{filename}.prof'))
+
+        except OSError as e:
+            print(f'The trace couldn\'t be saved: {e}')
+            sys.stdout.flush()
+
+
+# Tracing of the miner is enabled by setting "MINER_TRACE_DIR" (where traces are written).
+# "MINER_PROFILE_SAMPLE_RATE" is the fraction of the rounds that are also profiled (e.g., 0.1).
+tracer = Tracer(os.getenv('MINER_TRACE_DIR'), float(os.getenv('MINER_PROFILE_SAMPLE_RATE', 0)))
@@ -0,0 +1,188 @@
+import threading
+from array import array
+from collections.abc import Sequence
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+
+# Flags of every transaction, so it can be given back exactly as it was (the ID of a transaction
+# depends on whether its amount is `10` or `10.0`).
+AMOUNT_IS_INT = 1
+TIMESTAMP_IS_INT = 2
+HAS_TIMESTAMP = 4
+
+MAX_EXACT_INT = 2 ** 53
+TRANSACTION_KEYS = {'from', 'to', 'amount', 'timestamp'}
+
+
+class AddressTable:
+    """
+    Gives every address a number, so each address is kept in memory only once, no matter how many
+    transactions use it.
+    """
+
+    def __init__(self) -> None:
+        self.addresses: List[str] = []
+        self.address_ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+
+    def get_id(self, address: str) -> int:
+        address_id = self.address_ids.get(address)
+
+        if address_id is None:
+            with self._lock:
+                address_id = self.address_ids.get(address)
+
+                if address_id is None:
+                    address_id = len(self.addresses)
+                    self.addresses.append(address)
+                    self.address_ids[address] = address_id
+
+        return address_id
+
+
+    def get_address(self, address_id: int) -> str:
+        return self.addresses[address_id]
+
+
+# Shared by all the transaction tables of the process.
+address_table = AddressTable()
+
+
+class TransactionTable(Sequence):
+    """
+    Transactions of a block, stored column by column in typed arrays (about 25 bytes per transaction, instead of
+    a dict with its own strings and floats).
+
+    It can be used as the list of transactions of a block: indexing it, or iterating over it, gives dicts with the
+    same keys and values as the original transactions. It cannot be modified.
+    """
+
+    __slots__ = ('_flags', '_from_ids', '_to_ids', '_amounts', '_timestamps')
+
+    def __init__(self) -> None:
+        self._flags = array('B')
+        self._from_ids = array('I')
+        self._to_ids = array('I')
+        self._amounts = array('d')
+        self._timestamps = array('d')
+
+
+    @classmethod
+    def from_transactions(cls, transactions: Iterable[Dict]) -> 'TransactionTable':
+        """
+        :raises ValueError: if any transaction cannot be stored without losing anything (e.g., it has unknown keys)
+        """
+        table = cls()
+
+        for tx in transactions:
+            if not isinstance(tx, dict) or not ({'from', 'to', 'amount'} <= tx.keys() <= TRANSACTION_KEYS):
+                raise ValueError('The transaction has unknown fields.')
+
+            if not isinstance(tx['from'], str) or not isinstance(tx['to'], str):
+                raise ValueError('Addresses must be strings.')
+
+            table.append_row(
+                get_transaction_flags(tx),
+                address_table.get_id(tx['from']),
+                address_table.get_id(tx['to']),
+                tx['amount'],
+                tx.get('timestamp', 0.0)
+            )
+
+        return table
+
+
+    def append_row(self, flags: int, from_id: int, to_id: int, amount: float, timestamp: float) -> None:
+        self._flags.append(flags)
+        self._from_ids.append(from_id)
+        self._to_ids.append(to_id)
+        self._amounts.append(amount)
+        self._timestamps.append(timestamp)
+
+
+    def rows(self) -> Iterator[Tuple[int, int, int, float, float]]:
+        """
+        :return: (flags, from address ID, to address ID, amount, timestamp) of every transaction
+        """
+        return zip(self._flags, self._from_ids, self._to_ids, self._amounts, self._timestamps)
+
+
+    def __len__(self) -> int:
+        return len(self._flags)
+
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+
+        return make_transaction(
+            self._flags[idx], self._from_ids[idx], self._to_ids[idx], self._amounts[idx], self._timestamps[idx])
+
+
+    def __iter__(self) -> Iterator[Dict]:
+        return (make_transaction(*row) for row in self.rows())
+
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (list, TransactionTable)):
+            return NotImplemented
+
+        return list(self) == list(other)
+
+
+    def __repr__(self) -> str:
+        return f'TransactionTable({list(self)!r})'
+
+
+def make_transaction(flags: int, from_id: int, to_id: int, amount: float, timestamp: float) -> Dict:
+    tx = {
+        'from': address_table.addresses[from_id],
+        'to': address_table.addresses[to_id],
+        'amount': int(amount) if flags & AMOUNT_IS_INT else amount
+    }
+
+    if flags & HAS_TIMESTAMP:
+        tx['timestamp'] = int(timestamp) if flags & TIMESTAMP_IS_INT else timestamp
+
+    return tx
+
+
+def get_transaction_flags(tx: Dict) -> int:
+    """
+    :raises ValueError: if the amount or the timestamp aren't numbers that fit in a float
+    """
+    amount = tx['amount']
+    timestamp = tx.get('timestamp', 0.0)
+
+    flags = HAS_TIMESTAMP if 'timestamp' in tx else 0
+
+    if type(amount) is float and type(timestamp) is float:
+        # The usual case.
+        return flags
+
+    for number, int_flag in ((amount, AMOUNT_IS_INT), (timestamp, TIMESTAMP_IS_INT)):
+        if isinstance(number, bool) or not isinstance(number, (int, float)):
+            raise ValueError('The amount and the timestamp of a transaction must be numbers.')
+
+        if isinstance(number, int):
+            if abs(number) > MAX_EXACT_INT:
+                raise ValueError('A number of a transaction is too big.')
+            flags |= int_flag
+
+    return flags
+
+
+def compact_block_data(data: Dict) -> Dict:
+    """
+    Replaces the list of transactions of a block by a `TransactionTable` (if all of them can be stored in it).
+    """
+    transactions = data.get('transactions')
+
+    if isinstance(transactions, list):
+        try:
+            data['transactions'] = TransactionTable.from_transactions(transactions)
+        except ValueError:
+            pass
+
+    return data
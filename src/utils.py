@@ -1,25 +1,48 @@
 import copy
+import hashlib as hasher
+import math
 import os
+import threading
 import time
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 
 import requests
 import json
 import sys
 
-from urllib.parse import urljoin
 from datetime import datetime
 
-from .constants import PROOF_OF_WORK_TARGET_TIME_IN_SECONDS, DEFAULT_PROOF_OF_WORK_DIFFICULTY_LEVEL
+from .constants import (
+    PROOF_OF_WORK_TARGET_TIME_IN_SECONDS, DEFAULT_PROOF_OF_WORK_DIFFICULTY_LEVEL, MIN_PROOF_OF_WORK_DIFFICULTY_LEVEL,
+    MAX_PROOF_OF_WORK_DIFFICULTY_LEVEL, GENESIS_BLOCK_TIMESTAMP,
+    SYNC_HEADERS_WINDOW)
 from .block import Block
+from .codec import (
+    BINARY_MIMETYPE, JSON_MIMETYPE, serialize_block,
+    encode_block_or_json, encode_blocks, decode_block, decode_blocks, join_encoded_blocks)
+from .ledger import Ledger
+from .transactions import compact_block_data
+from .storage import BlockStore
+from .metrics import Histogram
+from .mining import find_nonce
+from .peers import peer_client, report_peer_error
+
+
+# Block stores opened by this process (one per miner account address).
+block_stores = {}
+
+# We prefer the binary format for blocks, but nodes that don't know it answer with JSON.
+ACCEPT_BLOCKS = f'{BINARY_MIMETYPE}, {JSON_MIMETYPE};q=0.5'
+
+STORAGE_SECONDS = Histogram(
+    'simplecoin_storage_seconds', 'Time spent reading and writing the files of the node.', ['operation'])
 
 
 def create_genesis_block() -> Block:
-    now = datetime.now()
     return Block(
         0,
-        now.timestamp(),
+        GENESIS_BLOCK_TIMESTAMP,
         {
             'nonce': 1,
             'transactions': [
@@ -27,11 +50,10 @@ def create_genesis_block() -> Block:
                     'from': 'genesis',
                     'to': 'network',
                     'amount': 1000000000,  # Total amount of funds available in the network: 1000 millions,
-                    'timestamp': now.timestamp()
+                    'timestamp': GENESIS_BLOCK_TIMESTAMP
                 }
             ]
-        },
-        None
+        }
     )
 
 
@@ -39,17 +61,36 @@ def proof_of_work(
         blockchain: List[Block],
         transactions: List[Dict],
         difficulty_level_for_last_time: int = DEFAULT_PROOF_OF_WORK_DIFFICULTY_LEVEL,
-        how_long_it_took_last_time: int = PROOF_OF_WORK_TARGET_TIME_IN_SECONDS) -> (Block, int, int):
+        how_long_it_took_last_time: int = PROOF_OF_WORK_TARGET_TIME_IN_SECONDS,
+        number_of_workers: int = None,
+        cancelled: threading.Event = None) -> (Block, int, int):
+    """
+    :param cancelled: set when the block isn't worth mining anymore (see `mining.find_nonce`)
+    :raises MiningCancelled: if `cancelled` was set before the block was mined
+    """
+    current_difficulty_level = get_difficulty_level(difficulty_level_for_last_time, how_long_it_took_last_time)
+
+    start = time.time()
+    mined_block = create_mined_block(blockchain, transactions, current_difficulty_level, number_of_workers, cancelled)
+
+    end = time.time()
+    return mined_block, current_difficulty_level, end - start
+
+
+def get_difficulty_level(difficulty_level_for_last_time: int, how_long_it_took_last_time: int) -> int:
+    # Blocks with a lower difficulty level would be rejected by the network (e.g., if the last one was mined by an
+    # older node).
+    difficulty_level_for_last_time = max(difficulty_level_for_last_time, MIN_PROOF_OF_WORK_DIFFICULTY_LEVEL)
 
     current_difficulty_level = difficulty_level_for_last_time
     if how_long_it_took_last_time > PROOF_OF_WORK_TARGET_TIME_IN_SECONDS + 10:
-        current_difficulty_level = difficulty_level_for_last_time - 1
+        current_difficulty_level = max(difficulty_level_for_last_time - 1, MIN_PROOF_OF_WORK_DIFFICULTY_LEVEL)
         print(f'Mining was too slow last time ({how_long_it_took_last_time} seconds)... setting difficulty to '
               f'{current_difficulty_level} (Previously was {difficulty_level_for_last_time})')
         sys.stdout.flush()
 
     elif how_long_it_took_last_time < PROOF_OF_WORK_TARGET_TIME_IN_SECONDS - 10:
-        current_difficulty_level = difficulty_level_for_last_time + 1
+        current_difficulty_level = min(difficulty_level_for_last_time + 1, MAX_PROOF_OF_WORK_DIFFICULTY_LEVEL)
         print(f'Mining was too fast last time  ({how_long_it_took_last_time} seconds)... setting difficulty to '
               f'{current_difficulty_level} (Previously was {difficulty_level_for_last_time})')
         sys.stdout.flush()
@@ -58,6 +99,19 @@ def proof_of_work(
               f'{difficulty_level_for_last_time}')
         sys.stdout.flush()
 
+    return current_difficulty_level
+
+
+def create_mined_block(
+        blockchain: List[Block],
+        transactions: List[Dict],
+        difficulty_level: int,
+        number_of_workers: int = None,
+        cancelled: threading.Event = None) -> Block:
+    """
+    :return: a block with the transactions on top of the blockchain, with a nonce that meets the difficulty level
+    :raises MiningCancelled: if `cancelled` was set before the block was mined
+    """
     previous_block = blockchain[-1]
 
     previous_index = previous_block.index
@@ -68,77 +122,136 @@ def proof_of_work(
         datetime.now().timestamp(),
         {
             'nonce': previous_nonce + 1,
+            'difficulty_level': difficulty_level,
             'transactions': transactions
         },
-        previous_block
+        previous_block.get_hash()
     )
 
-    start = time.time()
-    while not (mined_block.get_hash()[:current_difficulty_level] == '0' * current_difficulty_level):
-        mined_block.data['nonce'] += 1
+    mined_block.data['nonce'] = find_nonce(mined_block, difficulty_level, number_of_workers, cancelled=cancelled)
 
-    end = time.time()
-    return mined_block, current_difficulty_level, end - start
+    return mined_block
 
 
-def get_blockchains_from_all_nodes(network_nodes_urls: List[str]) -> List[List[Block]]:
-    blockchains_from_all_nodes = []
+def get_blockchain_from_node(node_url: str, local_blockchain: List[Block]) -> List[Block]:
+    """
+    Gets the blockchain of a node, downloading only the blocks that we don't have locally.
 
-    for node_url in network_nodes_urls:
-        url = urljoin(node_url, 'blockchain')
-        try:
-            r = requests.get(url)
+    First it looks for the last block that both blockchains have in common (by comparing the hashes of the last
+    blocks, and going further back if needed), and then it downloads the blocks after it.
 
-            if r.status_code == 200:
-                serialized_blockchain = json.loads(r.content)
+    :param node_url: node to sync with
+    :param local_blockchain: blockchain that we already have (it isn't modified)
+    :return: the blockchain of the node
+    """
+    window = SYNC_HEADERS_WINDOW
+    to_height = None
 
-                blockchains_from_all_nodes.append(unserialize_blockchain(serialized_blockchain))
-            else:
-                print(f'{node_url} is faulty. Please investigate.')
-                sys.stdout.flush()
+    while True:
+        from_height = max(0, len(local_blockchain) - window)
 
-        except requests.exceptions.ConnectionError:
-            print(f'{node_url} not available at this moment')
-            sys.stdout.flush()
+        r = peer_client.get(node_url, 'headers', params={'from': from_height, 'to': to_height})
+        r.raise_for_status()
+        headers = json.loads(r.content)
 
-    return blockchains_from_all_nodes
+        common_height = None
+        for header in reversed(headers):
+            height = header['index']
+            if height < len(local_blockchain) and local_blockchain[height].get_hash() == header['hash']:
+                common_height = height + 1
+                break
 
+        if common_height is not None or from_height == 0:
+            break
 
-def consensus(network_nodes_urls: List[str]) -> List[Block]:
+        # The fork is older than the blocks we've checked, so we check the previous ones (twice as many every time).
+        to_height = from_height
+        window *= 2
+
+    common_height = common_height or 0
+
+    if common_height == len(local_blockchain) and to_height is None and len(headers) == common_height - from_height:
+        # The node doesn't have any block that we don't have.
+        return local_blockchain
+
+    r = peer_client.get(node_url, 'blocks', params={'from': common_height}, headers={'Accept': ACCEPT_BLOCKS})
+    r.raise_for_status()
+
+    return local_blockchain[:common_height] + get_blocks_from_response(r)
+
+
+def get_blocks_from_response(r: requests.Response) -> List[Block]:
+    if r.headers.get('Content-Type', '').split(';')[0].strip() == BINARY_MIMETYPE:
+        return decode_blocks(r.content)
+
+    return unserialize_blockchain(json.loads(r.content))
+
+
+def get_tips_from_all_nodes(network_nodes_urls: List[str]) -> List[Dict]:
+    tips_from_all_nodes = []
+
+    def get_tip(node_url: str) -> Dict:
+        r = peer_client.get(node_url, 'tip')
+        r.raise_for_status()
+
+        return json.loads(r.content)
+
+    for node_url, tip, error in peer_client.fan_out(network_nodes_urls, get_tip):
+        if error:
+            report_peer_error(node_url, error)
+        else:
+            tips_from_all_nodes.append(dict(tip, node_url=node_url))
+
+    return tips_from_all_nodes
+
+
+def consensus(network_nodes_urls: List[str], local_blockchain: List[Block] = None) -> List[Block]:
     """
     Chooses the blockchain which is in a majority of nodes in the network.
     e.g., 1 Node < 2 Nodes
 
+    Nodes only send the last block of their blockchain (its "tip") to vote. Then, only the blocks of the chosen
+    blockchain that we don't have are downloaded (from one of the nodes that has it).
+    If two blockchains have the same number of votes, the one with more cumulative work wins.
+
     :param network_nodes_urls: list of nodes in the network
+    :param local_blockchain: blockchain we got last time (only the blocks after it are downloaded)
     :return:
     """
-    blockchains_from_all_nodes = get_blockchains_from_all_nodes(network_nodes_urls)
-    if not blockchains_from_all_nodes:
-        raise Exception('This node cannot find other nodes. Make sure that the URLs are correct.')
-
-    blockchains_hashes_counter = {}
+    local_blockchain = local_blockchain or []
 
-    for blockchain_from_a_node in blockchains_from_all_nodes:
+    tips_from_all_nodes = get_tips_from_all_nodes(network_nodes_urls)
+    if not tips_from_all_nodes:
+        raise Exception('This node cannot find other nodes. Make sure that the URLs are correct.')
 
-        if blockchain_from_a_node:
-            last_block_hash = blockchain_from_a_node[-1].get_hash()
+    votes_per_tip_hash = {}
+    cumulative_work_per_tip_hash = {}
 
-            if last_block_hash not in blockchains_hashes_counter:
-                blockchains_hashes_counter[last_block_hash] = 1
-            else:
-                blockchains_hashes_counter[last_block_hash] += 1
+    for tip in tips_from_all_nodes:
+        votes_per_tip_hash[tip['hash']] = votes_per_tip_hash.get(tip['hash'], 0) + 1
+        cumulative_work_per_tip_hash[tip['hash']] = tip['cumulative_work']
 
     # We get the "last hash" of the Blockchain with the most number of "votes".
     # Meaning, the blockchain which is used the most in the network.
+    tip_hash_with_the_most_votes_in_the_network = max(
+        votes_per_tip_hash, key=lambda tip_hash: (votes_per_tip_hash[tip_hash], cumulative_work_per_tip_hash[tip_hash]))
+
+    if local_blockchain and local_blockchain[-1].get_hash() == tip_hash_with_the_most_votes_in_the_network:
+        return local_blockchain
 
-    last_hash_with_the_most_votes_in_the_network = max(blockchains_hashes_counter, key=blockchains_hashes_counter.get)
+    for tip in tips_from_all_nodes:
+        if tip['hash'] != tip_hash_with_the_most_votes_in_the_network:
+            continue
 
-    for blockchain_from_a_node in blockchains_from_all_nodes:
-        if blockchain_from_a_node:
+        try:
+            blockchain = get_blockchain_from_node(tip['node_url'], local_blockchain)
+        except (requests.exceptions.RequestException, ValueError) as error:
+            # We try with the next node that has the same blockchain.
+            report_peer_error(tip['node_url'], error)
+            continue
 
-            # We return the blockchain with the last hash obtained above.
-            if blockchain_from_a_node[-1].get_hash() == last_hash_with_the_most_votes_in_the_network:
-                return blockchain_from_a_node
+        if blockchain and blockchain[-1].get_hash() == tip_hash_with_the_most_votes_in_the_network:
+            return blockchain
 
     raise Exception('Consensus wasn\'t reached')
 
@@ -148,7 +261,8 @@ def mine_coin(
         verified_transactions: List[Dict],
         miner_account_address: str,
         difficulty_level_last_block: int,
-        mining_time_last_block: int
+        mining_time_last_block: int,
+        cancelled: threading.Event = None
 ) -> (Block, int, int):
     transactions = []
 
@@ -170,87 +284,206 @@ def mine_coin(
         })
 
     mined_block, current_difficulty_level, current_mining_time = proof_of_work(
-        blockchain, transactions, difficulty_level_last_block, mining_time_last_block)
+        blockchain, transactions, difficulty_level_last_block, mining_time_last_block, cancelled=cancelled)
 
     return mined_block, current_difficulty_level, current_mining_time
 
 
-def propagate_blockchain_in_network(blockchain: List[Block], network_nodes_urls: List[str], miner_account_address: str) -> None:
-    serialized_blockchain = json.dumps([serialize_block(block) for block in blockchain])
+def propagate_blockchain_in_network(
+        blockchain: List[Block],
+        network_nodes_urls: List[str],
+        miner_account_address: str,
+        from_height: int = 0) -> None:
+    """
+    Sends the blocks from `from_height` to all the nodes in the network. If a node doesn't have the blocks
+    before them, the whole blockchain is sent to it.
+    """
+    encoded_new_blocks = encode_blocks(blockchain[from_height:])
+    headers = {'Miner-Address': miner_account_address, 'Content-Type': BINARY_MIMETYPE}
 
-    for node_url in network_nodes_urls:
-        url = urljoin(node_url, 'blockchain')
+    def send(method: str, node_url: str, path: str, blocks: List[Block], encoded_blocks: bytes) -> requests.Response:
+        r = peer_client.request(method, node_url, path, data=encoded_blocks, headers=headers)
 
-        try:
-            r = requests.put(url, data=serialized_blockchain, headers={'Miner-Address': miner_account_address})
+        if r.status_code == 415:
+            # The node doesn't know this version of the binary format, so we fall back to JSON.
+            serialized_blocks = json.dumps([serialize_block(block) for block in blocks])
+            r = peer_client.request(
+                method, node_url, path, data=serialized_blocks,
+                headers=dict(headers, **{'Content-Type': JSON_MIMETYPE}))
 
-            if r.status_code != 202:
-                print(f'{node_url} is faulty. Please investigate.')
-                sys.stdout.flush()
+        return r
 
-        except requests.exceptions.ConnectionError:
-            print(f'{node_url} not available at this moment')
-            sys.stdout.flush()
+    def send_blocks(node_url: str) -> requests.Response:
+        r = send('POST', node_url, 'blocks', blockchain[from_height:], encoded_new_blocks)
+
+        if r.status_code == 409:
+            r = send('PUT', node_url, 'blockchain', blockchain, encode_blocks(blockchain))
 
+        return r
 
-def serialize_block(block: Block) -> Dict:
-    return {
-        'index': block.index,
-        'timestamp': block.timestamp,
-        'data': block.data,
-        'previous_hash': block.previous_hash
-    }
+    for node_url, r, error in peer_client.fan_out(network_nodes_urls, send_blocks):
+        if error:
+            report_peer_error(node_url, error)
+
+        elif r.status_code != 202:
+            print(f'{node_url} is faulty. Please investigate.')
+            sys.stdout.flush()
 
 
 def unserialize_blockchain(serialized_blockchain: List[Dict]) -> List[Block]:
     unserialized_blockchain = []
 
-    previous_block = None
     for serialized_block in serialized_blockchain:
 
         block = Block(
             serialized_block['index'],
             serialized_block['timestamp'],
-            serialized_block['data'],
-            previous_block=previous_block
+            compact_block_data(serialized_block['data']),
+            previous_hash=serialized_block['previous_hash']
         )
 
         unserialized_blockchain.append(block)
 
-        previous_block = block
-
     return unserialized_blockchain
 
 
-def save_blockchain_into_file(blockchain: List[Block], miner_account_address: str) -> None:
-    miner_folder_path = Path(f'miners/{miner_account_address}')
+def get_block_store(miner_account_address: str) -> BlockStore:
+    """
+    Returns the (already opened) block store of the node.
+    """
+    if miner_account_address not in block_stores:
+        miner_folder_path = Path(f'miners/{miner_account_address}')
 
-    if not miner_folder_path.exists():
-        miner_folder_path.mkdir(parents=True)
+        block_store = BlockStore(miner_folder_path / 'blocks')
 
-    filepath = miner_folder_path / 'blockchain.txt'
+        # Blockchains saved by older nodes (in a single file) are hashed differently and their blocks don't have
+        # a difficulty level, so the network would reject them. We leave the file as it is and start from scratch.
+        legacy_filepath = miner_folder_path / 'blockchain.txt'
+        if legacy_filepath.exists() and not len(block_store):
+            print(f'{legacy_filepath} was saved by an older version and cannot be used anymore (it\'s ignored). '
+                  f'The blockchain will be downloaded from the other nodes.')
+            sys.stdout.flush()
 
-    with open(filepath, 'w') as f:
-        f.write(json.dumps([serialize_block(block) for block in blockchain]))
+        block_stores[miner_account_address] = block_store
 
+    return block_stores[miner_account_address]
 
-def load_blockchain_from_file(miner_account_address: str):
-    miner_folder_path = Path(f'miners/{miner_account_address}')
 
-    if not miner_folder_path.exists():
-        miner_folder_path.mkdir(parents=True)
+@STORAGE_SECONDS.time(operation='save_blockchain_into_file')
+def save_blockchain_into_file(blockchain: List[Block], miner_account_address: str) -> int:
+    """
+    :return: the number of blocks that were already stored (only the blocks after them are written)
+    """
+    block_store = get_block_store(miner_account_address)
 
-    filepath = miner_folder_path / 'blockchain.txt'
+    with block_store.lock:
+        # We look for the last block that we already have, so we only need to write the ones after it.
+        common_height = min(len(block_store), len(blockchain))
+        while common_height > 0 and block_store.get_hash(common_height - 1) != blockchain[common_height - 1].get_hash():
+            common_height -= 1
 
-    if not filepath.exists():
-        return []
+        # Blocks are encoded before anything is removed from the store, so an invalid block cannot leave it half-written.
+        block_store.replace(common_height, encode_blocks_for_store(blockchain[common_height:]))
 
-    with open(filepath, 'r') as f:
-        serialized_blockchain = json.loads(f.read())
+    return common_height
+
+
+@STORAGE_SECONDS.time(operation='load_blockchain_from_file')
+def load_blockchain_from_file(miner_account_address: str, from_height: int = 0) -> List[Block]:
+    block_store = get_block_store(miner_account_address)
+
+    return [decode_block(record) for record in block_store.read_range(from_height)]
+
+
+@STORAGE_SECONDS.time(operation='append_blocks_into_file')
+def append_blocks_into_file(blocks: List[Block], miner_account_address: str) -> bool:
+    """
+    Adds the blocks to the stored blockchain, replacing the ones we have from the height of the first block.
+
+    :return: False if we don't have the parent of the first block (so the blocks cannot be added)
+    """
+    block_store = get_block_store(miner_account_address)
+
+    with block_store.lock:
+        first_block = blocks[0]
+
+        if first_block.index > len(block_store):
+            return False
+
+        if first_block.index > 0 and block_store.get_hash(first_block.index - 1) != first_block.previous_hash:
+            return False
 
-        return unserialize_blockchain(serialized_blockchain)
+        block_store.replace(first_block.index, encode_blocks_for_store(blocks))
 
+    return True
+
+
+def encode_blocks_for_store(blocks: List[Block]) -> List[Tuple[str, bytes, int]]:
+    """
+    :return: (hash, record, work) of every block, as `BlockStore.replace` expects them
+    """
+    return [(block.get_hash(), encode_block_or_json(block), block.work) for block in blocks]
+
+
+def append_block_into_store(block_store: BlockStore, block: Block) -> None:
+    block_store.append(block.get_hash(), encode_block_or_json(block), block.work)
+
+
+@STORAGE_SECONDS.time(operation='load_tip_from_file')
+def load_tip_from_file(miner_account_address: str) -> Dict:
+    """
+    Returns the height and hash of the last stored block, and the cumulative work of the stored blockchain.
+    """
+    block_store = get_block_store(miner_account_address)
+
+    with block_store.lock:
+        height = len(block_store)
+
+        return {
+            'height': height,
+            'hash': block_store.get_hash(height - 1) if height else None,
+            'cumulative_work': block_store.get_cumulative_work(height - 1) if height else 0
+        }
+
+
+@STORAGE_SECONDS.time(operation='load_serialized_blockchain_from_file')
+def load_serialized_blockchain_from_file(miner_account_address: str, from_height: int = 0) -> str:
+    """
+    Returns the stored blocks from `from_height` as a JSON list. Blocks stored as JSON are copied as they are.
+    """
+    block_store = get_block_store(miner_account_address)
+
+    return '[' + ','.join(
+        record.decode() if record[:1] == b'{' else json.dumps(serialize_block(decode_block(record)))
+        for record in block_store.read_range(from_height)
+    ) + ']'
+
+
+@STORAGE_SECONDS.time(operation='load_encoded_blockchain_from_file')
+def load_encoded_blockchain_from_file(miner_account_address: str, from_height: int = 0) -> bytes:
+    """
+    Returns the stored blocks from `from_height` in the binary format (see `codec.py`), without decoding them.
+    """
+    block_store = get_block_store(miner_account_address)
+
+    return join_encoded_blocks(block_store.read_range(from_height))
+
+
+@STORAGE_SECONDS.time(operation='load_block_hashes_from_file')
+def load_block_hashes_from_file(miner_account_address: str, from_height: int = 0, to_height: int = None) -> List[Dict]:
+    """
+    Returns the index and hash of the stored blocks from `from_height` to `to_height` (excluded). They are read
+    from the index of the block store, so no block is parsed.
+    """
+    block_store = get_block_store(miner_account_address)
 
+    with block_store.lock:
+        to_height = len(block_store) if to_height is None else min(to_height, len(block_store))
+
+        return [{'index': height, 'hash': block_store.get_hash(height)} for height in range(from_height, to_height)]
+
+
+@STORAGE_SECONDS.time(operation='save_state_into_file')
 def save_state_into_file(state: Dict, miner_account_address: str) -> None:
     miner_folder_path = Path(f'miners/{miner_account_address}')
 
@@ -263,6 +496,7 @@ def save_state_into_file(state: Dict, miner_account_address: str) -> None:
         f.write(json.dumps(state))
 
 
+@STORAGE_SECONDS.time(operation='load_state_from_file')
 def load_state_from_file(miner_account_address: str) -> Dict:
     miner_folder_path = Path(f'miners/{miner_account_address}')
 
@@ -275,7 +509,6 @@ def load_state_from_file(miner_account_address: str) -> Dict:
         return {
             'miner_account_address': miner_account_address,
             'currently_mining': False,
-            'pending_transactions': [],
             'failing_transactions': [],
             'verified_transactions': [],
             'idx_last_block_mined': 0,
@@ -288,6 +521,131 @@ def load_state_from_file(miner_account_address: str) -> Dict:
         return json.loads(f.read())
 
 
+@STORAGE_SECONDS.time(operation='save_mempool_into_file')
+def save_mempool_into_file(transactions: List[Dict], miner_account_address: str) -> None:
+    miner_folder_path = Path(f'miners/{miner_account_address}')
+
+    if not miner_folder_path.exists():
+        miner_folder_path.mkdir(parents=True)
+
+    filepath = miner_folder_path / 'mempool.txt'
+
+    with open(filepath, 'w') as f:
+        f.write(json.dumps(transactions))
+
+
+@STORAGE_SECONDS.time(operation='load_mempool_from_file')
+def load_mempool_from_file(miner_account_address: str, default: List[Dict] = ()) -> List[Dict]:
+    """
+    :param default: pending transactions if they were never saved
+    """
+    filepath = Path(f'miners/{miner_account_address}') / 'mempool.txt'
+
+    if not filepath.exists():
+        return list(default)
+
+    with open(filepath, 'r') as f:
+        return json.loads(f.read())
+
+
+@STORAGE_SECONDS.time(operation='save_ledger_into_file')
+def save_ledger_into_file(ledger: Ledger, miner_account_address: str) -> None:
+    miner_folder_path = Path(f'miners/{miner_account_address}')
+
+    if not miner_folder_path.exists():
+        miner_folder_path.mkdir(parents=True)
+
+    filepath = miner_folder_path / 'ledger.txt'
+
+    with open(filepath, 'w') as f:
+        f.write(json.dumps(ledger.to_dict()))
+
+
+@STORAGE_SECONDS.time(operation='load_ledger_from_file')
+def load_ledger_from_file(miner_account_address: str) -> Ledger:
+    miner_folder_path = Path(f'miners/{miner_account_address}')
+
+    if not miner_folder_path.exists():
+        miner_folder_path.mkdir(parents=True)
+
+    filepath = miner_folder_path / 'ledger.txt'
+
+    if not filepath.exists():
+        return Ledger()
+
+    with open(filepath, 'r') as f:
+        return Ledger.from_dict(json.loads(f.read()))
+
+
+@STORAGE_SECONDS.time(operation='save_address_index_into_file')
+def save_address_index_into_file(serialized_index: Dict, miner_account_address: str) -> None:
+    """
+    Saves the whole address index (a checkpoint), so the changes logged before it aren't needed anymore.
+
+    :param serialized_index: the address index, as returned by `AddressIndex.to_dict`
+    """
+    miner_folder_path = Path(f'miners/{miner_account_address}')
+
+    if not miner_folder_path.exists():
+        miner_folder_path.mkdir(parents=True)
+
+    filepath = miner_folder_path / 'address_index.txt'
+    temporary_filepath = miner_folder_path / 'address_index.txt.tmp'
+
+    # We never leave a half-written checkpoint, as the log cannot be applied without it.
+    with open(temporary_filepath, 'w') as f:
+        f.write(json.dumps(serialized_index))
+
+    os.replace(temporary_filepath, filepath)
+
+    with open(miner_folder_path / 'address_index.log', 'w'):
+        pass
+
+
+@STORAGE_SECONDS.time(operation='append_address_index_changes_into_file')
+def append_address_index_changes_into_file(changes: List[Dict], miner_account_address: str) -> None:
+    """
+    :param changes: changes of the address index since it was saved, as returned by `AddressIndex.take_changes`
+    """
+    miner_folder_path = Path(f'miners/{miner_account_address}')
+
+    if not miner_folder_path.exists():
+        miner_folder_path.mkdir(parents=True)
+
+    with open(miner_folder_path / 'address_index.log', 'a') as f:
+        f.write(''.join(json.dumps(change) + '\n' for change in changes))
+
+
+@STORAGE_SECONDS.time(operation='load_address_index_from_file')
+def load_address_index_from_file(miner_account_address: str) -> (Optional[Dict], List[Dict]):
+    """
+    :return: the last checkpoint of the address index (to be loaded with `AddressIndex.from_dict`), or None if it was
+        never saved, and the changes logged since then (to be applied with `AddressIndex.apply_changes`)
+    """
+    miner_folder_path = Path(f'miners/{miner_account_address}')
+    filepath = miner_folder_path / 'address_index.txt'
+
+    if not filepath.exists():
+        return None, []
+
+    with open(filepath, 'r') as f:
+        serialized_index = json.loads(f.read())
+
+    changes = []
+    log_filepath = miner_folder_path / 'address_index.log'
+
+    if log_filepath.exists():
+        with open(log_filepath, 'r') as f:
+            for line in f:
+                try:
+                    changes.append(json.loads(line))
+                except ValueError:
+                    # The node stopped while writing it. The changes are numbered, so the index knows if any is missing.
+                    continue
+
+    return serialized_index, changes
+
+
 def get_states_from_all_other_nodes(node_url: str, network_nodes_urls: List[str]) -> List[Dict]:
     states_from_all_nodes = []
 
@@ -295,27 +653,17 @@ def get_states_from_all_other_nodes(node_url: str, network_nodes_urls: List[str]
     other_nodes_url = copy.copy(network_nodes_urls)
     other_nodes_url.remove(node_url)
 
-    for node_url in other_nodes_url:
-        url = urljoin(node_url, 'state')
-        try:
-            r = requests.get(url)
-
-            if r.status_code == 200:
-                fetched_state = json.loads(r.content)
-                states_from_all_nodes.append(fetched_state)
+    def get_state(other_node_url: str) -> Dict:
+        r = peer_client.get(other_node_url, 'state')
+        r.raise_for_status()
 
-                # In case we find a node "currently mining" we return fast, as we don't need further information
-                # at this point.
-                if fetched_state['currently_mining']:
-                    break
+        return json.loads(r.content)
 
-            else:
-                print(f'{node_url} is faulty. Please investigate.')
-                sys.stdout.flush()
-
-        except requests.exceptions.ConnectionError:
-            print(f'{node_url} not available at this moment')
-            sys.stdout.flush()
+    for other_node_url, fetched_state, error in peer_client.fan_out(other_nodes_url, get_state):
+        if error:
+            report_peer_error(other_node_url, error)
+        else:
+            states_from_all_nodes.append(fetched_state)
 
     return states_from_all_nodes
 
@@ -328,39 +676,109 @@ def is_any_other_node_currently_mining(states_from_all_nodes: List[Dict]) -> boo
     return False
 
 
+def get_transaction_id(transaction: Dict) -> str:
+    sha = hasher.sha256()
+
+    sha.update(json.dumps({
+        'from': transaction['from'],
+        'to': transaction['to'],
+        'amount': transaction['amount'],
+        'timestamp': transaction['timestamp']
+    }).encode())
+
+    return sha.hexdigest()
+
+
+def _is_address(value) -> bool:
+    # The length of the addresses is stored in 2 bytes when the transactions are hashed (see `merkle.py`).
+    return isinstance(value, str) and 0 < len(value.encode()) <= 0xFFFF
+
+
+def _is_number(value) -> bool:
+    # `bool` is an `int` too, and JSON can bring NaN and Infinity.
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _is_integer(value, max_value: int) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= max_value
+
+
+def _is_hash(value) -> bool:
+    if not isinstance(value, str) or len(value) != 64:
+        return False
+
+    try:
+        bytes.fromhex(value)
+    except ValueError:
+        return False
+
+    return True
+
+
 def is_posted_transaction_valid(transaction: Dict) -> bool:
+    if not isinstance(transaction, dict):
+        return False
+
+    # Anything else would only fail later on, when the transaction is hashed (and mining it would fail every time).
     return all([
-        transaction.get('to'),
-        transaction.get('from'),
-        transaction.get('amount', 0.0) > 0.0,
-        transaction.get('transaction_fee', 0.0) >= 0.01
+        _is_address(transaction.get('to')),
+        _is_address(transaction.get('from')),
+        _is_number(transaction.get('amount')) and transaction['amount'] > 0.0,
+        _is_number(transaction.get('transaction_fee')) and transaction['transaction_fee'] >= 0.01
     ])
 
 
-def is_posted_blockchain_valid(serialized_blockchain: List[Dict]) -> bool:
-    # TODO: Check whether all the blocks have the valid structure.
+def is_posted_block_valid(serialized_block: Dict) -> bool:
+    """
+    Checks that every field of the block can be hashed (see `Block.get_header`): integers fit in their fields,
+    hashes are 32 bytes in hex, and amounts are positive numbers. The content of the blocks (hashes, funds...)
+    is checked later on, in `validation.py`.
+    """
+    if not isinstance(serialized_block, dict) or not isinstance(serialized_block.get('data'), dict):
+        return False
+
+    data = serialized_block['data']
+    transactions = data.get('transactions')
+
     return all([
-        isinstance(serialized_blockchain, List),
-        len(serialized_blockchain) > 0  # It has at least 1 block (Genesis Block)
-    ])
+        _is_integer(serialized_block.get('index'), 2 ** 64 - 1),
+        _is_number(serialized_block.get('timestamp')),
+        _is_hash(serialized_block.get('previous_hash')),
+        _is_integer(data.get('nonce'), 2 ** 64 - 1),
+        _is_integer(data.get('difficulty_level', 0), 255),
+        isinstance(transactions, list)
+    ]) and all(
+        isinstance(tx, dict) and all([
+            _is_address(tx.get('from')),
+            _is_address(tx.get('to')),
+            _is_number(tx.get('amount')) and tx['amount'] > 0,
+            _is_number(tx.get('timestamp'))
+        ])
+        for tx in transactions
+    )
 
 
-def has_account_enough_funds(blockchain: List[Block], transaction: Dict) -> bool:
-    from_account = transaction['from']
-    amount = transaction['amount']
-    transaction_fee = transaction['transaction_fee']
+def are_posted_blocks_valid(serialized_blocks: List[Dict]) -> bool:
+    return all([
+        isinstance(serialized_blocks, List),
+        len(serialized_blocks) > 0
+    ]) and all(is_posted_block_valid(serialized_block) for serialized_block in serialized_blocks)
 
-    balance = 0.0
 
-    for block in blockchain:
-        for tx in block.data['transactions']:
-            if tx['to'] == from_account:
-                balance += tx['amount']
+def is_posted_blockchain_valid(serialized_blockchain: List[Dict]) -> bool:
+    return all([
+        isinstance(serialized_blockchain, List),
+        len(serialized_blockchain) > 0  # It has at least 1 block (Genesis Block)
+    ]) and all(is_posted_block_valid(serialized_block) for serialized_block in serialized_blockchain)
 
-            elif tx['from'] == from_account:
-                balance -= tx['amount']
 
-    return bool((balance - amount - transaction_fee) >= 0.0)
+def has_account_enough_funds(ledger: Ledger, transaction: Dict, pending_spendings: Dict[str, float] = None) -> bool:
+    """
+    :param pending_spendings: amounts that the accounts already spend in transactions of the block being mined
+    """
+    balance = ledger.get_balance(transaction['from']) - (pending_spendings or {}).get(transaction['from'], 0.0)
+
+    return bool((balance - transaction['amount'] - transaction['transaction_fee']) >= 0.0)
 
 
 def set_up_env_vars() -> (str, str, List[str]):
@@ -0,0 +1,142 @@
+from typing import Callable, Dict, List, Optional
+
+from .block import Block, GENESIS_PREVIOUS_HASH
+from .constants import MIN_PROOF_OF_WORK_DIFFICULTY_LEVEL, MAX_PROOF_OF_WORK_DIFFICULTY_LEVEL
+from .ledger import Ledger
+
+
+class InvalidBlockchain(Exception):
+    pass
+
+
+def get_common_height(local_blockchain: List[Block], blockchain: List[Block]) -> int:
+    """
+    :return: number of blocks (from the genesis block) that both blockchains have in common
+    """
+    common_height = min(len(local_blockchain), len(blockchain))
+
+    while common_height > 0 and local_blockchain[common_height - 1].get_hash() != blockchain[common_height - 1].get_hash():
+        common_height -= 1
+
+    return common_height
+
+
+def get_balances_at_height(
+        local_blockchain: List[Block], ledger: Ledger, height: int) -> Callable[[str], float]:
+    """
+    :return: a function that gives the balance of an account right after the first `height` blocks
+        of the local blockchain.
+    """
+    if height >= ledger.height - len(ledger.recent_blocks):
+        return lambda account_address: ledger.get_balance_at(account_address, height)
+
+    # The ledger cannot go that far back, so we need to compute the balances again.
+    ledger_at_height = Ledger()
+    ledger_at_height.sync(local_blockchain[:height])
+
+    return ledger_at_height.get_balance
+
+
+def get_work(blocks: List[Block]) -> int:
+    return sum(block.work for block in blocks)
+
+
+def validate_blocks(
+        blocks: List[Block],
+        previous_block: Optional[Block],
+        get_balance: Callable[[str], float]) -> None:
+    """
+    Checks that the blocks can be added after `previous_block`: they follow each other, their hashes match the
+    difficulty level they were mined with, and no account spends more than it has.
+
+    :param blocks: blocks to check
+    :param previous_block: block after which the blocks would be added (None if they start by the genesis block)
+    :param get_balance: balance of an account right after `previous_block`
+    :raises InvalidBlockchain: if any block isn't valid
+    """
+    balances: Dict[str, float] = {}
+
+    for block in blocks:
+        if previous_block is None:
+            validate_genesis_block(block)
+            expected_index, expected_previous_hash = 0, GENESIS_PREVIOUS_HASH
+        else:
+            expected_index, expected_previous_hash = previous_block.index + 1, previous_block.get_hash()
+
+        if block.index != expected_index:
+            raise InvalidBlockchain(f'Block {block.index} should have index {expected_index}.')
+
+        if block.previous_hash != expected_previous_hash:
+            raise InvalidBlockchain(f'Block {block.index} doesn\'t point to the previous block.')
+
+        if previous_block is not None:
+            if block.difficulty_level < MIN_PROOF_OF_WORK_DIFFICULTY_LEVEL:
+                raise InvalidBlockchain(f'Block {block.index} was mined with a too low difficulty level.')
+
+            if block.difficulty_level > MAX_PROOF_OF_WORK_DIFFICULTY_LEVEL:
+                raise InvalidBlockchain(f'Block {block.index} declares a too high difficulty level.')
+
+            if not block.get_hash().startswith('0' * block.difficulty_level):
+                raise InvalidBlockchain(f'The hash of block {block.index} doesn\'t match its difficulty level.')
+
+            for tx in block.data['transactions']:
+                if tx['amount'] <= 0:
+                    raise InvalidBlockchain(f'Block {block.index} has a transaction with an invalid amount.')
+
+                from_balance = balances.get(tx['from'], get_balance(tx['from'])) - tx['amount']
+
+                if from_balance < 0:
+                    raise InvalidBlockchain(f'In block {block.index}, "{tx["from"]}" spends more than it has.')
+
+                balances[tx['from']] = from_balance
+                balances[tx['to']] = balances.get(tx['to'], get_balance(tx['to'])) + tx['amount']
+
+        else:
+            for tx in block.data['transactions']:
+                balances[tx['to']] = balances.get(tx['to'], 0.0) + tx['amount']
+
+            get_balance = lambda account_address: 0.0
+
+        previous_block = block
+
+
+def validate_genesis_block(block: Block) -> None:
+    transactions = block.data['transactions']
+
+    if len(transactions) != 1 or transactions[0]['from'] != 'genesis':
+        raise InvalidBlockchain('The genesis block should only create the funds of the network.')
+
+    # It isn't mined, so it cannot add any work to the blockchain.
+    if block.difficulty_level != 0:
+        raise InvalidBlockchain('The genesis block shouldn\'t have a difficulty level.')
+
+
+def validate_blockchain_update(local_blockchain: List[Block], ledger: Ledger, blockchain: List[Block]) -> int:
+    """
+    Checks a blockchain that would replace the local one. Only the blocks after the ones both have in common are
+    checked (starting from the balances the accounts had at that point), so the cost depends on the number of new
+    blocks, not on the length of the blockchain. The blockchain must start by the same genesis block, and it must
+    have more cumulative work than the local one.
+
+    :param local_blockchain: blockchain of this node
+    :param ledger: balances at the tip of the local blockchain
+    :param blockchain: the new blockchain
+    :return: number of blocks both blockchains have in common
+    :raises InvalidBlockchain: if any of the new blocks isn't valid
+    """
+    common_height = get_common_height(local_blockchain, blockchain)
+
+    if local_blockchain and common_height == 0:
+        raise InvalidBlockchain('The blockchain starts by a different genesis block.')
+
+    # Both have the same blocks up to `common_height`, so only the work of the blocks after them is compared.
+    if get_work(blockchain[common_height:]) <= get_work(local_blockchain[common_height:]):
+        raise InvalidBlockchain('The blockchain doesn\'t have more work than ours.')
+
+    validate_blocks(
+        blockchain[common_height:],
+        local_blockchain[common_height - 1] if common_height else None,
+        get_balances_at_height(local_blockchain, ledger, common_height)
+    )
+
+    return common_height
@@ -1,7 +1,9 @@
 import sys
 import os
 import json
-from typing import List, Dict
+import hashlib
+import struct
+from typing import List, Dict, Optional
 
 import requests
 import pprint
@@ -13,32 +15,121 @@ pp = pprint.PrettyPrinter(indent=4)
 
 
 NODE_URL = os.getenv('NODE_URL')
+# The proofs of transactions are checked against the blockchain of this node (by default, NODE_URL). It should be a
+# different node, so a single node cannot make up a proof.
+TRUSTED_NODE_URL = os.getenv('TRUSTED_NODE_URL')
 
+# Transactions of every account (and the last block seen) are saved here, so they aren't downloaded every time.
+WALLET_CACHE_DIR = os.getenv('WALLET_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.simplecoin_wallet'))
 
-def get_transactions_for_account(account_address: str) -> List[Dict]:
+# Header of a block: index, timestamp, difficulty level, previous hash, Merkle root of the transactions and nonce.
+HEADER_FORMAT = struct.Struct('>QdB32s32sQ')
+
+# Nodes reject blocks mined with a lower difficulty level (see `MIN_PROOF_OF_WORK_DIFFICULTY_LEVEL` in the node).
+MIN_PROOF_OF_WORK_DIFFICULTY_LEVEL = 4
+
+
+def get_transactions_for_account(account_address: str, offset: int = 0) -> List[Dict]:
+    """
+    :param offset: number of transactions of the account to skip (e.g., because we already have them)
+    """
     transactions = []
 
-    url = urljoin(NODE_URL, 'blockchain')
-    r = requests.get(url)
+    url = urljoin(NODE_URL, f'accounts/{account_address}/transactions')
+
+    while True:
+        r = requests.get(url, params={'offset': offset + len(transactions)})
+
+        r.raise_for_status()
+
+        page = json.loads(r.content)
+        transactions.extend(page['transactions'])
+
+        if not page['transactions'] or offset + len(transactions) >= page['total']:
+            return transactions
+
+
+def get_tip(node_url: str) -> Dict:
+    """
+    :return: the height and hash of the last block of the node
+    """
+    r = requests.get(urljoin(node_url, 'tip'))
+    r.raise_for_status()
+
+    return json.loads(r.content)
+
+
+def get_block_hash(height: int, node_url: str = None) -> Optional[str]:
+    url = urljoin(node_url or NODE_URL, 'headers')
+    r = requests.get(url, params={'from': height, 'to': height + 1})
 
     r.raise_for_status()
 
-    blockchain = json.loads(r.content)
+    headers = json.loads(r.content)
+
+    return headers[0]['hash'] if headers else None
+
+
+def load_cache(account_address: str) -> Dict:
+    try:
+        with open(os.path.join(WALLET_CACHE_DIR, f'{account_address}.json'), 'r') as f:
+            return json.loads(f.read())
+
+    except (OSError, ValueError):
+        return {'height': 0, 'tip_hash': None, 'transactions': []}
+
+
+def save_cache(account_address: str, cache: Dict) -> None:
+    os.makedirs(WALLET_CACHE_DIR, exist_ok=True)
+
+    filepath = os.path.join(WALLET_CACHE_DIR, f'{account_address}.json')
+
+    # We write a new file and then replace the old one, so the cache is never left half-written.
+    with open(f'{filepath}.tmp', 'w') as f:
+        f.write(json.dumps(cache))
+
+    os.replace(f'{filepath}.tmp', filepath)
+
+
+def sync_transactions_for_account(account_address: str) -> List[Dict]:
+    """
+    Gets the transactions of the account, using the ones saved in the local cache.
+
+    If the blockchain of the node is the one we saw last time (same tip), nothing else is downloaded. If it grew, only
+    the new transactions are downloaded. If it changed (e.g., the network switched to a fork), the cached transactions
+    whose blocks aren't in the blockchain anymore are discarded, and the ones after them are downloaded again.
+    """
+    cache = load_cache(account_address)
+
+    tip = get_tip(NODE_URL)
+
+    if cache['tip_hash'] == tip['hash']:
+        return cache['transactions']
+
+    transactions = cache['transactions']
+
+    if cache['height'] and get_block_hash(cache['height'] - 1) != cache['tip_hash']:
+        # The block we saw last time isn't there anymore, so we go back until the block of a transaction matches.
+        while transactions and get_block_hash(transactions[-1]['block_index']) != transactions[-1]['block_hash']:
+            block_index = transactions[-1]['block_index']
 
-    for block in blockchain:
-        for transaction in block['data']['transactions']:
-            if transaction['to'] == account_address:
-                transactions.append(transaction)
-            elif transaction['from'] == account_address:
-                transactions.append(transaction)
+            while transactions and transactions[-1]['block_index'] == block_index:
+                transactions.pop()
+
+    transactions += get_transactions_for_account(account_address, offset=len(transactions))
+
+    save_cache(account_address, {'height': tip['height'], 'tip_hash': tip['hash'], 'transactions': transactions})
 
     return transactions
 
 
-def get_balance_for_account(transactions: List[Dict]):
+def get_balance_for_account(account_address: str, transactions: List[Dict]) -> float:
     balance = 0.0
 
     for transaction in transactions:
+        if transaction['to'] == transaction['from']:
+            continue
+
         if transaction['to'] == account_address:
             balance += transaction['amount']
         elif transaction['from'] == account_address:
@@ -55,8 +146,7 @@ def send_money(account_address: str, to_address: str, amount: float, transaction
     amount = float(amount)
     transaction_fee = float(transaction_fee)
 
-    transactions = get_transactions_for_account(account_address)
-    balance = get_balance_for_account(transactions)
+    balance = get_balance_for_account(account_address, sync_transactions_for_account(account_address))
 
     if balance - amount - transaction_fee > 0:
 
@@ -78,6 +168,88 @@ def send_money(account_address: str, to_address: str, amount: float, transaction
         return
 
 
+def get_transaction_id(transaction: Dict) -> str:
+    return hashlib.sha256(json.dumps({
+        'from': transaction['from'],
+        'to': transaction['to'],
+        'amount': transaction['amount'],
+        'timestamp': transaction['timestamp']
+    }).encode()).hexdigest()
+
+
+def get_transaction_hash(transaction: Dict) -> bytes:
+    # Same representation used by the nodes to build the Merkle tree of a block.
+    from_address = transaction['from'].encode()
+    to_address = transaction['to'].encode()
+
+    return hashlib.sha256(b''.join([
+        struct.pack('>H', len(from_address)), from_address,
+        struct.pack('>H', len(to_address)), to_address,
+        struct.pack('>dd', float(transaction['amount']), float(transaction.get('timestamp', 0.0)))
+    ])).digest()
+
+
+def verify_transaction(transaction_id: str) -> int:
+    """
+    Checks that the transaction is in the blockchain with the proof sent by the node (the Merkle branch of the
+    transaction and the headers of its block and the following ones), without downloading any block.
+
+    The headers must be mined with the difficulty level required by the network, and the last one must be in the
+    blockchain of TRUSTED_NODE_URL, so the node cannot send headers that it mined apart from the network.
+
+    :return: number of blocks mined on top of the block of the transaction, in the blockchain of TRUSTED_NODE_URL
+    """
+    url = urljoin(NODE_URL, f'transactions/{transaction_id}/proof')
+    r = requests.get(url)
+
+    r.raise_for_status()
+
+    proof = json.loads(r.content)
+
+    if get_transaction_id(proof['transaction']) != transaction_id:
+        raise Exception('The node sent a different transaction.')
+
+    if not proof['headers']:
+        raise Exception('The proof doesn\'t have any header.')
+
+    merkle_root = get_transaction_hash(proof['transaction'])
+    for sibling in proof['merkle_branch']:
+        sibling_hash = bytes.fromhex(sibling['hash'])
+        pair = merkle_root + sibling_hash if sibling['side'] == 'right' else sibling_hash + merkle_root
+        merkle_root = hashlib.sha256(pair).digest()
+
+    previous_hash = None
+    for idx, header in enumerate(proof['headers']):
+        header = bytes.fromhex(header)
+        index, _, difficulty_level, header_previous_hash, header_merkle_root, _ = HEADER_FORMAT.unpack(header)
+        block_hash = hashlib.sha256(header).hexdigest()
+
+        if idx == 0 and (index != proof['block_index'] or header_merkle_root != merkle_root):
+            raise Exception('The transaction isn\'t in the block of the proof.')
+
+        if previous_hash is not None and header_previous_hash.hex() != previous_hash:
+            raise Exception('The headers of the proof aren\'t linked.')
+
+        if difficulty_level < MIN_PROOF_OF_WORK_DIFFICULTY_LEVEL or not block_hash.startswith('0' * difficulty_level):
+            raise Exception(f'The block {index} of the proof wasn\'t mined with the difficulty level of the network.')
+
+        previous_hash = block_hash
+
+    # The headers are linked, so if the last one is in the blockchain of the trusted node, all of them are.
+    trusted_node_url = TRUSTED_NODE_URL or NODE_URL
+    tip = get_tip(trusted_node_url)
+
+    if index >= tip['height']:
+        raise Exception('The headers of the proof aren\'t in the blockchain of the network.')
+
+    trusted_hash = tip['hash'] if index == tip['height'] - 1 else get_block_hash(index, trusted_node_url)
+
+    if trusted_hash != previous_hash:
+        raise Exception('The headers of the proof aren\'t in the blockchain of the network.')
+
+    return tip['height'] - 1 - proof['block_index']
+
+
 if __name__ == '__main__':
     if len(sys.argv) < 2:
         print('Please provide the <method> and <account_address>')
@@ -87,8 +259,8 @@ if __name__ == '__main__':
     account_address = sys.argv[2]
 
     if type == 'get_balance':
-        transactions = get_transactions_for_account(account_address)
-        balance = get_balance_for_account(transactions)
+        transactions = sync_transactions_for_account(account_address)
+        balance = get_balance_for_account(account_address, transactions)
 
         print(f'Current balance is: {balance}')
         print('Transactions:')
@@ -104,3 +276,9 @@ if __name__ == '__main__':
         transaction_fee = sys.argv[5]
 
         send_money(account_address, to_address, amount, transaction_fee)
+
+    if type == 'verify_transaction':
+        # The second argument is the ID of the transaction.
+        confirmations = verify_transaction(sys.argv[2])
+
+        print(f'The transaction is in the blockchain ({confirmations} blocks were mined after its block).')
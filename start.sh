@@ -1,5 +1,3 @@
 #!/bin/bash
 
-python -m src.node_miner &
-
-FLASK_APP=src/node_server.py flask run --host=0.0.0.0 --port=5000
\ No newline at end of file
+python -m src.node
@@ -0,0 +1,13 @@
+import pytest
+
+from src.node_state import NodeState
+from src.utils import block_stores
+
+
+@pytest.fixture
+def node_state(tmp_path, monkeypatch):
+    # Nodes save their files in the current directory.
+    monkeypatch.chdir(tmp_path)
+    block_stores.clear()
+
+    return NodeState('miner', 'http://localhost', ['http://localhost'])
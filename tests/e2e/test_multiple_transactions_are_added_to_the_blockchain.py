@@ -92,7 +92,7 @@ def test_multiple_transactions_are_created():
     state_node1 = r.json()
 
     assert state_node1['currently_mining'] == False
-    assert len(state_node1['pending_transactions']) == 0
+    assert state_node1['pending_transactions_count'] == 0
     assert len(state_node1['verified_transactions']) == 3
     assert len(state_node1['failing_transactions']) == 0
     assert state_node1['idx_last_block_mined'] == 1
@@ -117,7 +117,7 @@ def test_multiple_transactions_are_created():
     state_node2 = r.json()
 
     assert state_node2['currently_mining'] == False
-    assert len(state_node2['pending_transactions']) == 0
+    assert state_node2['pending_transactions_count'] == 0
     assert len(state_node2['verified_transactions']) == 0
     assert len(state_node2['failing_transactions']) == 2
     assert state_node2['idx_last_block_mined'] == 0
@@ -142,7 +142,7 @@ def test_multiple_transactions_are_created():
     state_node3 = r.json()
 
     assert state_node3['currently_mining'] == False
-    assert len(state_node3['pending_transactions']) == 0
+    assert state_node3['pending_transactions_count'] == 0
     assert len(state_node3['verified_transactions']) == 0
     assert len(state_node3['failing_transactions']) == 0
     assert state_node3['idx_last_block_mined'] == 0
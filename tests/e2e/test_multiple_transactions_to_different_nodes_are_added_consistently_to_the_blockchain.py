@@ -60,7 +60,7 @@ def test_multiple_transactions_to_different_nodes_are_added_consistently_to_the_
     state_node1 = r.json()
 
     assert state_node1['currently_mining'] == False
-    assert len(state_node1['pending_transactions']) == 0
+    assert state_node1['pending_transactions_count'] == 0
     assert len(state_node1['verified_transactions']) == 1
     assert len(state_node1['failing_transactions']) == 0
     assert state_node1['idx_last_block_mined'] == 1
@@ -85,7 +85,7 @@ def test_multiple_transactions_to_different_nodes_are_added_consistently_to_the_
     state_node2 = r.json()
 
     assert state_node2['currently_mining'] == False
-    assert len(state_node2['pending_transactions']) == 0
+    assert state_node2['pending_transactions_count'] == 0
     assert len(state_node2['verified_transactions']) == 1
     assert len(state_node2['failing_transactions']) == 0
     assert state_node2['idx_last_block_mined'] == 2
@@ -110,7 +110,7 @@ def test_multiple_transactions_to_different_nodes_are_added_consistently_to_the_
     state_node3 = r.json()
 
     assert state_node3['currently_mining'] == False
-    assert len(state_node3['pending_transactions']) == 0
+    assert state_node3['pending_transactions_count'] == 0
     assert len(state_node3['verified_transactions']) == 0
     assert len(state_node3['failing_transactions']) == 0
     assert state_node3['idx_last_block_mined'] == 0
@@ -1,28 +1,18 @@
 from datetime import datetime
 
 from src.block import Block
+from src.constants import MIN_PROOF_OF_WORK_DIFFICULTY_LEVEL
+from src.mining import find_nonce
+from src.utils import create_genesis_block
 
 
-BLOCK_GENESIS = Block(
-    0,
-    datetime.now(),
-    {
-        'nonce': 1,
-        'transactions': [
-            {
-                'from': 'genesis',
-                'to': 'network',
-                'amount': 1000000000  # Total amount of funds available in the network: 1000 millions
-            }
-        ]
-    },
-    None
-)
+# The same genesis block every node starts with.
+BLOCK_GENESIS = create_genesis_block()
 
 
 BLOCK_1 = Block(
     0,
-    datetime.now(),
+    datetime.now().timestamp(),
     {
         'nonce': 1,
         'transactions': [
@@ -33,7 +23,7 @@ BLOCK_1 = Block(
             }
         ]
     },
-    BLOCK_GENESIS
+    BLOCK_GENESIS.get_hash()
 )
 
 
@@ -53,4 +43,16 @@ TRANSACTION_2 = {
     'to': 'john',
     'amount': 10.0,
     'transaction_fee': 1.0
-}
\ No newline at end of file
+}
+
+def mine_block(
+        previous_block: Block, transactions: list, difficulty_level: int = MIN_PROOF_OF_WORK_DIFFICULTY_LEVEL) -> Block:
+    block = Block(
+        previous_block.index + 1,
+        previous_block.timestamp + 1,
+        {'nonce': 0, 'difficulty_level': difficulty_level, 'transactions': transactions},
+        previous_block.get_hash()
+    )
+    block.data['nonce'] = find_nonce(block, difficulty_level, number_of_workers=1)
+
+    return block
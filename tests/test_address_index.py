@@ -0,0 +1,81 @@
+from src.address_index import AddressIndex
+
+from .fixtures import BLOCK_GENESIS, mine_block
+
+
+def test_transactions_of_an_account_are_found_by_its_address():
+    block_1 = mine_block(BLOCK_GENESIS, [{'from': 'network', 'to': 'eve', 'amount': 10, 'timestamp': 1.0}])
+    block_2 = mine_block(block_1, [
+        {'from': 'eve', 'to': 'miner', 'amount': 1, 'timestamp': 2.0},
+        {'from': 'eve', 'to': 'bob', 'amount': 5, 'timestamp': 2.0}
+    ])
+
+    address_index = AddressIndex()
+    address_index.sync([BLOCK_GENESIS, block_1, block_2])
+
+    assert address_index.get_locations('eve') == [(1, 0), (2, 0), (2, 1)]
+    assert address_index.get_locations('eve', offset=1, limit=1) == [(2, 0)]
+    assert address_index.count_transactions('bob') == 1
+    assert address_index.count_transactions('alice') == 0
+
+
+def test_blocks_of_a_fork_are_removed_from_the_index():
+    block_1 = mine_block(BLOCK_GENESIS, [{'from': 'network', 'to': 'eve', 'amount': 10, 'timestamp': 1.0}])
+    fork_block_1 = mine_block(BLOCK_GENESIS, [{'from': 'network', 'to': 'bob', 'amount': 10, 'timestamp': 1.0}])
+
+    address_index = AddressIndex()
+    address_index.sync([BLOCK_GENESIS, block_1])
+    address_index.sync([BLOCK_GENESIS, fork_block_1])
+
+    assert address_index.get_locations('eve') == []
+    assert address_index.get_locations('bob') == [(1, 0)]
+    assert address_index.get_locations('network') == [(0, 0), (1, 0)]
+
+
+def test_changes_of_the_index_can_be_applied_to_a_copy_of_it():
+    block_1 = mine_block(BLOCK_GENESIS, [{'from': 'network', 'to': 'eve', 'amount': 10, 'timestamp': 1.0}])
+    block_2 = mine_block(block_1, [{'from': 'eve', 'to': 'bob', 'amount': 5, 'timestamp': 2.0}])
+    fork_block_2 = mine_block(block_1, [{'from': 'eve', 'to': 'alice', 'amount': 5, 'timestamp': 2.0}])
+
+    address_index = AddressIndex()
+    address_index.sync([BLOCK_GENESIS, block_1])
+
+    # It was built from scratch, so it's saved whole.
+    assert address_index.take_changes() == (True, [])
+    checkpoint = address_index.to_dict()
+
+    address_index.sync([BLOCK_GENESIS, block_1, block_2])
+    address_index.sync([BLOCK_GENESIS, block_1, fork_block_2])
+    checkpoint_needed, changes = address_index.take_changes()
+
+    assert not checkpoint_needed
+    assert [change.get('rollback') for change in changes] == [None, 2, None]
+
+    copied_index = AddressIndex.from_dict(checkpoint)
+    copied_index.apply_changes(changes)
+
+    assert copied_index.to_dict() == address_index.to_dict()
+    assert copied_index.take_changes() == (False, [])
+
+
+def test_index_is_saved_whole_if_changes_are_missing_or_too_many():
+    blockchain = [BLOCK_GENESIS]
+    for _ in range(3):
+        blockchain.append(mine_block(blockchain[-1], []))
+
+    address_index = AddressIndex(checkpoint_interval=2)
+    address_index.sync(blockchain[:2])
+    address_index.take_changes()
+    checkpoint = address_index.to_dict()
+
+    address_index.sync(blockchain[:3])
+    _, changes = address_index.take_changes()
+    address_index.sync(blockchain)
+
+    assert address_index.take_changes() == (True, [])
+
+    copied_index = AddressIndex.from_dict(checkpoint)
+    copied_index.apply_changes([dict(change, seq=change['seq'] + 1) for change in changes])
+
+    assert copied_index.height == 2
+    assert copied_index.take_changes() == (True, [])
@@ -0,0 +1,18 @@
+import json
+
+from benchmarks.run import BENCHMARKS, main
+
+
+def test_benchmarks_write_their_results_as_json(tmp_path):
+    output = tmp_path / 'results.json'
+
+    main(['--sizes', '1k', '--repeat', '1', '--difficulty', '1', '--output', str(output)])
+
+    results = json.loads(output.read_text())
+    names = {result['name'] for result in results['results']}
+
+    assert results['version'] == 1
+    assert len(names) == len(results['results']) > len(BENCHMARKS)
+    assert {'block.get_hash', 'proof_of_work', 'has_account_enough_funds', 'consensus', 'serialize_block',
+            'unserialize_blockchain', 'save_blockchain_into_file', 'load_blockchain_from_file'} <= names
+    assert all(result['blockchain_size'] == '1k' and result['best_seconds'] >= 0 for result in results['results'])
@@ -0,0 +1,59 @@
+import hashlib as hasher
+
+from src.block import Block, GENESIS_PREVIOUS_HASH, calculate_hash_for_nonce
+from src.merkle import get_merkle_root, get_merkle_branch, get_merkle_root_from_branch, EMPTY_MERKLE_ROOT
+
+from .fixtures import BLOCK_GENESIS, BLOCK_1
+
+
+def test_genesis_block_has_no_previous_hash():
+    assert BLOCK_GENESIS.previous_hash == GENESIS_PREVIOUS_HASH
+
+
+def test_block_stores_the_hash_of_its_parent():
+    assert BLOCK_1.previous_hash == BLOCK_GENESIS.get_hash()
+
+
+def test_block_hash_is_computed_only_once():
+    block = Block(1, 1.0, {'nonce': 1, 'transactions': []}, BLOCK_GENESIS.get_hash())
+
+    block_hash = block.get_hash()
+    block.data['nonce'] = 2
+
+    assert block.get_hash() == block_hash
+    assert block.calculate_hash() != block_hash
+
+
+def test_block_hash_for_nonce_matches_the_hash_of_the_block():
+    block = Block(1, 1.0, {'nonce': 7, 'transactions': BLOCK_1.data['transactions']}, BLOCK_GENESIS.get_hash())
+    midstate = hasher.sha256(block.get_header_prefix())
+
+    assert calculate_hash_for_nonce(midstate, 7) == block.calculate_hash()
+
+
+def test_merkle_root_does_not_depend_on_the_type_of_the_amount():
+    transaction = {'from': 'network', 'to': 'eve', 'amount': 10, 'timestamp': 1.0}
+
+    assert get_merkle_root([transaction]) == get_merkle_root([dict(transaction, amount=10.0)])
+
+
+def test_merkle_root_pairs_the_last_transaction_with_itself():
+    transactions = [
+        {'from': 'network', 'to': 'eve', 'amount': amount, 'timestamp': 1.0} for amount in (1.0, 2.0, 3.0)
+    ]
+
+    assert get_merkle_root(transactions) == get_merkle_root(transactions + transactions[-1:])
+    assert get_merkle_root([]) == EMPTY_MERKLE_ROOT
+
+
+def test_merkle_branch_of_every_transaction_leads_to_the_merkle_root():
+    transactions = [{'from': 'network', 'to': f'account-{i}', 'amount': i, 'timestamp': 1.0} for i in range(5)]
+    merkle_root = get_merkle_root(transactions)
+
+    for position, transaction in enumerate(transactions):
+        branch = get_merkle_branch(transactions, position)
+
+        assert len(branch) == 3
+        assert get_merkle_root_from_branch(transaction, branch) == merkle_root
+
+    assert get_merkle_root_from_branch(transactions[1], get_merkle_branch(transactions, 0)) != merkle_root
@@ -0,0 +1,82 @@
+import pytest
+
+from src.chain import LazyBlockchain
+from src.utils import append_block_into_store
+from src.storage import BlockStore
+
+from .fixtures import BLOCK_GENESIS, mine_block
+
+
+@pytest.fixture
+def block_store(tmp_path):
+    block_store = BlockStore(tmp_path / 'blocks')
+    previous_block = BLOCK_GENESIS
+
+    append_block_into_store(block_store, previous_block)
+    for _ in range(9):
+        previous_block = mine_block(previous_block, [{'from': 'network', 'to': 'eve', 'amount': 1.0}])
+        append_block_into_store(block_store, previous_block)
+
+    return block_store
+
+
+def test_blocks_are_only_read_when_they_are_accessed(block_store):
+    blockchain = LazyBlockchain(block_store)
+
+    assert len(blockchain) == 10
+    assert blockchain[-1].get_hash() == block_store.get_hash(9)
+    assert len(blockchain.cache._blocks) == 1
+
+    assert [block.index for block in blockchain[7:]] == [7, 8, 9]
+    assert [block.get_hash() for block in blockchain] == [block_store.get_hash(height) for height in range(10)]
+
+
+def test_blocks_can_be_added_without_modifying_the_blockchain(block_store):
+    blockchain = LazyBlockchain(block_store)
+    new_block = mine_block(blockchain[-1], [])
+
+    longer_blockchain = blockchain[:5] + [new_block]
+
+    assert len(blockchain) == 10
+    assert len(longer_blockchain) == 6
+    assert longer_blockchain[-1] is new_block
+    assert longer_blockchain[4].get_hash() == block_store.get_hash(4)
+
+
+def test_blocks_that_are_not_in_the_store_anymore_cannot_be_read(block_store):
+    blockchain = LazyBlockchain(block_store)
+
+    block_store.truncate(5)
+
+    with pytest.raises(Exception, match='changed while it was being read'):
+        blockchain[1]
+
+
+def test_blocks_of_a_fork_are_not_returned_if_the_store_changes_during_the_iteration(block_store):
+    blockchain = LazyBlockchain(block_store)
+    fork = [mine_block(blockchain[4], [{'from': 'network', 'to': 'bob', 'amount': 1.0}])]
+    blocks = iter(blockchain)
+
+    assert [next(blocks).index for _ in range(3)] == [0, 1, 2]
+
+    # The node switches to a fork (the blocks after it are written in the same place of the segment).
+    block_store.truncate(5)
+    append_block_into_store(block_store, fork[0])
+
+    with pytest.raises(Exception, match='changed while it was being read'):
+        next(blocks)
+
+
+def test_blocks_written_back_after_being_removed_cannot_be_read(block_store):
+    blockchain = LazyBlockchain(block_store)
+    hashes = [block.get_hash() for block in blockchain]
+    block = blockchain[9]
+
+    block_store.truncate(9)
+    append_block_into_store(block_store, block)
+
+    # They are the same blocks, but we could have read the ones written in the meantime.
+    with pytest.raises(Exception, match='changed while it was being read'):
+        list(blockchain)
+
+    assert [block.get_hash() for block in LazyBlockchain(block_store)] == hashes
@@ -0,0 +1,46 @@
+import hashlib
+import json
+
+from src.block import Block
+from src.codec import decode_block, decode_blocks, encode_block, encode_block_or_json, encode_blocks, serialize_block
+
+from .fixtures import BLOCK_GENESIS, mine_block
+
+
+def make_address(name: str) -> str:
+    return hashlib.sha256(name.encode()).hexdigest()
+
+
+def make_block() -> Block:
+    transactions = []
+
+    for sender, receiver in (('alice', 'bob'), ('carol', 'dave'), ('eve', 'frank')):
+        transactions.append({'from': make_address(sender), 'to': make_address('miner'), 'amount': 0.5,
+                             'timestamp': 1700000000.123456})
+        transactions.append({'from': make_address(sender), 'to': make_address(receiver), 'amount': 12,
+                             'timestamp': 1700000000.123456})
+
+    return mine_block(BLOCK_GENESIS, transactions)
+
+
+def test_blocks_are_the_same_after_encoding_and_decoding_them():
+    for block in [BLOCK_GENESIS, make_block()]:
+        decoded_block = decode_block(encode_block(block))
+
+        assert json.dumps(serialize_block(decoded_block)) == json.dumps(serialize_block(block))
+        assert decoded_block.get_hash() == block.get_hash()
+
+
+def test_binary_blocks_are_at_least_three_times_smaller_than_json():
+    block = make_block()
+
+    assert len(encode_block(block)) * 3 <= len(json.dumps(serialize_block(block)))
+
+
+def test_blocks_that_cannot_be_encoded_are_sent_as_json():
+    block = Block(1, 1.0, {'nonce': 1, 'transactions': [], 'note': 'hi'}, BLOCK_GENESIS.get_hash())
+
+    encoded_block = encode_block_or_json(block)
+
+    assert encoded_block.startswith(b'{')
+    assert [b.data for b in decode_blocks(encode_blocks([BLOCK_GENESIS, block]))] == [BLOCK_GENESIS.data, block.data]
@@ -0,0 +1,64 @@
+from src.block import Block
+from src.ledger import Ledger
+from src.utils import has_account_enough_funds
+
+from .fixtures import BLOCKCHAIN, TRANSACTION_1, TRANSACTION_2
+
+
+def make_block(previous_block: Block, to_address: str, amount: float) -> Block:
+    return Block(
+        previous_block.index + 1,
+        previous_block.timestamp,
+        {
+            'nonce': 1,
+            'transactions': [{'from': 'network', 'to': to_address, 'amount': amount}]
+        },
+        previous_block.get_hash()
+    )
+
+
+def test_ledger_is_updated_with_the_blocks_of_the_blockchain():
+    ledger = Ledger()
+    ledger.sync(BLOCKCHAIN)
+
+    assert ledger.height == 2
+    assert ledger.get_balance('network') == 1000000000 - 10
+    assert ledger.get_balance('eve') == 10
+
+    assert has_account_enough_funds(ledger, TRANSACTION_1)
+    assert not has_account_enough_funds(ledger, TRANSACTION_2)
+
+
+def test_ledger_only_undoes_the_blocks_after_the_fork_point():
+    blockchain = BLOCKCHAIN + [make_block(BLOCKCHAIN[-1], 'bob', 5)]
+    other_blockchain = BLOCKCHAIN + [make_block(BLOCKCHAIN[-1], 'john', 7)]
+    other_blockchain.append(make_block(other_blockchain[-1], 'john', 1))
+
+    ledger = Ledger()
+    ledger.sync(blockchain)
+
+    assert ledger.get_fork_height(other_blockchain) == 2
+
+    ledger.sync(other_blockchain)
+
+    assert ledger.height == 4
+    assert ledger.get_balance('bob') == 0
+    assert ledger.get_balance('john') == 8
+    assert ledger.tip_hash == other_blockchain[-1].get_hash()
+
+
+def test_ledger_starts_from_scratch_if_the_fork_is_too_old():
+    blockchain = BLOCKCHAIN + [make_block(BLOCKCHAIN[-1], 'bob', 5)]
+    other_blockchain = BLOCKCHAIN[:1] + [make_block(BLOCKCHAIN[0], 'john', 7)]
+
+    ledger = Ledger(max_rollback_depth=1)
+    ledger.sync(blockchain)
+
+    assert ledger.get_fork_height(other_blockchain) is None
+
+    ledger.sync(other_blockchain)
+
+    assert ledger.height == 2
+    assert ledger.get_balance('bob') == 0
+    assert ledger.get_balance('eve') == 0
+    assert ledger.get_balance('john') == 7
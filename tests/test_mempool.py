@@ -0,0 +1,41 @@
+from src.block import Block
+from src.mempool import Mempool
+
+
+def make_transaction(amount: float, transaction_fee: float) -> dict:
+    return {
+        'from': 'network',
+        'to': 'eve',
+        'amount': amount,
+        'transaction_fee': transaction_fee,
+        'timestamp': 1.0
+    }
+
+
+def test_transactions_with_higher_fees_come_out_first():
+    mempool = Mempool([make_transaction(1.0, 0.1), make_transaction(2.0, 0.3), make_transaction(3.0, 0.2)])
+
+    assert [mempool.pop_best()['amount'] for _ in range(3)] == [2.0, 3.0, 1.0]
+    assert mempool.pop_best() is None
+    assert not mempool
+
+
+def test_duplicated_transactions_are_ignored():
+    mempool = Mempool()
+
+    assert mempool.add(make_transaction(1.0, 0.1))
+    assert not mempool.add(make_transaction(1.0, 0.1))
+    assert len(mempool) == 1
+
+
+def test_transactions_confirmed_in_a_block_are_removed():
+    mempool = Mempool([make_transaction(1.0, 0.1), make_transaction(2.0, 0.3)])
+
+    block = Block(1, 1.0, {'nonce': 1, 'transactions': [
+        {'from': 'network', 'to': 'miner', 'amount': 0.3, 'timestamp': 1.0},
+        {'from': 'network', 'to': 'eve', 'amount': 2.0, 'timestamp': 1.0}
+    ]})
+
+    assert mempool.remove_confirmed([block]) == 1
+    assert mempool.pop_best()['amount'] == 1.0
+    assert mempool.pop_best() is None
@@ -0,0 +1,52 @@
+import pytest
+
+from src.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_metrics_are_rendered_in_the_prometheus_text_format():
+    registry = Registry()
+    hashes = Counter('hashes_total', 'Nonces tried.', registry=registry)
+    height = Gauge('height', 'Number of blocks.', registry=registry)
+    latency = Histogram('latency_seconds', 'Latency.', ['peer'], buckets=(0.1, 1), registry=registry)
+
+    hashes.inc(10)
+    hashes.inc(5)
+    height.set(3)
+    latency.observe(0.05, peer='http://node-"1"')
+    latency.observe(0.5, peer='http://node-"1"')
+    latency.observe(5, peer='http://node-"1"')
+
+    assert registry.render() == '\n'.join([
+        '# HELP hashes_total Nonces tried.',
+        '# TYPE hashes_total counter',
+        'hashes_total 15.0',
+        '# HELP height Number of blocks.',
+        '# TYPE height gauge',
+        'height 3.0',
+        '# HELP latency_seconds Latency.',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{peer="http://node-\\"1\\"",le="0.1"} 1',
+        'latency_seconds_bucket{peer="http://node-\\"1\\"",le="1.0"} 2',
+        'latency_seconds_bucket{peer="http://node-\\"1\\"",le="+Inf"} 3',
+        'latency_seconds_sum{peer="http://node-\\"1\\""} 5.55',
+        'latency_seconds_count{peer="http://node-\\"1\\""} 3',
+    ]) + '\n'
+
+
+def test_histograms_time_functions_even_if_they_fail():
+    registry = Registry()
+    latency = Histogram('latency_seconds', 'Latency.', ['operation'], registry=registry)
+
+    @latency.time(operation='load')
+    def load():
+        raise OSError()
+
+    with pytest.raises(OSError):
+        load()
+    with latency.time(operation='save'):
+        pass
+
+    assert latency.get_count(operation='load') == latency.get_count(operation='save') == 1
+
+    with pytest.raises(Exception):
+        latency.observe(1.0, peer='http://node-1')
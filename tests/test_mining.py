@@ -0,0 +1,37 @@
+import threading
+import time
+
+import pytest
+
+from src.block import Block
+from src.mining import MiningCancelled, find_nonce
+
+from .fixtures import BLOCK_GENESIS
+
+
+def create_block() -> Block:
+    return Block(1, BLOCK_GENESIS.timestamp + 1, {'nonce': 0, 'transactions': []}, BLOCK_GENESIS.get_hash())
+
+
+@pytest.mark.parametrize('number_of_workers', [1, 2])
+def test_nonce_found_makes_the_hash_start_by_zeroes(number_of_workers):
+    block = create_block()
+
+    # Small ranges, so both workers take part.
+    block.data['nonce'] = find_nonce(block, 3, number_of_workers=number_of_workers, range_size=100)
+
+    assert block.calculate_hash().startswith('000')
+
+
+@pytest.mark.parametrize('number_of_workers', [1, 2])
+def test_proof_of_work_stops_soon_after_being_cancelled(number_of_workers):
+    cancelled = threading.Event()
+    # It would take hours to find a nonce with this difficulty level.
+    timer = threading.Timer(0.2, cancelled.set)
+    timer.start()
+    start = time.monotonic()
+
+    with pytest.raises(MiningCancelled):
+        find_nonce(create_block(), 16, number_of_workers=number_of_workers, cancelled=cancelled)
+
+    assert time.monotonic() - start < 2
@@ -0,0 +1,149 @@
+import threading
+import time
+
+import pytest
+
+from src import node_miner, utils
+from src.block import Block
+from src.mining import MiningCancelled, find_nonce
+from src.node_miner import MiningTrigger
+from src.node_state import NodeState
+from src.utils import get_transaction_id
+
+from .fixtures import mine_block
+
+
+def add_transaction(node_state: NodeState, amount: float, transaction_fee: float = 0.1) -> None:
+    node_state.mempool.add(
+        {'from': 'network', 'to': 'eve', 'amount': amount, 'transaction_fee': transaction_fee, 'timestamp': amount})
+
+
+def test_miner_waits_until_there_is_something_to_mine(node_state):
+    trigger = MiningTrigger(min_pending_transactions=3, min_pending_fees=1.0, max_wait=10)
+
+    assert trigger.get_reason_to_mine(node_state, now=0) is None
+    assert trigger.get_seconds_until_max_wait(now=0) is None
+
+    add_transaction(node_state, 1.0)
+    assert trigger.get_reason_to_mine(node_state, now=1) == 'pending transactions'
+
+    # Nothing changed since the last round, and there are not enough transactions to mine right away.
+    assert trigger.get_reason_to_mine(node_state, now=2) is None
+    add_transaction(node_state, 2.0)
+    assert trigger.get_reason_to_mine(node_state, now=3) is None
+    assert trigger.get_seconds_until_max_wait(now=3) == 8
+    assert trigger.get_reason_to_mine(node_state, now=11) == 'pending transactions waited too long'
+
+    add_transaction(node_state, 3.0)
+    assert trigger.get_reason_to_mine(node_state, now=12) == 'enough pending transactions'
+
+    add_transaction(node_state, 4.0, transaction_fee=1.0)
+    assert trigger.get_reason_to_mine(node_state, now=13) == 'enough pending transactions'
+
+    node_state.append_blocks([mine_block(node_state.get_blockchain()[-1], [])])
+    assert trigger.get_reason_to_mine(node_state, now=14) == 'new block'
+
+
+def test_miner_does_not_wake_up_for_a_new_block_if_there_is_nothing_to_mine(node_state):
+    trigger = MiningTrigger()
+
+    node_state.append_blocks([mine_block(node_state.get_blockchain()[-1], [])])
+
+    assert trigger.get_reason_to_mine(node_state, now=0) is None
+
+
+def test_proof_of_work_stops_when_it_is_cancelled():
+    block = Block(1, 1.0, {'nonce': 0, 'transactions': []}, '00' * 32)
+    cancelled = threading.Event()
+    threading.Timer(0.1, cancelled.set).start()
+
+    start = time.perf_counter()
+    with pytest.raises(MiningCancelled):
+        # No nonce makes the hash start by 64 zeroes.
+        find_nonce(block, 64, number_of_workers=2, range_size=1000, cancelled=cancelled)
+
+    assert time.perf_counter() - start < 2
+
+
+def test_miner_is_told_when_the_tip_changes(node_state):
+    tip_hash = node_state.get_blockchain()[-1].get_hash()
+
+    with node_state.watch_tip(tip_hash) as tip_changed:
+        assert not tip_changed.is_set()
+
+        node_state.append_blocks([mine_block(node_state.get_blockchain()[-1], [])])
+        assert tip_changed.is_set()
+
+    # It's already stale.
+    with node_state.watch_tip(tip_hash) as tip_changed:
+        assert tip_changed.is_set()
+
+
+def test_miner_mines_again_on_top_of_a_block_that_arrives_while_mining(node_state, monkeypatch):
+    monkeypatch.setenv('PROOF_OF_WORK_WORKERS', '1')
+    monkeypatch.setattr(node_miner, 'get_states_from_all_other_nodes', lambda node_url, network_nodes_urls: [])
+    monkeypatch.setattr(node_miner, 'consensus', lambda network_nodes_urls, blockchain: blockchain)
+    monkeypatch.setattr(node_miner, 'propagate_blockchain_in_network', lambda *args: None)
+
+    add_transaction(node_state, 1.0, transaction_fee=0.2)
+    add_transaction(node_state, 2.0, transaction_fee=0.1)
+    [confirmed_by_another_node, still_pending] = sorted(node_state.mempool, key=lambda tx: tx['amount'])
+
+    attempts = []
+
+    def mine_coin(blockchain, transactions, miner_account_address, difficulty_level, mining_time, cancelled):
+        attempts.append(transactions)
+
+        if len(attempts) == 1:
+            # Another node mines the first transaction while we are mining.
+            block, _, _ = utils.mine_coin(blockchain, [confirmed_by_another_node], 'another miner', 1, 20)
+            node_state.append_blocks([block])
+
+        return utils.mine_coin(blockchain, transactions, miner_account_address, 1, 20, cancelled=cancelled)
+
+    monkeypatch.setattr(node_miner, 'mine_coin', mine_coin)
+
+    node_miner.mine(node_state)
+
+    blockchain = node_state.get_blockchain()
+    assert attempts == [[confirmed_by_another_node, still_pending], [still_pending]]
+    assert len(blockchain) == 3
+    assert blockchain[-1].previous_hash == blockchain[-2].get_hash()
+    assert get_transaction_id(still_pending) in [get_transaction_id(tx) for tx in blockchain[-1].data['transactions']]
+    assert node_state.state['verified_transactions'] == [still_pending]
+    assert not node_state.mempool
+
+
+def test_miner_mines_again_if_another_blockchain_replaces_the_one_it_was_mining_on(node_state, monkeypatch):
+    monkeypatch.setenv('PROOF_OF_WORK_WORKERS', '1')
+    monkeypatch.setattr(node_miner, 'get_states_from_all_other_nodes', lambda node_url, network_nodes_urls: [])
+    monkeypatch.setattr(node_miner, 'consensus', lambda network_nodes_urls, blockchain: blockchain)
+    monkeypatch.setattr(node_miner, 'propagate_blockchain_in_network', lambda *args: None)
+
+    genesis_block = node_state.get_blockchain()[0]
+    node_state.append_blocks([mine_block(genesis_block, [])])
+    add_transaction(node_state, 1.0)
+    [transaction] = node_state.mempool
+
+    attempts = []
+
+    def mine_coin(blockchain, transactions, miner_account_address, difficulty_level, mining_time, cancelled):
+        attempts.append(transactions)
+
+        if len(attempts) == 1:
+            # A longer fork (from the genesis block) replaces the blockchain we are about to read.
+            block = mine_block(genesis_block, [{'from': 'network', 'to': 'eve', 'amount': 1.0, 'timestamp': 2.0}])
+            node_state.replace_blockchain([genesis_block, block, mine_block(block, [])])
+
+        return utils.mine_coin(blockchain, transactions, miner_account_address, 1, 20, cancelled=cancelled)
+
+    monkeypatch.setattr(node_miner, 'mine_coin', mine_coin)
+
+    node_miner.mine(node_state)
+
+    blockchain = node_state.get_blockchain()
+    assert attempts == [[transaction], [transaction]]
+    assert len(blockchain) == 4
+    assert get_transaction_id(transaction) in [get_transaction_id(tx) for tx in blockchain[-1].data['transactions']]
+    assert node_state.state['verified_transactions'] == [transaction]
+    assert not node_state.mempool
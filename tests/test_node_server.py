@@ -0,0 +1,384 @@
+import json
+from urllib.parse import urlparse
+
+import pytest
+import requests
+
+from src.codec import BINARY_MIMETYPE, decode_blocks, encode_blocks
+from src import validation
+from src.node_server import create_app
+from src.node_state import NodeState
+from src.utils import get_transaction_id, serialize_block
+from src.wallet import main as wallet
+
+from .fixtures import mine_block
+
+
+@pytest.fixture
+def client(node_state):
+    return create_app(node_state).test_client()
+
+
+@pytest.fixture
+def wallet_requests(client, tmp_path, monkeypatch):
+    """
+    Makes the wallet talk to the test client instead of a real node.
+
+    :return: the paths requested by the wallet
+    """
+    paths = []
+
+    def get(url: str, **kwargs) -> requests.Response:
+        paths.append(urlparse(url).path)
+        test_response = client.get(url, query_string=kwargs.get('params'))
+
+        response = requests.Response()
+        response.status_code, response._content = test_response.status_code, test_response.data
+
+        return response
+
+    monkeypatch.setattr(wallet, 'NODE_URL', 'http://localhost/')
+    monkeypatch.setattr(wallet, 'WALLET_CACHE_DIR', str(tmp_path / 'wallet'))
+    monkeypatch.setattr(wallet.requests, 'get', get)
+
+    return paths
+
+
+def test_blockchain_is_not_sent_again_if_it_did_not_change(client, node_state):
+    r = client.get('/blockchain')
+
+    assert r.status_code == 200
+    assert len(json.loads(r.data)) == 1
+    assert node_state.serialized_blockchain_cache is not None
+
+    r = client.get('/blockchain', headers={'If-None-Match': r.headers['ETag']})
+
+    assert r.status_code == 304
+    assert not r.data
+
+
+def test_blockchain_cache_is_discarded_when_the_blockchain_changes(client, node_state):
+    etag = client.get('/blockchain').headers['ETag']
+
+    blockchain = node_state.get_blockchain()
+    node_state.replace_blockchain(blockchain + [mine_block(blockchain[0], [])])
+
+    assert node_state.serialized_blockchain_cache is None
+
+    r = client.get('/blockchain', headers={'If-None-Match': etag})
+
+    assert r.status_code == 200
+    assert r.headers['ETag'] != etag
+    assert len(json.loads(r.data)) == 2
+
+
+def test_blockchain_stream_is_aborted_if_the_node_switches_to_a_fork(client, node_state):
+    blockchain = node_state.get_blockchain()
+    for _ in range(3):
+        blockchain = blockchain + [mine_block(blockchain[-1], [])]
+    node_state.replace_blockchain(blockchain)
+
+    fork = list(blockchain[:2])
+    for amount in range(1, 4):
+        fork.append(mine_block(fork[-1], [{'from': 'network', 'to': 'eve', 'amount': amount, 'timestamp': 1.0}]))
+
+    r = client.get('/blockchain', buffered=False)
+    chunks = r.iter_encoded()
+
+    assert json.loads(next(chunks)[1:])['index'] == 0
+
+    # The blocks after it are written where the ones we were going to send were.
+    node_state.replace_blockchain(fork)
+
+    with pytest.raises(Exception, match='changed while it was being read'):
+        list(chunks)
+
+    r.close()
+
+    assert node_state.serialized_blockchain_cache is None
+    assert [block['index'] for block in json.loads(client.get('/blockchain').data)] == [0, 1, 2, 3, 4]
+    assert node_state.serialized_blockchain_cache is not None
+
+
+def test_transactions_are_created_in_batch(client, node_state):
+    r = client.post('/transactions', data=json.dumps([
+        {'from': 'network', 'to': 'eve', 'amount': 3.0, 'transaction_fee': 0.1},
+        {'from': 'network', 'to': 'eve', 'amount': 3.0, 'transaction_fee': 0.001},
+        {'from': 'network', 'to': 'bob', 'amount': 4.0, 'transaction_fee': 0.2},
+        {'from': 'network', 'to': 'bob', 'amount': 'x', 'transaction_fee': 0.2},
+        'not a transaction',
+    ]))
+
+    assert r.status_code == 201
+
+    results = json.loads(r.data)
+
+    assert [result['status'] for result in results] == [201, 400, 201, 400, 400]
+    assert results[0]['transaction_id'] in node_state.mempool
+    assert results[2]['transaction_id'] in node_state.mempool
+    assert len(node_state.mempool) == 2
+
+
+@pytest.mark.parametrize('transaction', [
+    {'from': 'network', 'to': 5, 'amount': 3.0, 'transaction_fee': 0.1},
+    {'from': ['network'], 'to': 'eve', 'amount': 3.0, 'transaction_fee': 0.1},
+    {'from': 'network', 'to': 'eve', 'amount': '3.0', 'transaction_fee': 0.1},
+    {'from': 'network', 'to': 'eve', 'amount': 3.0, 'transaction_fee': True},
+    {'from': 'network', 'to': 'eve', 'amount': float('inf'), 'transaction_fee': 0.1},
+    {'from': 'network', 'to': 'e' * 70000, 'amount': 3.0, 'transaction_fee': 0.1},
+    ['network', 'eve', 3.0, 0.1],
+])
+def test_transactions_with_attributes_of_the_wrong_type_are_rejected(client, node_state, transaction):
+    r = client.post('/transaction', data=json.dumps(transaction))
+
+    assert r.status_code == 400
+    assert not node_state.mempool
+
+
+def test_batch_fails_if_no_transaction_was_added(client, node_state):
+    transaction = {'from': 'network', 'to': 'eve', 'amount': 3.0, 'transaction_fee': 0.1}
+    client.post('/transaction', data=json.dumps(transaction))
+
+    r = client.post('/transactions', data=json.dumps([
+        {'from': 'network', 'to': 'eve', 'amount': 'x', 'transaction_fee': 0.1},
+    ]))
+
+    assert r.status_code == 400
+    assert [result['status'] for result in json.loads(r.data)] == [400]
+    assert len(node_state.mempool) == 1
+
+
+def test_transactions_must_be_a_list(client):
+    r = client.post('/transactions', data=json.dumps({'from': 'network', 'to': 'eve'}))
+
+    assert r.status_code == 400
+
+
+def test_blocks_are_exchanged_in_the_binary_format_when_asked_for(client, node_state):
+    genesis_block = node_state.get_blockchain()[0]
+    block = mine_block(genesis_block, [{'from': 'network', 'to': 'eve', 'amount': 3.0, 'timestamp': 1.0}])
+
+    r = client.post('/blocks', data=encode_blocks([block]), content_type=BINARY_MIMETYPE,
+                    headers={'Host': 'localhost'})
+
+    assert r.status_code == 202
+
+    r = client.get('/blocks?from=1', headers={'Accept': BINARY_MIMETYPE})
+
+    assert r.mimetype == BINARY_MIMETYPE
+    assert [b.get_hash() for b in decode_blocks(r.data)] == [block.get_hash()]
+
+    r = client.get('/blocks?from=1')
+
+    assert json.loads(r.data)[0]['data'] == block.data
+
+
+@pytest.mark.parametrize('path', [
+    '/blocks?from=-1',
+    '/headers?from=-1',
+    '/headers?from=0&to=-1',
+])
+def test_negative_heights_are_rejected(client, path):
+    r = client.get(path)
+
+    assert r.status_code == 400
+    assert r.data == b'Heights cannot be negative.'
+
+
+def test_posted_blocks_only_replace_blocks_with_less_work(client, node_state):
+    blockchain = node_state.get_blockchain()
+    for _ in range(4):
+        blockchain = blockchain + [mine_block(blockchain[-1], [])]
+    node_state.replace_blockchain(blockchain)
+
+    fork = list(blockchain[:2])
+    for amount in range(1, 5):
+        fork.append(mine_block(fork[-1], [{'from': 'network', 'to': 'eve', 'amount': amount, 'timestamp': 1.0}]))
+
+    def post_blocks(blocks):
+        return client.post('/blocks', data=encode_blocks(blocks), content_type=BINARY_MIMETYPE)
+
+    # A stale block (and a fork with as much work as the blocks it would replace) would cut our blockchain.
+    assert post_blocks(fork[2:3]).status_code == 409
+    assert post_blocks(fork[2:5]).status_code == 409
+    assert json.loads(client.get('/tip').data)['height'] == 5
+    assert node_state.get_blockchain()[-1].get_hash() == blockchain[-1].get_hash()
+
+    # Blocks we already have are ignored.
+    assert post_blocks(blockchain[1:]).status_code == 202
+    assert node_state.get_blockchain()[-1].get_hash() == blockchain[-1].get_hash()
+
+    assert post_blocks(fork[2:]).status_code == 202
+    assert [block.get_hash() for block in node_state.get_blockchain()] == [block.get_hash() for block in fork]
+
+
+def test_balance_and_transactions_of_an_account(client, node_state):
+    blockchain = node_state.get_blockchain()
+    block = mine_block(blockchain[0], [
+        {'from': 'network', 'to': 'eve', 'amount': 3.0, 'timestamp': 1.0},
+        {'from': 'network', 'to': 'eve', 'amount': 4.0, 'timestamp': 2.0}
+    ])
+    node_state.replace_blockchain(blockchain + [block])
+
+    r = client.get('/accounts/eve/balance')
+
+    assert json.loads(r.data) == {'address': 'eve', 'balance': 7.0, 'height': 2}
+
+    r = client.get('/accounts/eve/transactions?offset=1&limit=1')
+    page = json.loads(r.data)
+
+    assert page['total'] == 2
+    assert page['transactions'] == [{'from': 'network', 'to': 'eve', 'amount': 4.0, 'timestamp': 2.0,
+                                     'block_index': 1, 'block_hash': block.get_hash()}]
+
+
+def test_wallet_verifies_the_proof_of_a_transaction(client, node_state, wallet_requests):
+    transaction = {'from': 'network', 'to': 'eve', 'amount': 3.0, 'timestamp': 1.0}
+
+    blockchain = node_state.get_blockchain()
+    blockchain = blockchain + [mine_block(blockchain[-1], [dict(transaction, amount=1.0), transaction])]
+    blockchain = blockchain + [mine_block(blockchain[-1], [])]
+    node_state.replace_blockchain(blockchain)
+
+    assert wallet.verify_transaction(get_transaction_id(transaction)) == 1
+
+    assert client.get(f'/transactions/{"0" * 64}/proof').status_code == 404
+
+
+@pytest.mark.parametrize('field, value', [
+    ('previous_hash', 'not hex' * 9),
+    ('previous_hash', '00' * 31),
+    ('difficulty_level', 'x'),
+    ('difficulty_level', 300),
+    ('index', -1),
+    ('nonce', -1),
+    ('amount', '5'),
+    ('amount', None),
+    ('amount', [5]),
+])
+def test_malformed_blocks_are_rejected(client, node_state, field, value):
+    blockchain = node_state.get_blockchain()
+    transaction = {'from': 'network', 'to': 'eve', 'amount': 1.0, 'timestamp': 1.0}
+    block = serialize_block(mine_block(blockchain[-1], [transaction]))
+    block['data'] = dict(block['data'], transactions=[dict(tx) for tx in block['data']['transactions']])
+
+    if field in block:
+        block[field] = value
+    elif field in block['data']:
+        block['data'][field] = value
+    else:
+        block['data']['transactions'][0][field] = value
+
+    assert client.post('/blocks', data=json.dumps([block])).status_code == 400
+    assert client.put('/blockchain', data=json.dumps([serialize_block(blockchain[0]), block])).status_code == 400
+    assert json.loads(client.get('/tip').data)['height'] == 1
+
+
+def test_blockchain_is_not_replaced_by_a_shorter_one(client, node_state):
+    blockchain = node_state.get_blockchain()
+    for _ in range(4):
+        blockchain = blockchain + [mine_block(blockchain[-1], [])]
+    node_state.replace_blockchain(blockchain)
+
+    r = client.put('/blockchain', data=json.dumps([serialize_block(blockchain[0])]))
+
+    assert r.status_code == 400
+    assert json.loads(client.get('/tip').data)['height'] == 5
+
+
+def test_blockchain_with_too_much_work_is_rejected_without_touching_the_stored_one(client, node_state):
+    blockchain = node_state.get_blockchain()
+    node_state.replace_blockchain(blockchain + [mine_block(blockchain[-1], [])])
+
+    genesis_block = serialize_block(node_state.get_blockchain()[0])
+    genesis_block['data']['difficulty_level'] = 40
+
+    r = client.put('/blockchain', data=json.dumps([genesis_block]))
+
+    assert r.status_code == 400
+    assert json.loads(client.get('/tip').data)['height'] == 2
+    assert client.get('/blockchain').status_code == 200
+
+
+def test_wallet_rejects_proofs_with_blocks_below_the_minimum_difficulty_level(node_state, wallet_requests, monkeypatch):
+    transaction = {'from': 'network', 'to': 'eve', 'amount': 3.0, 'timestamp': 1.0}
+
+    # The node accepts blocks that the rest of the network would reject.
+    monkeypatch.setattr(validation, 'MIN_PROOF_OF_WORK_DIFFICULTY_LEVEL', 1)
+    blockchain = node_state.get_blockchain()
+    node_state.replace_blockchain(blockchain + [mine_block(blockchain[-1], [transaction], difficulty_level=1)])
+
+    with pytest.raises(Exception, match='wasn\'t mined with the difficulty level of the network'):
+        wallet.verify_transaction(get_transaction_id(transaction))
+
+
+def test_wallet_checks_the_proof_against_the_blockchain_of_the_trusted_node(node_state, wallet_requests, monkeypatch):
+    transaction = {'from': 'network', 'to': 'eve', 'amount': 3.0, 'timestamp': 1.0}
+
+    genesis_block = node_state.get_blockchain()[0]
+    block = mine_block(genesis_block, [transaction])
+    node_state.replace_blockchain([genesis_block, block])
+
+    # The trusted node is on a different (and longer) blockchain, where the transaction isn't.
+    trusted_node_state = NodeState('trusted', 'http://trusted', ['http://trusted'])
+    fork_block = mine_block(genesis_block, [])
+    trusted_node_state.replace_blockchain([genesis_block, fork_block, mine_block(fork_block, [])])
+    trusted_client = create_app(trusted_node_state).test_client()
+
+    get = wallet.requests.get
+
+    def get_from_node(url: str, **kwargs) -> requests.Response:
+        if not url.startswith('http://trusted/'):
+            return get(url, **kwargs)
+
+        test_response = trusted_client.get(url, query_string=kwargs.get('params'))
+
+        response = requests.Response()
+        response.status_code, response._content = test_response.status_code, test_response.data
+
+        return response
+
+    monkeypatch.setattr(wallet.requests, 'get', get_from_node)
+    monkeypatch.setattr(wallet, 'TRUSTED_NODE_URL', 'http://trusted/')
+
+    with pytest.raises(Exception, match='aren\'t in the blockchain of the network'):
+        wallet.verify_transaction(get_transaction_id(transaction))
+
+    blockchain = [genesis_block, block, mine_block(block, [])]
+    trusted_node_state.replace_blockchain(blockchain + [mine_block(blockchain[-1], [])])
+
+    assert wallet.verify_transaction(get_transaction_id(transaction)) == 2
+
+
+def test_wallet_only_downloads_what_changed_since_last_time(node_state, wallet_requests):
+    genesis_block = node_state.get_blockchain()[0]
+    block = mine_block(genesis_block, [{'from': 'network', 'to': 'eve', 'amount': 3.0, 'timestamp': 1.0}])
+    node_state.replace_blockchain([genesis_block, block])
+
+    assert wallet.get_balance_for_account('eve', wallet.sync_transactions_for_account('eve')) == 3.0
+
+    wallet_requests.clear()
+
+    assert len(wallet.sync_transactions_for_account('eve')) == 1
+    assert wallet_requests == ['/tip']
+
+    # The network switches to a fork where Eve got a different transaction.
+    fork_block = mine_block(genesis_block, [{'from': 'network', 'to': 'eve', 'amount': 5.0, 'timestamp': 2.0}])
+    node_state.replace_blockchain([genesis_block, fork_block, mine_block(fork_block, [])])
+
+    assert wallet.get_balance_for_account('eve', wallet.sync_transactions_for_account('eve')) == 5.0
+
+
+def test_metrics_of_the_node_and_its_miner(client, node_state):
+    client.post('/transaction', data=json.dumps({'from': 'network', 'to': 'eve', 'amount': 5.0, 'transaction_fee': 1.0}))
+    mine_block(node_state.get_blockchain()[-1], [])
+
+    r = client.get('/metrics')
+    metrics = r.get_data(as_text=True)
+
+    assert r.status_code == 200
+    assert r.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    assert 'simplecoin_blockchain_height 1.0' in metrics
+    assert 'simplecoin_transactions{status="pending"} 1.0' in metrics
+    assert 'simplecoin_proof_of_work_hashes_total ' in metrics
+    assert 'simplecoin_storage_seconds_count{operation="load_state_from_file"} ' in metrics
@@ -0,0 +1,126 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from src.address_index import AddressIndex
+from src.node_state import NodeState
+from src.storage import BlockStore
+from src.utils import block_stores, get_transaction_id
+
+from .fixtures import mine_block
+
+TRANSACTION = {'from': 'network', 'to': 'eve', 'amount': 1.0, 'transaction_fee': 0.1, 'timestamp': 1.0}
+
+
+def restart(node_state: NodeState) -> NodeState:
+    node_state.block_store.close()
+    block_stores.clear()
+
+    return NodeState(node_state.miner_account_address, node_state.node_url, node_state.network_nodes_urls)
+
+
+def test_state_does_not_include_the_pending_transactions(node_state):
+    node_state.mempool.add(TRANSACTION)
+
+    state = node_state.get_state()
+
+    assert 'pending_transactions' not in state
+    assert state['pending_transactions_count'] == 1
+
+
+def test_pending_transactions_are_saved_apart_from_the_state(node_state):
+    node_state.mempool.add(TRANSACTION)
+    node_state.persist()
+    node_state.persist_mempool()
+
+    assert 'pending_transactions' not in json.loads(Path('miners/miner/state.txt').read_text())
+    assert restart(node_state).mempool.to_list() == [TRANSACTION]
+
+
+def test_pending_transactions_saved_in_the_state_by_older_nodes_are_loaded(node_state):
+    node_state.persist()
+    state = json.loads(Path('miners/miner/state.txt').read_text())
+    Path('miners/miner/state.txt').write_text(json.dumps(dict(state, pending_transactions=[TRANSACTION])))
+
+    node_state = restart(node_state)
+
+    assert node_state.mempool.to_list() == [TRANSACTION]
+    assert 'pending_transactions' not in node_state.state
+
+
+def test_address_index_is_saved_and_only_new_blocks_are_indexed_on_restart(node_state, monkeypatch):
+    block_1 = mine_block(node_state.blockchain[-1], [{'from': 'network', 'to': 'eve', 'amount': 10, 'timestamp': 1.0}])
+    node_state.append_blocks([block_1])
+    node_state.persist()
+
+    checkpoint = Path('miners/miner/address_index.txt').read_text()
+    assert Path('miners/miner/address_index.log').read_text() == ''
+
+    # Only the changes of the new block are written.
+    block_2 = mine_block(block_1, [{'from': 'eve', 'to': 'bob', 'amount': 5, 'timestamp': 2.0}])
+    node_state.append_blocks([block_2])
+    node_state.persist()
+
+    assert Path('miners/miner/address_index.txt').read_text() == checkpoint
+    assert [json.loads(line)['hash'] for line in Path('miners/miner/address_index.log').read_text().splitlines()] == [
+        block_2.get_hash()]
+
+    block_3 = mine_block(block_2, [{'from': 'bob', 'to': 'alice', 'amount': 1, 'timestamp': 3.0}])
+    node_state.append_blocks([block_3])
+
+    indexed_blocks = []
+    add_block = AddressIndex.add_block
+    monkeypatch.setattr(AddressIndex, 'add_block', lambda self, block: indexed_blocks.append(block) or add_block(self, block))
+
+    node_state = restart(node_state)
+
+    assert [block.get_hash() for block in indexed_blocks] == [block_3.get_hash()]
+    assert node_state.address_index.get_locations('eve') == [(1, 0), (2, 0)]
+    assert node_state.address_index.get_locations('bob') == [(2, 0), (3, 0)]
+    assert node_state.address_index.get_transaction_location(
+        get_transaction_id(block_1.data['transactions'][0])) == (1, 0)
+
+
+def test_blockchain_saved_by_older_nodes_is_ignored_and_kept(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    block_stores.clear()
+
+    legacy_blockchain = [{'index': 0, 'timestamp': 1.0, 'data': {'nonce': 1, 'transactions': []}, 'previous_hash': None}]
+    Path('miners/miner').mkdir(parents=True)
+    Path('miners/miner/blockchain.txt').write_text(json.dumps(legacy_blockchain))
+
+    node_state = NodeState('miner', 'http://localhost', ['http://localhost'])
+
+    assert len(node_state.blockchain) == 1
+    assert node_state.blockchain[0].data['transactions'][0]['from'] == 'genesis'
+    assert json.loads(Path('miners/miner/blockchain.txt').read_text()) == legacy_blockchain
+
+
+def test_blockchain_is_intact_if_the_blocks_of_a_fork_cannot_be_written(node_state, monkeypatch):
+    genesis_block = node_state.blockchain[0]
+    blockchain = [genesis_block, mine_block(genesis_block, [])]
+    blockchain.append(mine_block(blockchain[-1], []))
+    node_state.replace_blockchain(blockchain)
+
+    fork = [genesis_block, mine_block(genesis_block, [{'from': 'network', 'to': 'eve', 'amount': 1, 'timestamp': 1.0}])]
+    fork.append(mine_block(fork[-1], []))
+    fork.append(mine_block(fork[-1], []))
+
+    append = BlockStore.append
+
+    def append_failing_on_the_last_block(self, block_hash, record, work=0):
+        if block_hash == fork[-1].get_hash():
+            raise OSError('No space left on device')
+
+        append(self, block_hash, record, work)
+
+    monkeypatch.setattr(BlockStore, 'append', append_failing_on_the_last_block)
+
+    with pytest.raises(OSError):
+        node_state.replace_blockchain(fork)
+
+    monkeypatch.setattr(BlockStore, 'append', append)
+
+    assert [block.get_hash() for block in node_state.blockchain] == [block.get_hash() for block in blockchain]
+    assert [block.get_hash() for block in restart(node_state).blockchain] == [block.get_hash() for block in blockchain]
@@ -0,0 +1,39 @@
+import time
+
+import requests
+
+from src.peers import PeerClient
+
+
+def test_fan_out_returns_the_result_of_every_node_in_order():
+    peer_client = PeerClient()
+
+    def fn(node_url):
+        if node_url == 'http://node2':
+            raise requests.exceptions.ConnectionError()
+
+        return node_url.upper()
+
+    results = peer_client.fan_out(['http://node1', 'http://node2', 'http://node3'], fn)
+
+    assert [node_url for node_url, _, _ in results] == ['http://node1', 'http://node2', 'http://node3']
+    assert results[0][1] == 'HTTP://NODE1'
+    assert isinstance(results[1][2], requests.exceptions.ConnectionError)
+    assert results[2][2] is None
+
+
+def test_fan_out_does_not_wait_for_slow_nodes():
+    peer_client = PeerClient()
+
+    def fn(node_url):
+        if node_url == 'http://slow':
+            time.sleep(2)
+
+        return node_url
+
+    start = time.time()
+    results = peer_client.fan_out(['http://slow', 'http://fast'], fn, round_timeout=0.2)
+
+    assert time.time() - start < 1
+    assert isinstance(results[0][2], requests.exceptions.Timeout)
+    assert results[1][1] == 'http://fast'
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from benchmarks.simulator import VirtualClock, main
+
+
+def test_virtual_clock_wakes_up_threads_in_order():
+    clock = VirtualClock()
+    events = []
+
+    def sleep_and_record(seconds: float):
+        clock.sleep(seconds)
+        events.append((seconds, clock.time()))
+
+    clock.run_in_parallel([lambda: sleep_and_record(30), lambda: sleep_and_record(10), lambda: sleep_and_record(20)])
+
+    assert events == [(10, 10), (20, 20), (30, 30)]
+
+
+def test_simulated_network_mines_the_submitted_transactions(tmp_path):
+    output = tmp_path / 'report.json'
+
+    main(['--nodes', '3', '--duration', '120', '--tps', '0.2', '--max-wait', '5', '--hash-rate', '5000',
+          '--output', str(output)])
+
+    report = json.loads(output.read_text())
+
+    assert report['transactions']['submitted'] > 0
+    assert report['transactions']['confirmed'] > 0
+    # The rounds running when the time is up finish after it, so the throughput is measured over the time simulated.
+    assert report['simulated_seconds'] >= 120
+    assert report['transactions']['confirmed_per_second'] == pytest.approx(
+        report['transactions']['confirmed'] / report['simulated_seconds'])
+    assert report['blocks']['mined'] > 0
+    assert report['convergence']['converged']
+    assert report['network']['requests'] > 0
@@ -0,0 +1,113 @@
+import pytest
+
+from src.storage import BlockStore, INDEX_RECORD_FORMAT
+
+
+def make_hash(height: int) -> str:
+    return f'{height:064x}'
+
+
+def make_record(height: int) -> bytes:
+    return f'block {height}'.encode() * 3
+
+
+def test_blocks_can_be_read_by_height_after_reopening_the_store(tmp_path):
+    block_store = BlockStore(tmp_path, segment_size=64)
+    for height in range(10):
+        block_store.append(make_hash(height), make_record(height))
+    block_store.close()
+
+    block_store = BlockStore(tmp_path, segment_size=64)
+
+    assert len(block_store) == 10
+    assert block_store.read(7) == make_record(7)
+    assert block_store.get_hash(7) == make_hash(7)
+    assert list(block_store.read_range(8)) == [make_record(8), make_record(9)]
+    assert len(list(tmp_path.glob('segment-*.dat'))) > 1
+
+
+def test_truncated_blocks_are_replaced_by_the_new_ones(tmp_path):
+    block_store = BlockStore(tmp_path, segment_size=64)
+    for height in range(10):
+        block_store.append(make_hash(height), make_record(height))
+
+    block_store.truncate(3)
+    block_store.append(make_hash(100), make_record(100))
+
+    assert len(block_store) == 4
+    assert list(block_store.read_range()) == [make_record(0), make_record(1), make_record(2), make_record(100)]
+
+    block_store.close()
+
+    assert len(BlockStore(tmp_path, segment_size=64)) == 4
+
+
+def test_half_written_blocks_are_discarded_when_opening_the_store(tmp_path):
+    block_store = BlockStore(tmp_path)
+    for height in range(3):
+        block_store.append(make_hash(height), make_record(height))
+    block_store.close()
+
+    with open(tmp_path / 'index.dat', 'ab') as f:
+        f.write(INDEX_RECORD_FORMAT.pack(0, 1000, 10, bytes(32), bytes(16)))
+        f.write(b'\x00' * 5)
+
+    block_store = BlockStore(tmp_path)
+
+    assert len(block_store) == 3
+    assert block_store.read(2) == make_record(2)
+
+
+def test_cumulative_work_is_kept_per_height(tmp_path):
+    block_store = BlockStore(tmp_path)
+    for height in range(3):
+        block_store.append(make_hash(height), make_record(height), 16 ** height)
+
+    assert block_store.get_cumulative_work(2) == 1 + 16 + 256
+
+    block_store.truncate(1)
+    block_store.append(make_hash(1), make_record(1), 16 ** 4)
+
+    assert block_store.get_cumulative_work(1) == 1 + 16 ** 4
+
+
+def test_blocks_whose_cumulative_work_does_not_fit_in_the_index_are_not_written(tmp_path):
+    block_store = BlockStore(tmp_path)
+    block_store.append(make_hash(0), make_record(0), 2 ** 127)
+
+    with pytest.raises(ValueError):
+        block_store.append(make_hash(1), make_record(1), 2 ** 127)
+
+    block_store.append(make_hash(1), make_record(1), 1)
+
+    assert len(block_store) == 2
+    assert block_store.read(1) == make_record(1)
+    assert block_store.get_cumulative_work(1) == 2 ** 127 + 1
+
+
+def test_replaced_blocks_are_written_back_if_the_new_ones_cannot_be_written(tmp_path, monkeypatch):
+    block_store = BlockStore(tmp_path, segment_size=64)
+    for height in range(5):
+        block_store.append(make_hash(height), make_record(height), 16)
+
+    append = BlockStore.append
+
+    def append_failing_on_the_second_new_block(self, block_hash, record, work=0):
+        if record == b'new block 3':
+            raise OSError('No space left on device')
+
+        append(self, block_hash, record, work)
+
+    monkeypatch.setattr(BlockStore, 'append', append_failing_on_the_second_new_block)
+
+    with pytest.raises(OSError):
+        block_store.replace(2, [(make_hash(100 + height), f'new block {height}'.encode(), 256) for height in range(2, 5)])
+
+    monkeypatch.setattr(BlockStore, 'append', append)
+    block_store.close()
+    block_store = BlockStore(tmp_path, segment_size=64)
+
+    assert len(block_store) == 5
+    assert list(block_store.read_range()) == [make_record(height) for height in range(5)]
+    assert [block_store.get_hash(height) for height in range(5)] == [make_hash(height) for height in range(5)]
+    assert block_store.get_cumulative_work(4) == 5 * 16
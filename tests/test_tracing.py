@@ -0,0 +1,54 @@
+import json
+import pstats
+
+import pytest
+
+from src import node_miner
+from src.tracing import Tracer
+
+
+def test_every_round_is_written_as_a_chrome_trace(tmp_path):
+    tracer = Tracer(tmp_path / 'traces', profile_sample_rate=1.0)
+
+    with tracer.round('mine'):
+        with tracer.span('consensus') as span:
+            span['height'] = 3
+            tracer.count_bytes(10, 100)
+
+        with pytest.raises(ValueError), tracer.span('propagation'):
+            raise ValueError()
+
+    [trace_path] = (tmp_path / 'traces').glob('mine-*.json')
+    events = json.loads(trace_path.read_text())['traceEvents']
+
+    assert [event['name'] for event in events] == ['consensus', 'propagation', 'mine']
+    assert all(event['ph'] == 'X' and event['dur'] >= 0 and event['tdur'] >= 0 for event in events)
+    assert events[0]['args']['height'] == 3
+    assert events[0]['args']['bytes_sent'] == 10 and events[0]['args']['bytes_received'] == 100
+    assert events[1]['args']['error'] == 'ValueError()'
+    assert events[2]['args']['bytes_received'] == 100
+
+    pstats.Stats(str(trace_path.with_suffix('.prof')))
+
+
+def test_mining_rounds_are_traced_stage_by_stage(node_state, tmp_path, monkeypatch):
+    monkeypatch.setattr(node_miner, 'tracer', Tracer(tmp_path / 'traces'))
+
+    # There are no pending transactions, so the round ends after exchanging the states.
+    node_miner.mine_and_report_errors(node_state)
+
+    [trace_path] = (tmp_path / 'traces').glob('mine-*.json')
+    events = json.loads(trace_path.read_text())['traceEvents']
+
+    assert [event['name'] for event in events] == ['fetch_states', 'mining_flag', 'mine']
+    assert events[1]['args']['pending_transactions'] == 0
+
+
+def test_nothing_is_written_if_tracing_is_disabled(tmp_path):
+    tracer = Tracer()
+
+    with tracer.round('mine'), tracer.span('consensus') as span:
+        span['height'] = 3
+
+    assert not tracer.enabled
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,46 @@
+import json
+
+from src.block import Block
+from src.codec import serialize_block
+from src.ledger import Ledger
+from src.transactions import TransactionTable, compact_block_data
+
+from .fixtures import BLOCK_GENESIS
+
+
+TRANSACTIONS = [
+    {'from': 'network', 'to': 'eve', 'amount': 10, 'timestamp': 1.5},
+    {'from': 'eve', 'to': 'bob', 'amount': 2.5, 'timestamp': 2},
+    {'from': 'bob', 'to': 'eve', 'amount': 0.5}
+]
+
+
+def test_transaction_table_gives_back_the_same_transactions():
+    table = TransactionTable.from_transactions(TRANSACTIONS)
+
+    assert len(table) == 3
+    assert table[1] == TRANSACTIONS[1]
+    assert table[-1] == TRANSACTIONS[-1]
+    assert table == TRANSACTIONS
+    assert json.dumps(list(table)) == json.dumps(TRANSACTIONS)
+
+
+def test_blocks_with_a_transaction_table_work_like_the_ones_with_a_list():
+    data = {'nonce': 1, 'transactions': TRANSACTIONS}
+    block = Block(1, 1.0, data, BLOCK_GENESIS.get_hash())
+    compact_block = Block(1, 1.0, compact_block_data(json.loads(json.dumps(data))), BLOCK_GENESIS.get_hash())
+
+    assert isinstance(compact_block.data['transactions'], TransactionTable)
+    assert compact_block.get_hash() == block.get_hash()
+    assert json.dumps(serialize_block(compact_block)) == json.dumps(serialize_block(block))
+
+    ledger = Ledger()
+    ledger.sync([BLOCK_GENESIS, compact_block])
+
+    assert ledger.get_balance('eve') == 10 - 2.5 + 0.5
+
+
+def test_transactions_with_unknown_fields_are_kept_in_a_list():
+    data = compact_block_data({'nonce': 1, 'transactions': [dict(TRANSACTIONS[0], note='hi')]})
+
+    assert isinstance(data['transactions'], list)
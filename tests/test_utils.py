@@ -0,0 +1,169 @@
+import pytest
+import requests
+
+from benchmarks.local_network import LocalPeerClient, use_peer_client
+from src.block import Block
+from src.constants import SYNC_HEADERS_WINDOW
+from src.node_server import create_app
+from src.node_state import NodeState
+from src.utils import (
+    block_stores, consensus, create_genesis_block, get_blockchain_from_node, save_blockchain_into_file)
+
+from .fixtures import BLOCK_GENESIS, mine_block
+
+
+class RecordingPeerClient(LocalPeerClient):
+    """
+    Local network (see `benchmarks.local_network`) that remembers the requests sent to other nodes. The nodes in
+    `broken_nodes` vote (they send their tip), but they answer anything else with garbage.
+    """
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__({}, **kwargs)
+        self.requests = []
+        self.broken_nodes = set()
+
+
+    def request(self, method: str, node_url: str, path: str, **kwargs) -> requests.Response:
+        self.requests.append((node_url, path, kwargs.get('params')))
+
+        if node_url in self.broken_nodes and path != 'tip':
+            response = requests.Response()
+            response.status_code, response._content = 200, b'not json'
+
+            return response
+
+        return super().request(method, node_url, path, **kwargs)
+
+
+    def add_node(self, node_url: str, blockchain: list = None) -> NodeState:
+        miner_account_address = node_url.split('//')[1]
+
+        if blockchain:
+            # As if the node had already synced it.
+            save_blockchain_into_file(blockchain, miner_account_address)
+
+        node_state = NodeState(miner_account_address, node_url, [])
+        self.apps[node_url] = create_app(node_state)
+
+        return node_state
+
+
+@pytest.fixture
+def network(tmp_path, monkeypatch):
+    # Nodes save their files in the current directory.
+    monkeypatch.chdir(tmp_path)
+    block_stores.clear()
+
+    with use_peer_client(RecordingPeerClient()) as peer_client:
+        yield peer_client
+
+
+def extend(blockchain: list, number_of_blocks: int) -> list:
+    for _ in range(number_of_blocks):
+        blockchain = blockchain + [mine_block(blockchain[-1], [])]
+
+    return blockchain
+
+
+def get_hashes(blockchain: list) -> list:
+    return [block.get_hash() for block in blockchain]
+
+
+def get_paths(peer_client: RecordingPeerClient) -> list:
+    return [(path, params) for _, path, params in peer_client.requests]
+
+
+COMMON_BLOCKCHAIN = [
+    BLOCK_GENESIS,
+    mine_block(BLOCK_GENESIS, [{'from': 'network', 'to': 'eve', 'amount': 10.0, 'timestamp': 1.0}])
+]
+
+
+def test_blocks_after_a_fork_deeper_than_one_window_are_downloaded(network):
+    # None of the last SYNC_HEADERS_WINDOW blocks we have is in the blockchain of the node.
+    local_blockchain = extend(COMMON_BLOCKCHAIN, SYNC_HEADERS_WINDOW + 1)
+    blockchain = COMMON_BLOCKCHAIN + [
+        mine_block(COMMON_BLOCKCHAIN[-1], [{'from': 'network', 'to': 'bob', 'amount': 1.0, 'timestamp': 1.0}])]
+    network.add_node('http://node1', blockchain)
+
+    assert get_hashes(get_blockchain_from_node('http://node1', local_blockchain)) == get_hashes(blockchain)
+
+    from_height = len(local_blockchain) - SYNC_HEADERS_WINDOW
+    assert get_paths(network) == [
+        ('headers', {'from': from_height, 'to': None}),
+        ('headers', {'from': 0, 'to': from_height}),
+        # Only the blocks after the last one in common.
+        ('blocks', {'from': len(COMMON_BLOCKCHAIN)})
+    ]
+
+
+def test_nothing_is_downloaded_if_the_blockchains_are_the_same(network):
+    network.add_node('http://node1', COMMON_BLOCKCHAIN)
+
+    local_blockchain = list(COMMON_BLOCKCHAIN)
+
+    assert get_blockchain_from_node('http://node1', local_blockchain) is local_blockchain
+    assert [path for path, _ in get_paths(network)] == ['headers']
+
+
+def test_whole_blockchain_is_downloaded_if_the_genesis_block_is_different(network):
+    # The node is on a different network (which started at another time).
+    genesis_block = create_genesis_block()
+    genesis_block.timestamp += 1
+    network.add_node('http://node1', [genesis_block])
+
+    blockchain = get_blockchain_from_node('http://node1', COMMON_BLOCKCHAIN)
+
+    assert get_hashes(blockchain) == [genesis_block.get_hash()]
+    assert isinstance(blockchain[0], Block)
+    assert get_paths(network)[-1] == ('blocks', {'from': 0})
+
+
+def test_consensus_chooses_the_blockchain_of_the_majority(network):
+    blockchain = extend(COMMON_BLOCKCHAIN, 1)
+    # It has more work, but fewer nodes have it.
+    longer_blockchain = extend(COMMON_BLOCKCHAIN, 2)
+
+    network.add_node('http://node1', blockchain)
+    network.add_node('http://node2', longer_blockchain)
+    network.add_node('http://node3', blockchain)
+
+    chosen_blockchain = consensus(['http://node1', 'http://node2', 'http://node3'], COMMON_BLOCKCHAIN)
+
+    assert get_hashes(chosen_blockchain) == get_hashes(blockchain)
+    # Only the missing block was downloaded, from the first node that has it.
+    assert [(node_url, params) for node_url, path, params in network.requests if path == 'blocks'] == [
+        ('http://node1', {'from': len(COMMON_BLOCKCHAIN)})]
+
+
+def test_consensus_chooses_the_blockchain_with_more_work_if_there_is_a_tie(network):
+    blockchain = extend(COMMON_BLOCKCHAIN, 1)
+    longer_blockchain = extend(COMMON_BLOCKCHAIN, 2)
+
+    network.add_node('http://node1', blockchain)
+    network.add_node('http://node2', longer_blockchain)
+
+    chosen_blockchain = consensus(['http://node1', 'http://node2'], COMMON_BLOCKCHAIN)
+
+    assert get_hashes(chosen_blockchain) == get_hashes(longer_blockchain)
+
+
+def test_consensus_skips_nodes_that_cannot_be_reached_or_send_invalid_blocks(network):
+    blockchain = extend(COMMON_BLOCKCHAIN, 1)
+
+    network.add_node('http://broken', blockchain)
+    network.add_node('http://node2', blockchain)
+    network.broken_nodes.add('http://broken')
+
+    # "http://unreachable" isn't part of the network.
+    chosen_blockchain = consensus(['http://unreachable', 'http://broken', 'http://node2'], COMMON_BLOCKCHAIN)
+
+    assert get_hashes(chosen_blockchain) == get_hashes(blockchain)
+    assert ('http://broken', 'headers') in [(node_url, path) for node_url, path, _ in network.requests]
+
+    with pytest.raises(Exception, match='Consensus wasn\'t reached'):
+        consensus(['http://unreachable', 'http://broken'], COMMON_BLOCKCHAIN)
+
+    with pytest.raises(Exception, match='cannot find other nodes'):
+        consensus(['http://unreachable'], COMMON_BLOCKCHAIN)
@@ -0,0 +1,126 @@
+import pytest
+
+from src.block import Block
+from src.constants import MIN_PROOF_OF_WORK_DIFFICULTY_LEVEL, MAX_PROOF_OF_WORK_DIFFICULTY_LEVEL
+from src.ledger import Ledger
+from src.validation import InvalidBlockchain, validate_blockchain_update
+
+from .fixtures import BLOCK_GENESIS, mine_block
+
+
+def make_blockchain(*transactions_per_block) -> list:
+    blockchain = [BLOCK_GENESIS]
+
+    for transactions in transactions_per_block:
+        blockchain.append(mine_block(blockchain[-1], transactions))
+
+    return blockchain
+
+
+def make_ledger(blockchain: list) -> Ledger:
+    ledger = Ledger()
+    ledger.sync(blockchain)
+
+    return ledger
+
+
+def test_only_the_blocks_after_the_common_prefix_are_validated():
+    local_blockchain = make_blockchain([{'from': 'network', 'to': 'eve', 'amount': 10}])
+
+    # A block we already have is never checked again (even if it wouldn't be valid anymore).
+    already_known_block = local_blockchain[1]
+    already_known_block.data['difficulty_level'] = 64
+
+    blockchain = local_blockchain + [mine_block(local_blockchain[-1], [{'from': 'eve', 'to': 'bob', 'amount': 10}])]
+
+    assert validate_blockchain_update(local_blockchain, make_ledger(local_blockchain), blockchain) == 2
+
+
+def test_funds_are_checked_from_the_balances_at_the_fork_point():
+    local_blockchain = make_blockchain(
+        [{'from': 'network', 'to': 'eve', 'amount': 10}],
+        [{'from': 'network', 'to': 'eve', 'amount': 10}]
+    )
+    ledger = make_ledger(local_blockchain)
+
+    # Eve only had 10 coins when the fork started. The fork is longer, so it has more work than the local blockchain.
+    fork = local_blockchain[:2] + [mine_block(local_blockchain[1], [{'from': 'eve', 'to': 'bob', 'amount': 15}])]
+    fork.append(mine_block(fork[-1], []))
+
+    with pytest.raises(InvalidBlockchain, match='spends more than it has'):
+        validate_blockchain_update(local_blockchain, ledger, fork)
+
+    fork[2] = mine_block(fork[1], [{'from': 'eve', 'to': 'bob', 'amount': 5}, {'from': 'eve', 'to': 'bob', 'amount': 5}])
+    fork[3] = mine_block(fork[2], [])
+
+    assert validate_blockchain_update(local_blockchain, ledger, fork) == 2
+
+
+def test_blocks_must_be_linked_and_mined_with_enough_work():
+    local_blockchain = make_blockchain()
+    ledger = make_ledger(local_blockchain)
+
+    unlinked_block = mine_block(Block(0, 1.0, {'nonce': 1, 'transactions': []}), [])
+
+    with pytest.raises(InvalidBlockchain, match='doesn\'t point to the previous block'):
+        validate_blockchain_update(local_blockchain, ledger, local_blockchain + [unlinked_block])
+
+    unmined_block = Block(1, 1.0, {'nonce': 1, 'difficulty_level': 8, 'transactions': []}, BLOCK_GENESIS.get_hash())
+
+    with pytest.raises(InvalidBlockchain, match='doesn\'t match its difficulty level'):
+        validate_blockchain_update(local_blockchain, ledger, local_blockchain + [unmined_block])
+
+    wrong_index_block = mine_block(BLOCK_GENESIS, [])
+    wrong_index_block.index = 2
+
+    with pytest.raises(InvalidBlockchain, match='should have index 1'):
+        validate_blockchain_update(local_blockchain, ledger, local_blockchain + [wrong_index_block])
+
+
+def test_blocks_mined_below_the_minimum_difficulty_level_of_the_network_are_rejected():
+    local_blockchain = make_blockchain()
+
+    # Its hash matches the difficulty level it declares, but that level is too low.
+    low_difficulty_block = mine_block(BLOCK_GENESIS, [], difficulty_level=MIN_PROOF_OF_WORK_DIFFICULTY_LEVEL - 1)
+
+    with pytest.raises(InvalidBlockchain, match='too low difficulty level'):
+        validate_blockchain_update(
+            local_blockchain, make_ledger(local_blockchain), local_blockchain + [low_difficulty_block])
+
+
+def test_blocks_that_declare_a_too_high_difficulty_level_are_rejected():
+    local_blockchain = make_blockchain()
+
+    # Its work wouldn't fit in the cumulative work of the blockchain.
+    block = Block(1, 1.0, {'nonce': 1, 'difficulty_level': MAX_PROOF_OF_WORK_DIFFICULTY_LEVEL + 1, 'transactions': []},
+                  BLOCK_GENESIS.get_hash())
+
+    with pytest.raises(InvalidBlockchain, match='too high difficulty level'):
+        validate_blockchain_update(local_blockchain, make_ledger(local_blockchain), local_blockchain + [block])
+
+
+def test_blockchains_without_more_work_than_the_local_one_are_rejected():
+    local_blockchain = make_blockchain([], [])
+    ledger = make_ledger(local_blockchain)
+
+    with pytest.raises(InvalidBlockchain, match='doesn\'t have more work than ours'):
+        validate_blockchain_update(local_blockchain, ledger, local_blockchain[:1])
+
+    # Same number of blocks (and so, the same work), but from a fork.
+    fork = local_blockchain[:2] + [mine_block(local_blockchain[1], [{'from': 'network', 'to': 'eve', 'amount': 1}])]
+
+    with pytest.raises(InvalidBlockchain, match='doesn\'t have more work than ours'):
+        validate_blockchain_update(local_blockchain, ledger, fork)
+
+
+def test_blockchains_that_start_by_a_different_genesis_block_are_rejected():
+    local_blockchain = make_blockchain([])
+
+    # The funds of the network go to someone else.
+    genesis_block = Block(0, BLOCK_GENESIS.timestamp, {'nonce': 1, 'transactions': [
+        {'from': 'genesis', 'to': 'eve', 'amount': 1000000000, 'timestamp': BLOCK_GENESIS.timestamp}]})
+    blockchain = [genesis_block, mine_block(genesis_block, [])]
+    blockchain.append(mine_block(blockchain[-1], []))
+
+    with pytest.raises(InvalidBlockchain, match='different genesis block'):
+        validate_blockchain_update(local_blockchain, make_ledger(local_blockchain), blockchain)